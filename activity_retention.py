@@ -0,0 +1,205 @@
+"""Activity log partitioning, retention and archival.
+
+The `activity` table holds only the hot window: the current month plus the
+previous ACTIVITY_HOT_MONTHS months. rotate_activity() moves older rows into
+one table per month (activity_YYYYMM). Once a month falls outside
+ACTIVITY_RETENTION_MONTHS, compact_partitions() exports its raw events to a
+gzipped JSONL file and keeps only daily per-user counts in
+activity_daily_summary before dropping the month's table. Late rows that
+recreate an archived month's table go to a further numbered archive file
+(activity_YYYYMM.1.jsonl.gz, ...) and are added to the existing counts.
+
+Plain tables work the same way on SQLite, MySQL and PostgreSQL. Native
+partitions would need the timestamp in the primary key of existing tables.
+"""
+import gzip
+import json
+import os
+import re
+from collections import Counter
+from datetime import date, datetime
+
+from sqlalchemy import Column, Index, MetaData, Table, delete, func, inspect, insert, select
+
+from extensions import db
+from models import Activity, ActivityDailySummary
+from maintenance import claim_daily_run
+
+ACTIVITY_RETENTION_JOB = 'activity_retention'
+PARTITION_PREFIX = 'activity_'
+_PARTITION_NAME = re.compile(r'^activity_(\d{4})(\d{2})$')
+
+# Rows streamed per fetch while archiving
+ARCHIVE_FETCH_SIZE = 1000
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def hot_cutoff(hot_months, today=None):
+    """Oldest timestamp kept in the hot activity table"""
+    start = add_months(month_start(today or date.today()), -hot_months)
+    return datetime(start.year, start.month, 1)
+
+
+def partition_name(month):
+    return f"{PARTITION_PREFIX}{month:%Y%m}"
+
+
+def partition_table(month):
+    """Table object for one month's partition (same columns as activity)"""
+    name = partition_name(month)
+    columns = [Column(c.name, c.type, primary_key=c.primary_key, autoincrement=False)
+               for c in Activity.__table__.columns]
+    return Table(name, MetaData(), *columns, Index(f"ix_{name}_user_timestamp", 'user_id', 'timestamp'))
+
+
+def list_partitions():
+    """Months that have a partition table, oldest first"""
+    months = []
+    for name in inspect(db.engine).get_table_names():
+        match = _PARTITION_NAME.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def recent_activities(user_id, hot_months, limit=5):
+    """Latest events for a user, read from the hot table's window only"""
+    return Activity.query.filter(Activity.user_id == user_id, Activity.timestamp >= hot_cutoff(hot_months)) \
+        .order_by(Activity.timestamp.desc()).limit(limit).all()
+
+
+def rotate_activity(hot_months, today=None):
+    """Move rows older than the hot window into their monthly tables; returns {month: rows moved}"""
+    cutoff = hot_cutoff(hot_months, today)
+    activity = Activity.__table__
+    oldest = db.session.execute(select(func.min(activity.c.timestamp))).scalar()
+    db.session.rollback()
+    if oldest is None or oldest >= cutoff:
+        return {}
+
+    moved = {}
+    month = month_start(oldest)
+    while month < cutoff.date():
+        start = datetime(month.year, month.month, 1)
+        nxt = add_months(month, 1)
+        end = min(datetime(nxt.year, nxt.month, 1), cutoff)
+        in_month = (activity.c.timestamp >= start, activity.c.timestamp < end)
+        part = partition_table(month)
+        with db.engine.begin() as conn:
+            count = conn.execute(select(func.count()).select_from(activity).where(*in_month)).scalar()
+            if count:
+                part.create(conn, checkfirst=True)
+                columns = [c.name for c in activity.columns]
+                conn.execute(insert(part).from_select(columns, select(*activity.columns).where(*in_month)))
+                conn.execute(delete(activity).where(*in_month))
+                moved[month] = count
+        month = nxt
+    return moved
+
+
+def archive_path(archive_dir, month):
+    """First unused archive file for the month: activity_YYYYMM.jsonl.gz, then .1, .2, ..."""
+    name = partition_name(month)
+    path = os.path.join(archive_dir, f"{name}.jsonl.gz")
+    version = 0
+    while os.path.exists(path):
+        version += 1
+        path = os.path.join(archive_dir, f"{name}.{version}.jsonl.gz")
+    return path
+
+
+def _write_archive(part, path):
+    """Stream a partition to gzipped JSONL at path; returns (rows, daily counts)"""
+    counts = Counter()
+    rows = 0
+    tmp_path = path + '.tmp'
+    with db.engine.connect() as conn, gzip.open(tmp_path, 'wt', encoding='utf-8') as archive:
+        result = conn.execution_options(stream_results=True, yield_per=ARCHIVE_FETCH_SIZE) \
+            .execute(select(part).order_by(part.c.id))
+        for row in result.mappings():
+            timestamp = row['timestamp']
+            archive.write(json.dumps({
+                'id': row['id'],
+                'user_id': row['user_id'],
+                'user_role': row['user_role'],
+                'action_type': row['action_type'],
+                'description': row['description'],
+                'timestamp': timestamp.isoformat() if timestamp else None,
+            }, ensure_ascii=False) + '\n')
+            if timestamp is not None:
+                counts[(row['user_id'], row['user_role'], timestamp.date(), row['action_type'])] += 1
+            rows += 1
+    if rows:
+        os.replace(tmp_path, path)
+    else:
+        os.remove(tmp_path)
+    return rows, counts
+
+
+def compact_partitions(retention_months, archive_dir, today=None):
+    """Archive and summarize monthly partitions older than the retention window.
+
+    Returns {month: rows archived}. Each run writes a new archive file, so a
+    month's table recreated by late rows never overwrites an earlier archive,
+    and its counts are added to the month's summaries. The summaries are
+    updated in the same transaction that deletes the archived rows, so a
+    rerun after a failure counts every row once; a failure between writing
+    the file and that commit can leave the same events (same ids) in two
+    archive files. The table is dropped last.
+    """
+    oldest_kept = add_months(month_start(today or date.today()), -retention_months)
+    os.makedirs(archive_dir, exist_ok=True)
+    summary = ActivityDailySummary.__table__
+    compacted = {}
+    for month in list_partitions():
+        if month >= oldest_kept:
+            break
+        part = partition_table(month)
+        path = archive_path(archive_dir, month)
+        rows, counts = _write_archive(part, path)
+        if rows:
+            in_month = (summary.c.day >= month, summary.c.day < add_months(month, 1))
+            with db.engine.connect() as conn:
+                transaction = conn.begin()
+                if conn.execute(delete(part)).rowcount != rows:
+                    # Rows arrived while archiving: leave the month for the next run
+                    transaction.rollback()
+                    os.remove(path)
+                    continue
+                for user_id, user_role, day, action_type, count in conn.execute(
+                        select(summary.c.user_id, summary.c.user_role, summary.c.day, summary.c.action_type,
+                               summary.c.count).where(*in_month)):
+                    counts[(user_id, user_role, day, action_type)] += count
+                conn.execute(delete(summary).where(*in_month))
+                conn.execute(insert(summary), [
+                    {'user_id': user_id, 'user_role': user_role, 'day': day, 'action_type': action_type, 'count': count}
+                    for (user_id, user_role, day, action_type), count in counts.items()
+                ])
+                transaction.commit()
+        part.drop(db.engine)
+        compacted[month] = rows
+    return compacted
+
+
+def run_activity_retention(hot_months, retention_months, archive_dir, force=False):
+    """Rotate and compact once per day across workers; returns (moved, compacted) or None if skipped"""
+    retention_months = max(retention_months, hot_months + 1)
+    try:
+        if not claim_daily_run(ACTIVITY_RETENTION_JOB) and not force:
+            db.session.rollback()
+            return None
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    moved = rotate_activity(hot_months)
+    compacted = compact_partitions(retention_months, archive_dir)
+    return moved, compacted
@@ -0,0 +1,183 @@
+"""Activity log writer.
+
+In 'transaction' mode (the default) events are collected on the app context
+(`g`) and added to the session just before it next commits, so they land in
+the same transaction as the change they describe. Events still buffered when
+the request (or AI job) ends are written together in one commit. A rollback
+of the session's transaction discards the events buffered so far, as it
+discards the changes they describe.
+
+In 'async' mode events go to a bounded in-process queue that a background
+thread inserts in batches every `flush_interval` seconds (or once `batch_size`
+events are waiting). They are then independent of the request's transaction.
+`durability` decides what happens when the queue is full or a batch fails:
+'strict' writes the event inline or retries the rows one by one, 'relaxed'
+drops them and counts the loss. The queue is drained on shutdown.
+"""
+import atexit
+import queue
+import threading
+import time
+from datetime import datetime
+
+from flask import g, has_app_context
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import Activity
+
+_BUFFER_KEY = '_activity_events'
+
+
+class ActivitySink:
+    def __init__(self, app, mode='transaction', durability='strict', queue_size=1000,
+                 batch_size=100, flush_interval=1.0, drain_timeout=5.0):
+        if mode not in ('transaction', 'async'):
+            raise ValueError(f"Unknown activity sink mode: {mode}")
+        if durability not in ('strict', 'relaxed'):
+            raise ValueError(f"Unknown activity durability: {durability}")
+        self.app = app
+        self.mode = mode
+        self.durability = durability
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drain_timeout = drain_timeout
+        self._stats = {'recorded': 0, 'written': 0, 'batches': 0, 'dropped': 0, 'inline': 0, 'discarded': 0}
+        self._stats_lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._stopping = threading.Event()
+
+        event.listen(Session, 'before_commit', self._join_transaction)
+        event.listen(Session, 'after_soft_rollback', self._discard_buffered)
+        app.teardown_appcontext(self._flush_leftovers)
+        if mode == 'async':
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._thread = threading.Thread(target=self._run, name='activity-writer', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self._stats[key] += n
+
+    def record(self, user_id, user_role, action_type, description):
+        row = {
+            'user_id': user_id,
+            'user_role': user_role,
+            'action_type': action_type,
+            'description': description,
+            'timestamp': datetime.utcnow(),
+        }
+        self._count('recorded')
+        if self.mode == 'async':
+            try:
+                self._queue.put_nowait(row)
+                return
+            except queue.Full:
+                if self.durability == 'relaxed':
+                    self._count('dropped')
+                    return
+                self._count('inline')
+        if has_app_context():
+            g.setdefault(_BUFFER_KEY, []).append(row)
+        else:
+            with self.app.app_context():
+                self._write([row])
+
+    # Transaction mode
+
+    def _join_transaction(self, session):
+        if not has_app_context() or session is not db.session():
+            return
+        rows = g.pop(_BUFFER_KEY, None)
+        if rows:
+            session.add_all(Activity(**row) for row in rows)
+            self._count('written', len(rows))
+
+    def _discard_buffered(self, session, previous_transaction):
+        # Savepoint rollbacks (e.g. a failed stock update) keep the outer transaction's events
+        if previous_transaction.nested or previous_transaction.parent is not None:
+            return
+        if not has_app_context() or session is not db.session():
+            return
+        rows = g.pop(_BUFFER_KEY, None)
+        if rows:
+            self._count('discarded', len(rows))
+
+    def _flush_leftovers(self, exc):
+        rows = g.pop(_BUFFER_KEY, None)
+        if not rows or exc is not None:
+            return
+        try:
+            db.session.add_all(Activity(**row) for row in rows)
+            db.session.commit()
+            self._count('written', len(rows))
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error writing activity log: {e}")
+
+    # Async mode
+
+    def _run(self):
+        while True:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            if batch:
+                with self.app.app_context():
+                    self._write_batch(batch)
+                for _ in batch:
+                    self._queue.task_done()
+            elif self._stopping.is_set():
+                return
+
+    def _write(self, rows):
+        db.session.execute(insert(Activity), rows)
+        db.session.commit()
+        self._count('written', len(rows))
+
+    def _write_batch(self, rows):
+        try:
+            self._write(rows)
+            self._count('batches')
+            return
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error writing activity batch ({len(rows)} events): {e}")
+        if self.durability == 'relaxed':
+            self._count('dropped', len(rows))
+            return
+        # Keep every row that can be written
+        for row in rows:
+            try:
+                self._write([row])
+            except Exception as e:
+                db.session.rollback()
+                self._count('dropped')
+                print(f"Error writing activity event: {e}")
+
+    def close(self):
+        """Write out queued events (up to drain_timeout seconds) and stop the writer"""
+        if self._thread is None or self._stopping.is_set():
+            return
+        self._stopping.set()
+        self._thread.join(self.drain_timeout + self.flush_interval)
+        if self._thread.is_alive():
+            print(f"Activity writer still busy after {self.drain_timeout}s; "
+                  f"{self._queue.qsize()} events not written")
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update({'mode': self.mode, 'durability': self.durability,
+                      'queued': self._queue.qsize() if self._queue is not None else 0})
+        return stats
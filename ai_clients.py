@@ -0,0 +1,90 @@
+"""Long-lived AI provider clients.
+
+API keys are read from the environment once instead of on every command.
+Groq calls share one requests.Session whose keep-alive pool skips the TCP/TLS
+handshake after the first request, and Gemini is configured once per key
+with its GenerativeModel objects reused. After rotating keys in .env, call
+reload_clients() (the admin dashboard has a button for it).
+"""
+import os
+import threading
+import google.generativeai as genai
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+# Enough pooled connections for every provider worker thread
+HTTP_POOL_SIZE = int(os.environ.get('AI_PROVIDER_WORKERS', 8))
+
+_lock = threading.Lock()
+_keys = None
+_http_session = None
+_gemini_key = None
+_gemini_models = {}
+
+
+def _read_keys():
+    groq_api_key = (os.environ.get("GROQ_API_KEY") or '').strip()
+    gemini_api_key = (os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY") or '').strip()
+    return groq_api_key, gemini_api_key
+
+
+def get_api_keys():
+    """(groq_api_key, gemini_api_key), empty strings when not configured"""
+    global _keys
+    if _keys is None:
+        with _lock:
+            if _keys is None:
+                _keys = _read_keys()
+    return _keys
+
+
+def _new_http_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def http_session():
+    """Shared keep-alive session for HTTP providers"""
+    global _http_session
+    if _http_session is None:
+        with _lock:
+            if _http_session is None:
+                _http_session = _new_http_session()
+    return _http_session
+
+
+def gemini_model(api_key, model_name):
+    """GenerativeModel for model_name, configuring the client only when the key changes"""
+    global _gemini_key
+    with _lock:
+        if _gemini_key != api_key:
+            genai.configure(api_key=api_key)
+            _gemini_key = api_key
+            _gemini_models.clear()
+        model = _gemini_models.get(model_name)
+        if model is None:
+            model = _gemini_models[model_name] = genai.GenerativeModel(model_name)
+        return model
+
+
+def reload_clients():
+    """Re-read .env and drop every client so the next call uses the current keys.
+
+    The HTTP session is replaced before the old one is closed, so a thread
+    that already holds the old session finishes its request on it.
+    """
+    global _keys, _http_session, _gemini_key
+    load_dotenv(override=True)
+    with _lock:
+        _keys = _read_keys()
+        old_session, _http_session = _http_session, _new_http_session()
+        _gemini_key = None
+        _gemini_models.clear()
+        keys = _keys
+    if old_session is not None:
+        old_session.close()
+    return keys
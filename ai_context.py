@@ -0,0 +1,158 @@
+"""Per-seller context handed to the AI command parser.
+
+SellerAIContext is a read-only mapping whose 'products', 'customers' and
+'stats' entries (and each figure inside 'stats') are loaded only when the
+parser reads them, so commands answered by the heuristic router cost no
+queries. Loaded sections are cached per seller and dropped as soon as the
+seller's seller_stats.version moves.
+"""
+from collections.abc import Mapping
+from sqlalchemy.orm import joinedload
+from extensions import db
+from models import Product, Customer, Invoice, InvoiceItem
+from search_service import search
+from entity_resolver import resolver
+from stats import get_dashboard_stats, get_stats_version
+
+
+def _load_totals(seller_id):
+    stats = get_dashboard_stats(seller_id)
+    return {
+        'revenue': float(stats['revenue_total']),
+        'invoices_count': stats['total_invoices'],
+        'customers_count': stats['total_customers'],
+        'products_count': stats['total_products'],
+    }
+
+
+def _load_low_stock(seller_id):
+    products = Product.query.filter(Product.s_id == seller_id, Product.p_stock < 10).all()
+    return [{'name': p.p_name, 'stock': p.p_stock} for p in products]
+
+
+def _load_top_selling(seller_id):
+    top_selling = db.session.query(
+        Product.p_name,
+        db.func.sum(InvoiceItem.item_quantity).label('qty')
+    ).join(
+        InvoiceItem, Product.p_id == InvoiceItem.p_id
+    ).join(
+        Invoice, InvoiceItem.invoice_no == Invoice.invoice_no
+    ).filter(
+        Invoice.s_id == seller_id
+    ).group_by(
+        Product.p_name
+    ).order_by(
+        db.text('qty DESC')
+    ).limit(3).all()
+    return [{'name': name, 'quantity': int(qty)} for name, qty in top_selling]
+
+
+def _load_recent_invoices(seller_id):
+    recent_invoices = Invoice.query.options(joinedload(Invoice.customer)) \
+        .filter_by(s_id=seller_id).order_by(Invoice.invoice_datetime.desc()).limit(3).all()
+    return [{
+        'invoice_no': inv.invoice_no,
+        'customer_name': inv.customer.c_name if inv.customer else 'Unknown',
+        'amount': float(inv.amount),
+        'status': inv.status
+    } for inv in recent_invoices]
+
+
+# stats key -> (section name, loader, default when the loader fails)
+STAT_SECTIONS = {
+    'revenue': ('totals', _load_totals, 0.0),
+    'invoices_count': ('totals', _load_totals, 0),
+    'customers_count': ('totals', _load_totals, 0),
+    'products_count': ('totals', _load_totals, 0),
+    'low_stock': ('low_stock', _load_low_stock, []),
+    'top_selling': ('top_selling', _load_top_selling, []),
+    'recent_invoices': ('recent_invoices', _load_recent_invoices, []),
+}
+
+
+class LazyStats(Mapping):
+    """Business stats whose figures are queried on first access"""
+
+    def __init__(self, context):
+        self._context = context
+
+    def __getitem__(self, key):
+        section, loader, default = STAT_SECTIONS[key]
+        try:
+            value = self._context.section(section, loader)
+        except Exception as e:
+            print(f"Error compiling business stats context: {e}")
+            return default
+        return value[key] if section == 'totals' else value
+
+    def __contains__(self, key):
+        return key in STAT_SECTIONS
+
+    def __iter__(self):
+        return iter(STAT_SECTIONS)
+
+    def __len__(self):
+        return len(STAT_SECTIONS)
+
+
+class SellerAIContext(Mapping):
+    """Lazy {'products', 'customers', 'stats'} context for one seller and utterance.
+
+    `cache` is an LRUCache shared across requests. Catalogs larger than
+    `max_entities` are narrowed to search matches for `user_text`; those
+    depend on the utterance and are not cached.
+    """
+
+    KEYS = ('products', 'customers', 'stats')
+
+    def __init__(self, seller_id, user_text, cache, max_entities):
+        self.seller_id = seller_id
+        self.user_text = user_text
+        self.max_entities = max_entities
+        self._cache = cache
+        self._sections = None
+
+    def section(self, name, loader):
+        """Cached result of loader(seller_id), reloaded when the seller's version changed"""
+        if self._sections is None:
+            version = get_stats_version(self.seller_id)
+            entry = self._cache.get(self.seller_id)
+            if entry is None or entry[0] != version:
+                entry = (version, {})
+                self._cache.set(self.seller_id, entry)
+            self._sections = entry[1]
+        if name not in self._sections:
+            self._sections[name] = loader(self.seller_id)
+        return self._sections[name]
+
+    def _entities(self, entity, model, count_key):
+        stats = self['stats']
+        if stats[count_key] <= self.max_entities:
+            return self.section(entity, lambda seller_id: [
+                row.to_dict() for row in model.query.filter_by(s_id=seller_id).all()
+            ])
+        matches = search(self.seller_id, entity, self.user_text, limit=self.max_entities, match_any=True)
+        return [row.to_dict() for row in matches]
+
+    def resolve(self, kind, name):
+        """Match for a spoken 'product' or 'customer' name (see entity_resolver), or None"""
+        return resolver.resolve(self.seller_id, kind, name)
+
+    def __getitem__(self, key):
+        if key == 'products':
+            return self._entities('product', Product, 'products_count')
+        if key == 'customers':
+            return self._entities('customer', Customer, 'customers_count')
+        if key == 'stats':
+            return LazyStats(self)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.KEYS
+
+    def __iter__(self):
+        return iter(self.KEYS)
+
+    def __len__(self):
+        return len(self.KEYS)
@@ -0,0 +1,157 @@
+"""Background jobs for the AI assistant.
+
+A command submitted in async mode runs on a bounded worker pool inside an
+app context, and the client polls (or listens over SSE) for its result. Job
+state lives in the ai_job table, so with several gunicorn workers a poll can
+land on any of them; the job itself runs in the worker that accepted it.
+The queue applies backpressure: submissions are rejected once this worker's
+queue is full or a seller already has the maximum number of commands in
+flight across all workers. Streamed commands, which run on the request
+thread, go through the same admission (start_inline / finish_inline).
+"""
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from extensions import db
+from models import AIJob
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+class JobRejected(Exception):
+    """The job was not queued; `status_code` is the HTTP status to answer with"""
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class JobQueue:
+    """Bounded pool running fn(*args) per job, at most `per_owner` active jobs per owner.
+
+    A job still queued or running after `stale_after` seconds (its worker died)
+    no longer counts against its owner; finished jobs are kept `result_ttl` seconds.
+    """
+
+    def __init__(self, app, workers=4, max_pending=32, per_owner=2, result_ttl=300, stale_after=300):
+        self.app = app
+        self.max_pending = max_pending
+        self.per_owner = per_owner
+        self.result_ttl = result_ttl
+        self.stale_after = stale_after
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ai-job')
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _prune(self, now):
+        AIJob.query.filter(db.or_(
+            AIJob.finished_at < now - timedelta(seconds=self.result_ttl),
+            AIJob.created_at < now - timedelta(seconds=self.stale_after + self.result_ttl),
+        )).delete(synchronize_session=False)
+
+    def _admit(self, owner):
+        """Record a queued job for owner, or raise JobRejected if owner is at the cap"""
+        now = datetime.utcnow()
+        try:
+            self._prune(now)
+            job = AIJob(id=uuid.uuid4().hex, owner=owner, status='queued', created_at=now)
+            db.session.add(job)
+            db.session.commit()
+            # Counted after our own row is visible, so two workers admitting at once cannot both slip under the cap
+            active = AIJob.query.filter(
+                AIJob.owner == owner, AIJob.status.in_(ACTIVE_STATUSES),
+                AIJob.created_at >= now - timedelta(seconds=self.stale_after),
+            ).count()
+            if active > self.per_owner:
+                db.session.delete(job)
+                db.session.commit()
+                raise JobRejected('Please wait for your previous command to finish.', 429)
+            return job
+        except JobRejected:
+            raise
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def _reserve(self):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobRejected('The assistant is busy. Please try again in a moment.', 503)
+            self._pending += 1
+
+    def _release(self):
+        with self._lock:
+            self._pending -= 1
+
+    def submit(self, owner, fn, *args):
+        self._reserve()
+        try:
+            job = self._admit(owner)
+        except Exception:
+            self._release()
+            raise
+        self._executor.submit(self._run, job.id, fn, args)
+        return job
+
+    def start_inline(self, owner):
+        """Admit a command the request thread runs itself (a streamed reply); returns its job id.
+
+        It counts against this worker's bound and the owner's cap like a queued
+        job until finish_inline() is called.
+        """
+        self._reserve()
+        try:
+            job = self._admit(owner)
+            job_id = job.id
+            job.status = 'running'
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self._release()
+            raise
+        return job_id
+
+    def finish_inline(self, job_id, error=None):
+        """Release an inline command's admission (safe outside a request)"""
+        try:
+            with self.app.app_context():
+                self._finish(job_id, status='failed' if error else 'done', error=error)
+        finally:
+            self._release()
+
+    def _finish(self, job_id, **values):
+        AIJob.query.filter_by(id=job_id).update(dict(values, finished_at=datetime.utcnow()))
+        db.session.commit()
+
+    def _run(self, job_id, fn, args):
+        try:
+            with self.app.app_context():
+                AIJob.query.filter_by(id=job_id).update({'status': 'running'})
+                db.session.commit()
+                try:
+                    result = fn(*args)
+                except Exception as e:
+                    print(f"AI job {job_id} failed: {e}")
+                    import traceback
+                    traceback.print_exc()
+                    db.session.rollback()
+                    self._finish(job_id, status='failed', error=str(e))
+                else:
+                    self._finish(job_id, status='done', result_json=self.app.json.dumps(result))
+        finally:
+            self._release()
+
+    def get(self, job_id, owner):
+        """The owner's job with this id, or None"""
+        job = db.session.get(AIJob, job_id)
+        return job if job is not None and job.owner == owner else None
+
+    def stats(self):
+        with self._lock:
+            pending = self._pending
+        return {'pending': pending, 'max_pending': self.max_pending,
+                'tracked': AIJob.query.count(),
+                'owners_active': db.session.query(db.func.count(db.distinct(AIJob.owner)))
+                .filter(AIJob.status.in_(ACTIVE_STATUSES)).scalar()}
@@ -1,13 +1,177 @@
 import os
+import re
 import json
-import google.generativeai as genai
+from functools import lru_cache
 from dotenv import load_dotenv
+from ai_clients import get_api_keys, http_session, gemini_model
+from parse_cache import parse_cache, make_key
+from provider_router import call_with_hedging, stream_with_failover, ProvidersFailed
+from json_stream import JSONEnvelopeParser
+from command_grammar import parse_structured_command, GRAMMAR_MIN_CONFIDENCE, GRAMMAR_FALLBACK_CONFIDENCE
+from prompt_budget import (
+    PROMPT_TOKEN_BUDGET, PROMPT_TOP_PRODUCTS, PROMPT_TOP_CUSTOMERS, PROMPT_HISTORY_TOKENS,
+    estimate_tokens, top_matches, trim_history
+)
 
 load_dotenv()
 
-# Generative AI client is configured dynamically in parse_command using environment variables.
+# Provider clients and API keys are set up once in ai_clients (see reload_clients).
 
+# Seconds a single provider request may take
+PROVIDER_TIMEOUT = float(os.environ.get('AI_PROVIDER_TIMEOUT', 10))
 
+
+# Heuristic router phrase tables (multi-lingual). Navigation targets are tried
+# in this order, so an utterance naming several pages goes to the first one.
+NAV_TARGETS = {
+    'dashboard': [
+        'go to dashboard', 'show dashboard', 'open dashboard', 'view dashboard', 'dashboard page',
+        'डैशबोर्ड पर जाओ', 'डैशबोर्ड दिखाओ',
+        'tableau de bord', 'aller au tableau de bord',
+        'tablero', 'ir al tablero',
+        'gehe zu dashboard',
+        'ダッシュボードへ移動'
+    ],
+    'products': [
+        'go to products', 'show products', 'open products', 'view products', 'products inventory', 'products page',
+        'उत्पाद पर जाओ', 'उत्पाद सूची', 'उत्पाद दिखाओ', 'उत्पाद दिखाएं', 'प्रोडक्ट्स पर जाएं',
+        'aller aux produits', 'inventaire des produits',
+        'ir a productos', 'inventario de productos',
+        'gehe zu produkten', 'produktinventar',
+        '商品一覧', '商品一覧へ移動'
+    ],
+    'invoices': [
+        'go to invoices', 'show invoices', 'open invoices', 'view invoices', 'invoices list', 'invoices page',
+        'इनवॉइस पर जाओ', 'इनवॉइस सूची', 'इनवॉइस दिखाओ', 'इनवॉइस दिखाएं',
+        'aller aux factures', 'liste des factures',
+        'ir a facturas', 'lista de facturas',
+        'gehe zu rechnungen', 'rechnungsliste',
+        '請求書一覧', '請求書一覧へ移動'
+    ],
+    'customers': [
+        'go to customers', 'show customers', 'open customers', 'view customers', 'customer list', 'customers page',
+        'ग्राहक पर जाओ', 'ग्राहक सूची', 'ग्राहक दिखाओ', 'ग्राहक दिखाएं', 'ग्राहक प्रबंधन',
+        'aller aux clients', 'gestion des clients',
+        'ir a clientes', 'gestión de clientes',
+        'gehe zu kunden', 'kundenverwaltung',
+        '顧客管理', '顧客管理へ移動'
+    ],
+    'analytics': [
+        'go to analytics', 'show analytics', 'open analytics', 'view analytics', 'analytics page',
+        'एनालिटिक्स पर जाओ', 'एनालिटिक्स दिखाओ', 'एनालिटिक्स दिखाएं', 'एनालिटिक्स केंद्र',
+        'afficher les analyses', 'centre d\'analyse',
+        'mostrar análisis', 'centro de análisis',
+        'analysen anzeigen', 'analysenzentrum',
+        '分析を見せて', '分析センター'
+    ],
+    'create_invoice': [
+        'create invoice', 'create an invoice', 'new invoice',
+        'इनवॉइस बनाएं', 'नया इनवॉइस', 'इनवॉइस बनाओ',
+        'créer une facture', 'créer facture', 'nouvelle facture',
+        'crear factura', 'nueva factura',
+        'rechnung erstellen', 'neue rechnung',
+        '請求書作成', '新しい請求書'
+    ],
+    'logout': [
+        'log out', 'logout', 'sign out',
+        'लॉगआउट', 'लॉग आउट', 'साइन आउट',
+        'déconnexion', 'se déconnecter',
+        'cerrar sesión', 'desconectarse',
+        'abmelden', 'ausloggen',
+        'ログアウト', 'サインアウト'
+    ]
+}
+
+INSIGHT_PHRASES = [
+    'business insights', 'show insights', 'view insights', 'sales metrics', 'business stats', 'view statistics', 'how is business', 'how is the business doing',
+    'व्यापार रिपोर्ट', 'व्यापार रिपोर्ट दिखाएं', 'बिजनेस कैसा है', 'बिजनेस कैसा चल रहा है',
+    'perspectives commerciales', 'comment vont les affaires', 'rapport d\'activité',
+    'información comercial', 'cómo va el negocio', 'estado del negocio',
+    'geschäftszahlen', 'wie läuft das geschäft', 'geschäftseinblicke',
+    'ビジネス分析', '業績はどう', 'ビジネスレポート'
+]
+
+GREETING_WORDS = [
+    'hi', 'hello', 'hey', 'namaste', 'hola', 'bonjour', 'hallo', 'konnichiwa', 
+    'good morning', 'good afternoon', 'good evening', 'hi there', 'hello there',
+    'नमस्ते', 'हेलो', 'हाय'
+]
+
+
+def _alternation(phrases):
+    """Regex alternation matching any of the phrases as a substring (longest first)"""
+    alternatives = sorted({phrase.lower() for phrase in phrases}, key=len, reverse=True)
+    return '|'.join(re.escape(phrase) for phrase in alternatives)
+
+
+def _nav_pattern(targets):
+    """One lookahead alternation over every navigation phrase, in table order.
+
+    Each phrase ends in an empty group named after its target (dashboard_0,
+    dashboard_1, ...), so match.lastgroup tells which target matched. The
+    lookahead consumes no text, so every position is tried and a long phrase
+    cannot hide another target's phrase inside it ("new invoices page" still
+    finds "invoices"); at one position the earliest target in the table wins.
+    A leading class of the phrases' first characters lets the regex engine
+    skip positions where no phrase can start.
+    """
+    phrases = [(phrase, target) for target, target_phrases in targets.items()
+               for phrase in sorted({phrase.lower() for phrase in target_phrases}, key=len, reverse=True)]
+    groups = {f'{target}_{index}': target for index, (_, target) in enumerate(phrases)}
+    alternatives = '|'.join(f'{re.escape(phrase)}(?P<{target}_{index}>)'
+                            for index, (phrase, target) in enumerate(phrases))
+    firsts = ''.join(sorted({re.escape(phrase[0]) for phrase, _ in phrases}))
+    return re.compile(f'(?=[{firsts}])(?=(?:{alternatives}))'), groups
+
+
+# Compiled once at import; a navigation lookup is a single scan of the text
+NAV_PATTERN, NAV_GROUPS = _nav_pattern(NAV_TARGETS)
+NAV_ORDER = {target: index for index, target in enumerate(NAV_TARGETS)}
+INSIGHT_PATTERN = re.compile(_alternation(INSIGHT_PHRASES))
+GREETINGS = frozenset(word.lower() for word in GREETING_WORDS)
+
+# Simple invoice commands ("add 3 milk and 2 bread for Rahul", "राहुल के लिए 3 दूध",
+# "田中さんに牛乳を3個")
+# are answered without a model when every name resolves to an existing record
+SIMPLE_INVOICE_PATTERNS = [
+    re.compile(r'^(?:please\s+)?(?:add|bill|sell|invoice)\s+(?P<items>\d.*?)\s+(?:for|to)\s+(?P<customer>[^\d].*?)[.!?]?$'),
+    re.compile(r'^(?P<customer>.+?)\s+(?:के\s+लिए|को)\s+(?P<items>\d.*?)'
+               r'(?:\s+(?:जोड़ो|जोड़ें|डालो|दो|दे\s+दो|बिल\s+करो|add\s+करो))?[।.!?]?$'),
+    re.compile(r'^(?:ajouter|ajoute|ajoutez|facturer|facture)\s+(?P<items>\d.*?)\s+pour\s+(?P<customer>[^\d].*?)[.!?]?$'),
+    re.compile(r'^(?:agregar|agrega|añadir|añade|facturar|factura)\s+(?P<items>\d.*?)\s+para\s+(?P<customer>[^\d].*?)[.!?]?$'),
+    re.compile(r'^(?:füge\s+|berechne\s+)?(?P<items>\d.*?)\s+für\s+(?P<customer>[^\d].*?)'
+               r'(?:\s+(?:hinzu|hinzufügen|berechnen))?[.!?]?$'),
+    re.compile(r'^(?P<customer>[^\d]+?)(?:さん|様)?に(?P<items>.+?\d+\s*(?:個|つ|本|枚|点)?)'
+               r'(?:を)?(?:追加|請求)?(?:して)?(?:ください)?[。.!?]?$'),
+]
+SIMPLE_INVOICE_ITEM_SPLIT = re.compile(r'\s*(?:,|、|&|\band\b|\bet\b|\by\b|\bund\b|\s और\s)\s*')
+SIMPLE_INVOICE_ITEM = re.compile(
+    r'^(?P<quantity>\d+)\s*(?:x\s+)?(?P<name>\D.*)$'
+    # Japanese puts the count after the product: 牛乳を3個
+    r'|^(?P<name_first>\D+?)\s*を?\s*(?P<quantity_last>\d+)\s*(?:個|つ|本|枚|点)?$'
+)
+SIMPLE_INVOICE_REPLIES = {
+    'hi-IN': '{customer} के लिए इनवॉइस तैयार कर रहा हूँ: {items}।',
+    'fr-FR': 'Je prépare une facture pour {customer} : {items}.',
+    'es-ES': 'Preparando una factura para {customer}: {items}.',
+    'de-DE': 'Ich erstelle eine Rechnung für {customer}: {items}.',
+    'ja-JP': '{customer}様の請求書を作成します：{items}。',
+}
+
+
+def match_nav_target(text_lower):
+    """First navigation target (in NAV_TARGETS order) whose phrases occur in the text, else None"""
+    best = None
+    for match in NAV_PATTERN.finditer(text_lower):
+        target = NAV_GROUPS[match.lastgroup]
+        if best is None or NAV_ORDER[target] < NAV_ORDER[best]:
+            best = target
+            if NAV_ORDER[best] == 0:
+                break
+    return best
+
+
+@lru_cache(maxsize=16)
 def get_system_prompt(lang_name):
     return f"""You are a smart billing assistant for Khata — a shop management app for Indian merchants. 
 Your goal is to extract structured data from natural language to help navigate the application, query sales insights, create invoices, add customers, or add products.
@@ -69,9 +233,10 @@ Rules:
 - ALWAYS return valid JSON.
 """
 
-def get_context_str(context):
-    product_names = [p['name'] for p in context.get('products', [])]
-    customer_names = [c['name'] for c in context.get('customers', [])]
+def get_context_str(context, products=None, customers=None):
+    """Render the context for the prompt; products / customers override the context's lists"""
+    product_names = [p['name'] for p in (context.get('products', []) if products is None else products)]
+    customer_names = [c['name'] for c in (context.get('customers', []) if customers is None else customers)]
     context_str = f"Existing Products: {', '.join(product_names)}\nExisting Customers: {', '.join(customer_names)}"
     
     if 'stats' in context:
@@ -90,6 +255,38 @@ def get_context_str(context):
         context_str += stats_str
     return context_str
 
+def build_prompt_context(user_text, context, history, language):
+    """Context string and history for the model, kept within AI_PROMPT_TOKEN_BUDGET.
+
+    Only the products and customers most similar to the utterance are listed
+    (fewer when the budget is tight) and history is cut to the newest turns
+    that fit. Logs the prompt size of every request.
+    """
+    fixed_tokens = estimate_tokens(get_system_prompt(LANG_NAMES.get(language, 'English'))) + estimate_tokens(user_text)
+    all_products = context.get('products', [])
+    all_customers = context.get('customers', [])
+    product_limit, customer_limit = PROMPT_TOP_PRODUCTS, PROMPT_TOP_CUSTOMERS
+    
+    while True:
+        products = top_matches(all_products, user_text, product_limit)
+        customers = top_matches(all_customers, user_text, customer_limit)
+        context_str = get_context_str(context, products=products, customers=customers)
+        context_tokens = estimate_tokens(context_str)
+        if fixed_tokens + context_tokens <= PROMPT_TOKEN_BUDGET or not (product_limit or customer_limit):
+            break
+        product_limit, customer_limit = product_limit // 2, customer_limit // 2
+    
+    history_budget = max(0, min(PROMPT_HISTORY_TOKENS, PROMPT_TOKEN_BUDGET - fixed_tokens - context_tokens))
+    trimmed_history, history_tokens = trim_history(history, history_budget)
+    
+    print(
+        f"AI prompt ({language}): ~{fixed_tokens + context_tokens + history_tokens} tokens "
+        f"(system+input {fixed_tokens}, context {context_tokens}, history {history_tokens}); "
+        f"products {len(products)}/{len(all_products)}, customers {len(customers)}/{len(all_customers)}, "
+        f"history turns {len(trimmed_history)}/{len(history or [])}"
+    )
+    return context_str, trimmed_history
+
 def get_translated_nav(target, lang_code):
     names_en = {
         'dashboard': 'Dashboard',
@@ -239,95 +436,79 @@ def get_translated_insights(stats, lang_code):
         summary += "Your product stock levels are fully healthy!"
     return summary
 
-def parse_command(user_text, context, history=[], language='en-IN'):
-    """
-    Parses user text using a configured AI model (Groq or Gemini).
+def match_simple_invoice(user_text, context, language):
+    """create_invoice result for a simple "N product for customer" command, or None.
+
+    Needs a context that can resolve names (SellerAIContext.resolve); any
+    name that does not resolve confidently leaves the command to the model.
     """
-    # Reload environment variables to pick up keys dynamically
-    load_dotenv(override=True)
+    resolve = getattr(context, 'resolve', None)
+    if resolve is None:
+        return None
+    text = ' '.join(user_text.split())
+    for pattern in SIMPLE_INVOICE_PATTERNS:
+        match = pattern.match(text.lower())
+        if match:
+            break
+    else:
+        return None
     
-    # 1. Deterministic Heuristic Routing for Navigation and Insights
-    text_lower = user_text.lower().strip()
+    customer = resolve('customer', match.group('customer'))
+    if customer is None:
+        return None
+    items = []
+    for part in SIMPLE_INVOICE_ITEM_SPLIT.split(match.group('items')):
+        item_match = SIMPLE_INVOICE_ITEM.match(part)
+        if not item_match:
+            return None
+        product = resolve('product', item_match.group('name') or item_match.group('name_first'))
+        if not product:
+            return None
+        items.append({
+            "product_name": product.name,
+            "product_id": product.entity_id,
+            "quantity": int(item_match.group('quantity') or item_match.group('quantity_last')),
+            "is_new_product": False,
+            "discount": 0
+        })
     
-    # A. Navigation keywords mapping (multi-lingual)
-    nav_targets = {
-        'dashboard': [
-            'go to dashboard', 'show dashboard', 'open dashboard', 'view dashboard', 'dashboard page',
-            'डैशबोर्ड पर जाओ', 'डैशबोर्ड दिखाओ',
-            'tableau de bord', 'aller au tableau de bord',
-            'tablero', 'ir al tablero',
-            'gehe zu dashboard',
-            'ダッシュボードへ移動'
-        ],
-        'products': [
-            'go to products', 'show products', 'open products', 'view products', 'products inventory', 'products page',
-            'उत्पाद पर जाओ', 'उत्पाद सूची', 'उत्पाद दिखाओ', 'उत्पाद दिखाएं', 'प्रोडक्ट्स पर जाएं',
-            'aller aux produits', 'inventaire des produits',
-            'ir a productos', 'inventario de productos',
-            'gehe zu produkten', 'produktinventar',
-            '商品一覧', '商品一覧へ移動'
-        ],
-        'invoices': [
-            'go to invoices', 'show invoices', 'open invoices', 'view invoices', 'invoices list', 'invoices page',
-            'इनवॉइस पर जाओ', 'इनवॉइस सूची', 'इनवॉइस दिखाओ', 'इनवॉइस दिखाएं',
-            'aller aux factures', 'liste des factures',
-            'ir a facturas', 'lista de facturas',
-            'gehe zu rechnungen', 'rechnungsliste',
-            '請求書一覧', '請求書一覧へ移動'
-        ],
-        'customers': [
-            'go to customers', 'show customers', 'open customers', 'view customers', 'customer list', 'customers page',
-            'ग्राहक पर जाओ', 'ग्राहक सूची', 'ग्राहक दिखाओ', 'ग्राहक दिखाएं', 'ग्राहक प्रबंधन',
-            'aller aux clients', 'gestion des clients',
-            'ir a clientes', 'gestión de clientes',
-            'gehe zu kunden', 'kundenverwaltung',
-            '顧客管理', '顧客管理へ移動'
-        ],
-        'analytics': [
-            'go to analytics', 'show analytics', 'open analytics', 'view analytics', 'analytics page',
-            'एनालिटिक्स पर जाओ', 'एनालिटिक्स दिखाओ', 'एनालिटिक्स दिखाएं', 'एनालिटिक्स केंद्र',
-            'afficher les analyses', 'centre d\'analyse',
-            'mostrar análisis', 'centro de análisis',
-            'analysen anzeigen', 'analysenzentrum',
-            '分析を見せて', '分析センター'
-        ],
-        'create_invoice': [
-            'create invoice', 'create an invoice', 'new invoice',
-            'इनवॉइस बनाएं', 'नया इनवॉइस', 'इनवॉइस बनाओ',
-            'créer une facture', 'créer facture', 'nouvelle facture',
-            'crear factura', 'nueva factura',
-            'rechnung erstellen', 'neue rechnung',
-            '請求書作成', '新しい請求書'
-        ],
-        'logout': [
-            'log out', 'logout', 'sign out',
-            'लॉगआउट', 'लॉग आउट', 'साइन आउट',
-            'déconnexion', 'se déconnecter',
-            'cerrar sesión', 'desconectarse',
-            'abmelden', 'ausloggen',
-            'ログアウト', 'サインアウト'
-        ]
+    items_text = ', '.join(f"{item['quantity']} x {item['product_name']}" for item in items)
+    reply = SIMPLE_INVOICE_REPLIES.get(language, 'Preparing an invoice for {customer}: {items}.')
+    return {
+        "intent": "create_invoice",
+        "data": {
+            "customer_name": customer.name,
+            "customer_id": customer.entity_id,
+            "is_new_customer": False,
+            "items": items,
+            "tax": 0,
+            "due_date": None
+        },
+        "missing_info": None,
+        "response_text": reply.format(customer=customer.name, items=items_text)
     }
+
+def _remember(cache_key, result):
+    parse_cache.put(cache_key, result)
+    return result
+
+def route_heuristically(user_text, context, language):
+    """Answer navigation, insight, greeting, simple invoice and structured add
+    commands without a model (None otherwise)"""
+    text_lower = user_text.lower().strip()
     
-    for target, phrases in nav_targets.items():
-        if any(phrase in text_lower for phrase in phrases):
-            return {
-                "intent": "navigation",
-                "data": {"target": target},
-                "missing_info": None,
-                "response_text": get_translated_nav(target, language)
-            }
+    # A. Navigation keywords (multi-lingual)
+    target = match_nav_target(text_lower)
+    if target:
+        return {
+            "intent": "navigation",
+            "data": {"target": target},
+            "missing_info": None,
+            "response_text": get_translated_nav(target, language)
+        }
             
-    # B. Business Insights keywords mapping (multi-lingual)
-    insight_phrases = [
-        'business insights', 'show insights', 'view insights', 'sales metrics', 'business stats', 'view statistics', 'how is business', 'how is the business doing',
-        'व्यापार रिपोर्ट', 'व्यापार रिपोर्ट दिखाएं', 'बिजनेस कैसा है', 'बिजनेस कैसा चल रहा है',
-        'perspectives commerciales', 'comment vont les affaires', 'rapport d\'activité',
-        'información comercial', 'cómo va el negocio', 'estado del negocio',
-        'geschäftszahlen', 'wie läuft das geschäft', 'geschäftseinblicke',
-        'ビジネス分析', '業績はどう', 'ビジネスレポート'
-    ]
-    if any(phrase in text_lower for phrase in insight_phrases):
+    # B. Business Insights keywords (multi-lingual)
+    if INSIGHT_PATTERN.search(text_lower):
         s = context.get('stats', {})
         summary = get_translated_insights(s, language)
         return {
@@ -337,13 +518,8 @@ def parse_command(user_text, context, history=[], language='en-IN'):
             "response_text": summary
         }
 
-    # C. Basic Greetings mapping (multi-lingual)
-    greeting_words = [
-        'hi', 'hello', 'hey', 'namaste', 'hola', 'bonjour', 'hallo', 'konnichiwa', 
-        'good morning', 'good afternoon', 'good evening', 'hi there', 'hello there',
-        'नमस्ते', 'हेलो', 'हाय'
-    ]
-    if text_lower in greeting_words or any(text_lower == word for word in greeting_words):
+    # C. Basic Greetings (multi-lingual)
+    if text_lower in GREETINGS:
         greetings = {
             'hi-IN': 'नमस्ते! मैं आपकी इनवॉइस बनाने या व्यावसायिक जानकारी प्राप्त करने में कैसे सहायता कर सकता हूँ?',
             'fr-FR': "Bonjour ! Comment puis-je vous aider avec vos factures ou vos perspectives commerciales aujourd'hui ?",
@@ -359,60 +535,22 @@ def parse_command(user_text, context, history=[], language='en-IN'):
             "response_text": reply
         }
 
-    # 2. Call Generative AI fallback for natural language commands with bidirectional error failover
-    groq_api_key = os.environ.get("GROQ_API_KEY")
-    gemini_api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
-    
-    # 1. Try Groq first if available
-    if groq_api_key and groq_api_key.strip():
-        try:
-            print("Attempting command parsing via Groq...")
-            return parse_command_groq(user_text, context, history, groq_api_key.strip(), language)
-        except Exception as groq_err:
-            print(f"Groq parse failed: {groq_err}. Falling back to Gemini...")
-            if gemini_api_key and gemini_api_key.strip():
-                try:
-                    return parse_command_gemini(user_text, context, history, gemini_api_key.strip(), language)
-                except Exception as gemini_err:
-                    return {
-                        "intent": "unknown",
-                        "data": {},
-                        "missing_info": None,
-                        "response_text": f"⚠️ Both Groq and Gemini services failed. (Groq: {groq_err}, Gemini: {gemini_err})"
-                    }
-            else:
-                return {
-                    "intent": "unknown",
-                    "data": {},
-                    "missing_info": None,
-                    "response_text": f"🛑 Groq failed and no Gemini API key is configured. Error: {groq_err}"
-                }
-                
-    # 2. Try Gemini fallback if Groq not configured
-    if gemini_api_key and gemini_api_key.strip():
-        try:
-            print("Attempting command parsing via Gemini...")
-            return parse_command_gemini(user_text, context, history, gemini_api_key.strip(), language)
-        except Exception as gemini_err:
-            print(f"Gemini parse failed: {gemini_err}. Trying Groq as fallback if configured...")
-            if groq_api_key and groq_api_key.strip():
-                try:
-                    return parse_command_groq(user_text, context, history, groq_api_key.strip(), language)
-                except Exception as groq_err:
-                    return {
-                        "intent": "unknown",
-                        "data": {},
-                        "missing_info": None,
-                        "response_text": f"⚠️ Both Gemini and Groq services failed. (Gemini: {gemini_err}, Groq: {groq_err})"
-                    }
-            else:
-                return {
-                    "intent": "unknown",
-                    "data": {},
-                    "missing_info": None,
-                    "response_text": f"🛑 Gemini failed and no Groq API key is configured. Error: {gemini_err}"
-                }
+    # D. Simple invoice commands naming existing products and customers
+    result = match_simple_invoice(user_text, context, language)
+    if result is not None:
+        return result
+
+    # E. Structured add product / add customer commands the grammar is sure about
+    result, confidence = parse_structured_command(user_text, language)
+    if confidence >= GRAMMAR_MIN_CONFIDENCE:
+        return result
+    return None
 
+def _no_key_result(user_text, language):
+    # Without a model, a less certain grammar parse beats no answer at all
+    result, confidence = parse_structured_command(user_text, language)
+    if result is not None and confidence >= GRAMMAR_FALLBACK_CONFIDENCE:
+        return result
     return {
         "intent": "unknown",
         "data": {},
@@ -420,22 +558,127 @@ def parse_command(user_text, context, history=[], language='en-IN'):
         "response_text": "⚠️ No AI API key found. Please configure `GROQ_API_KEY` or `GEMINI_API_KEY` in your `.env` file."
     }
 
-def parse_command_groq(user_text, context, history, api_key, language):
-    import requests
+def _providers_failed_result(names, error):
+    if len(names) == 1:
+        name = names[0]
+        other = 'Gemini' if name == 'Groq' else 'Groq'
+        message = f"🛑 {name} failed and no {other} API key is configured. Error: {error.errors.get(name, error)}"
+    else:
+        details = ', '.join(f"{name}: {err}" for name, err in error.errors.items())
+        message = f"⚠️ Both Groq and Gemini services failed. ({details})"
+    return {
+        "intent": "unknown",
+        "data": {},
+        "missing_info": None,
+        "response_text": message
+    }
+
+def parse_command(user_text, context, history=[], language='en-IN'):
+    """
+    Parses user text using a configured AI model (Groq or Gemini).
+    """
+    # 1. Deterministic Heuristic Routing for Navigation and Insights
+    result = route_heuristically(user_text, context, language)
+    if result is not None:
+        return result
+
+    # 2. Call Generative AI for natural language commands, hedged across the configured providers
+    groq_api_key, gemini_api_key = get_api_keys()
+    if not groq_api_key and not gemini_api_key:
+        return _no_key_result(user_text, language)
     
-    context_str = get_context_str(context)
+    # Reuse an earlier parse of the same command against the same catalog and conversation
+    cache_key = make_key(user_text, language, context, history)
+    cached = parse_cache.get(cache_key)
+    if cached is not None:
+        return cached
     
-    lang_names = {
-        'en-IN': 'Indian English',
-        'en-US': 'US English',
-        'hi-IN': 'Hindi',
-        'fr-FR': 'French',
-        'es-ES': 'Spanish',
-        'de-DE': 'German',
-        'ja-JP': 'Japanese'
-    }
-    lang_name = lang_names.get(language, 'English')
-    system_prompt = get_system_prompt(lang_name)
+    # Providers run on worker threads, so render the (lazily loaded) context here
+    context_str, history = build_prompt_context(user_text, context, history, language)
+    calls = {}
+    if groq_api_key:
+        calls['Groq'] = lambda: parse_command_groq(user_text, context_str, history, groq_api_key, language)
+    if gemini_api_key:
+        calls['Gemini'] = lambda: parse_command_gemini(user_text, context_str, history, gemini_api_key, language)
+    
+    try:
+        return _remember(cache_key, call_with_hedging(calls))
+    except ProvidersFailed as e:
+        return _providers_failed_result(list(calls), e)
+
+def parse_command_stream(user_text, context, history=[], language='en-IN'):
+    """
+    Streaming variant of parse_command. Yields ('intent', name) as soon as the
+    model has written the intent, ('text', chunk) for each piece of
+    response_text, and finally ('result', parsed dict). If the providers fail
+    after something was yielded, the failed result is the only further event.
+    """
+    result = route_heuristically(user_text, context, language)
+    if result is None:
+        groq_api_key, gemini_api_key = get_api_keys()
+        if not groq_api_key and not gemini_api_key:
+            result = _no_key_result(user_text, language)
+        else:
+            cache_key = make_key(user_text, language, context, history)
+            result = parse_cache.get(cache_key)
+    
+    if result is None:
+        context_str, history = build_prompt_context(user_text, context, history, language)
+        streams = {}
+        if groq_api_key:
+            streams['Groq'] = lambda: stream_command_groq(user_text, context_str, history, groq_api_key, language)
+        if gemini_api_key:
+            streams['Gemini'] = lambda: stream_command_gemini(user_text, context_str, history, gemini_api_key, language)
+        
+        parser = JSONEnvelopeParser(complete_keys=('intent',), stream_keys=('response_text',))
+        streamed = False
+        try:
+            for chunk in stream_with_failover(streams):
+                for key, value in parser.feed(chunk):
+                    streamed = True
+                    yield ('intent', value) if key == 'intent' else ('text', value)
+            result = _remember(cache_key, parser.result())
+        except ProvidersFailed as e:
+            result = _providers_failed_result(list(streams), e)
+        except ValueError as e:
+            result = {
+                "intent": "unknown",
+                "data": {},
+                "missing_info": None,
+                "response_text": f"⚠️ The AI service returned an invalid response. Error: {e}"
+            }
+        else:
+            yield ('result', result)
+            return
+        if streamed:
+            # Part of the reply is already out: end with the failed result alone
+            yield ('result', result)
+            return
+    
+    # Answered without streaming: send it as one piece
+    yield ('intent', result.get('intent'))
+    if result.get('response_text'):
+        yield ('text', result['response_text'])
+    yield ('result', result)
+
+LANG_NAMES = {
+    'en-IN': 'Indian English',
+    'en-US': 'US English',
+    'hi-IN': 'Hindi',
+    'fr-FR': 'French',
+    'es-ES': 'Spanish',
+    'de-DE': 'German',
+    'ja-JP': 'Japanese'
+}
+
+GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_MODEL = "llama-3.1-8b-instant"
+# Tried when the primary model is rate limited (limits are per model)
+GROQ_FALLBACK_MODEL = "llama-3.3-70b-versatile"
+GEMINI_MODEL = 'gemini-2.0-flash'
+
+def _groq_messages(user_text, context_str, history, language):
+    system_prompt = get_system_prompt(LANG_NAMES.get(language, 'English'))
     
     # Format conversation messages for Groq API
     messages = [{"role": "system", "content": system_prompt}]
@@ -445,52 +688,28 @@ def parse_command_groq(user_text, context, history, api_key, language):
             messages.append({"role": role, "content": msg.get('content') or msg.get('text', '')})
     
     messages.append({"role": "user", "content": f"Context:\n{context_str}\n\nUser Input:\n{user_text}"})
-    
+    return messages
+
+def _post_groq(payload, api_key, stream=False):
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
     }
+    response = http_session().post(GROQ_URL, headers=headers, json=payload, timeout=PROVIDER_TIMEOUT, stream=stream)
     
-    payload = {
-        "model": "llama-3.1-8b-instant",
-        "messages": messages,
-        "response_format": {"type": "json_object"},
-        "temperature": 0.1
-    }
-    
-    # Call Groq serverless completions API
-    response = requests.post(
-        "https://api.groq.com/openai/v1/chat/completions",
-        headers=headers,
-        json=payload,
-        timeout=10
-    )
-    
-    if response.status_code == 429 or response.status_code == 401 or response.status_code != 200:
-        # Try a quick fallback model in Groq first
-        payload["model"] = "llama-3.3-70b-versatile"
-        fallback_resp = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=10
-        )
+    if response.status_code == 429:
+        # The rate limit is per model: try the other Groq model. Other errors go
+        # straight back to the router, which is already asking Gemini.
+        fallback_resp = http_session().post(GROQ_URL, headers=headers, json=dict(payload, model=GROQ_FALLBACK_MODEL),
+                                            timeout=PROVIDER_TIMEOUT, stream=stream)
         if fallback_resp.status_code == 200:
             response = fallback_resp
             
     if response.status_code != 200:
         raise Exception(f"Groq API Error {response.status_code}: {response.text}")
-        
-    result = response.json()
-    content = result["choices"][0]["message"]["content"]
-    return json.loads(content)
+    return response
 
-def parse_command_gemini(user_text, context, history, api_key, language):
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    
-    context_str = get_context_str(context)
-    
+def _gemini_prompt(user_text, context_str, history, language):
     history_str = ""
     if history:
         history_str = "Conversation History:\n"
@@ -498,22 +717,52 @@ def parse_command_gemini(user_text, context, history, api_key, language):
             role = "User" if msg.get('role') == 'user' or msg.get('sender') == 'user' else "Assistant"
             history_str += f"{role}: {msg.get('content') or msg.get('text', '')}\n"
     
-    lang_names = {
-        'en-IN': 'Indian English',
-        'en-US': 'US English',
-        'hi-IN': 'Hindi',
-        'fr-FR': 'French',
-        'es-ES': 'Spanish',
-        'de-DE': 'German',
-        'ja-JP': 'Japanese'
+    system_prompt = get_system_prompt(LANG_NAMES.get(language, 'English'))
+    return f"{system_prompt}\n\nContext:\n{context_str}\n\n{history_str}\nUser Input:\n{user_text}\n\nResponse (JSON):"
+
+def parse_command_groq(user_text, context_str, history, api_key, language):
+    payload = {
+        "model": GROQ_MODEL,
+        "messages": _groq_messages(user_text, context_str, history, language),
+        "response_format": {"type": "json_object"},
+        "temperature": 0.1
     }
-    lang_name = lang_names.get(language, 'English')
-    system_prompt = get_system_prompt(lang_name)
-    prompt = f"{system_prompt}\n\nContext:\n{context_str}\n\n{history_str}\nUser Input:\n{user_text}\n\nResponse (JSON):"
+    
+    # Call Groq serverless completions API
+    result = _post_groq(payload, api_key).json()
+    content = result["choices"][0]["message"]["content"]
+    return json.loads(content)
+
+def stream_command_groq(user_text, context_str, history, api_key, language):
+    """Yield the model's reply text as Groq streams it (server-sent events)"""
+    # JSON mode is not combined with streaming; the prompt already demands JSON
+    payload = {
+        "model": GROQ_MODEL,
+        "messages": _groq_messages(user_text, context_str, history, language),
+        "temperature": 0.1,
+        "stream": True
+    }
+    response = _post_groq(payload, api_key, stream=True)
+    response.encoding = 'utf-8'
+    with response:
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data:'):
+                continue
+            data = line[len('data:'):].strip()
+            if data == '[DONE]':
+                break
+            delta = json.loads(data)["choices"][0]["delta"].get("content")
+            if delta:
+                yield delta
+
+def parse_command_gemini(user_text, context_str, history, api_key, language):
+    model = gemini_model(api_key, GEMINI_MODEL)
+    prompt = _gemini_prompt(user_text, context_str, history, language)
     
     response = model.generate_content(
         prompt,
-        generation_config={"response_mime_type": "application/json"}
+        generation_config={"response_mime_type": "application/json"},
+        request_options={"timeout": PROVIDER_TIMEOUT}
     )
     
     content = response.text
@@ -523,3 +772,23 @@ def parse_command_gemini(user_text, context, history, api_key, language):
         content = content[3:-3]
         
     return json.loads(content)
+
+def stream_command_gemini(user_text, context_str, history, api_key, language):
+    """Yield the model's reply text as Gemini streams it"""
+    model = gemini_model(api_key, GEMINI_MODEL)
+    prompt = _gemini_prompt(user_text, context_str, history, language)
+    
+    response = model.generate_content(
+        prompt,
+        generation_config={"response_mime_type": "application/json"},
+        request_options={"timeout": PROVIDER_TIMEOUT},
+        stream=True
+    )
+    for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            # Chunks without text parts (e.g. the final finish_reason chunk)
+            continue
+        if text:
+            yield text
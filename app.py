@@ -1,11 +1,31 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, g, has_app_context
+from flask import Response, has_request_context, stream_with_context
+from flask import stream_template
+from sqlalchemy import and_, or_, select
 from datetime import datetime, date
+import json
+import click
 from config import Config
 from extensions import db
-from models import Seller, Customer, Product, Invoice, InvoiceItem, Activity
+from models import Seller, Customer, Product, Invoice, InvoiceItem, Activity, SellerStats, LOAD_PROFILES
 from decimal import Decimal
 import decimal
 import ai_service
+import ai_clients
+from id_allocator import allocate_id
+from caching import LRUCache
+from search_service import search, match_clause, ensure_search_index, rebuild_search_index
+from maintenance import run_overdue_sweep, ensure_seller_swept, start_background_sweeper
+from stats import (get_dashboard_stats, get_admin_totals, apply_stats_delta, touch_seller_stats,
+                   record_invoice_change, rebuild_seller_stats, rebuild_all_seller_stats)
+from ai_context import SellerAIContext
+from entity_resolver import resolve_invoice_entities
+from ai_jobs import JobQueue, JobRejected
+from activity_sink import ActivitySink
+from activity_retention import recent_activities, run_activity_retention, hot_cutoff
+from stock_service import (adjust_stock, decrement_stock, set_stock, merge_quantities, describe_shortages,
+                           INVOICE_EDIT, INVOICE_CANCELLED)
+from stock_ledger import backfill_opening_balances, stock_at, stock_movements, run_stock_ledger_job
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -13,8 +33,71 @@ app.config.from_object(Config)
 # Initialize database
 db.init_app(app)
 
+class LazyLoadInTemplateError(RuntimeError):
+    """Raised in LAZY_LOAD_GUARD mode when a template triggers a relationship lazy load"""
+
+def install_lazy_load_guard():
+    """Fail loudly when a relationship lazy-loads during template rendering.
+
+    Routes are expected to eager-load what their templates touch (see
+    models.LOAD_PROFILES); this turns a missed profile into an error instead of
+    a silent SELECT per row.
+    """
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    base_template = app.jinja_env.template_class
+
+    class GuardedTemplate(base_template):
+        """Counts templates being rendered on `g`; the count drops even when rendering raises"""
+
+        def render(self, *args, **kwargs):
+            g._rendering_template = g.get('_rendering_template', 0) + 1
+            try:
+                return super().render(*args, **kwargs)
+            finally:
+                g._rendering_template -= 1
+
+        def generate(self, *args, **kwargs):
+            g._rendering_template = g.get('_rendering_template', 0) + 1
+            try:
+                yield from super().generate(*args, **kwargs)
+            finally:
+                g._rendering_template -= 1
+
+    app.jinja_env.template_class = GuardedTemplate
+
+    @event.listens_for(Session, 'do_orm_execute')
+    def _reject_lazy_load(orm_execute_state):
+        if orm_execute_state.is_relationship_load and has_app_context() and g.get('_rendering_template'):
+            raise LazyLoadInTemplateError(
+                f"Lazy load during template render: {orm_execute_state.statement}"
+            )
+
+if app.config.get('LAZY_LOAD_GUARD'):
+    install_lazy_load_guard()
+
+activity_sink = ActivitySink(app, mode=app.config['ACTIVITY_SINK_MODE'], durability=app.config['ACTIVITY_DURABILITY'],
+                             queue_size=app.config['ACTIVITY_QUEUE_SIZE'], batch_size=app.config['ACTIVITY_BATCH_SIZE'],
+                             flush_interval=app.config['ACTIVITY_FLUSH_INTERVAL'])
+
 # Helper utilities
 
+def ensure_indexes(inspector, tables):
+    """Create model-declared indexes missing from existing tables (MySQL, PostgreSQL, SQLite)"""
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            print(f"Creating index {index.name} on {table.name}...")
+            try:
+                index.create(db.engine)
+            except Exception as e:
+                print(f"Error creating index {index.name}: {e}")
+
 def migrate_database():
     """Add missing columns to existing database tables"""
     from sqlalchemy import inspect, text
@@ -26,6 +109,57 @@ def migrate_database():
             inspector = inspect(db.engine)
             tables = inspector.get_table_names()
             
+            ensure_indexes(inspector, tables)
+            
+            # seller_stats.version (per-seller cache invalidation) was added after the table
+            if 'seller_stats' in tables:
+                stats_columns = [col['name'] for col in inspector.get_columns('seller_stats')]
+                if 'version' not in stats_columns:
+                    print("Adding version column to seller_stats table...")
+                    try:
+                        db.session.execute(text("ALTER TABLE seller_stats ADD COLUMN version INTEGER NOT NULL DEFAULT 0"))
+                        db.session.commit()
+                    except (OperationalError, ProgrammingError) as e:
+                        print(f"Error adding version column: {e}")
+                        db.session.rollback()
+
+            # invoice_item price snapshot, backfilled from the current product prices
+            if 'invoice_item' in tables:
+                item_columns = [col['name'] for col in inspector.get_columns('invoice_item')]
+                try:
+                    if 'unit_price' not in item_columns:
+                        print("Adding unit_price/line_total columns to invoice_item table...")
+                        db.session.execute(text("ALTER TABLE invoice_item ADD COLUMN unit_price NUMERIC(10, 2) NULL"))
+                        db.session.execute(text("ALTER TABLE invoice_item ADD COLUMN line_total NUMERIC(12, 2) NULL"))
+                    backfilled = db.session.execute(text(
+                        "UPDATE invoice_item SET unit_price = COALESCE("
+                        "(SELECT p_price FROM product WHERE product.p_id = invoice_item.p_id), 0) "
+                        "WHERE unit_price IS NULL")).rowcount
+                    db.session.execute(text(
+                        "UPDATE invoice_item SET line_total = unit_price * item_quantity - COALESCE(discount, 0) "
+                        "WHERE line_total IS NULL"))
+                    db.session.commit()
+                    if backfilled:
+                        print(f"Backfilled price snapshot for {backfilled} invoice item(s).")
+                except (OperationalError, ProgrammingError) as e:
+                    print(f"Error adding invoice_item price snapshot: {e}")
+                    db.session.rollback()
+                # Name snapshot, so invoice pages don't need the product rows
+                try:
+                    if 'p_name' not in item_columns:
+                        print("Adding p_name column to invoice_item table...")
+                        db.session.execute(text("ALTER TABLE invoice_item ADD COLUMN p_name VARCHAR(100) NULL"))
+                    backfilled = db.session.execute(text(
+                        "UPDATE invoice_item SET p_name = COALESCE("
+                        "(SELECT p_name FROM product WHERE product.p_id = invoice_item.p_id), '') "
+                        "WHERE p_name IS NULL")).rowcount
+                    db.session.commit()
+                    if backfilled:
+                        print(f"Backfilled name snapshot for {backfilled} invoice item(s).")
+                except (OperationalError, ProgrammingError) as e:
+                    print(f"Error adding invoice_item name snapshot: {e}")
+                    db.session.rollback()
+
             if 'invoices' not in tables:
                 print("Invoices table does not exist yet. It will be created by db.create_all()")
                 return
@@ -77,48 +211,18 @@ def migrate_database():
             pass
 
 def generate_next_product_id():
-    """Generate next product ID using dictionary-based approach"""
-    existing_ids = {pid for (pid,) in db.session.query(Product.p_id).all()}
-    max_num = 0
-    
-    # Extract numbers from existing P### format IDs
-    for pid in existing_ids:
-        if pid.startswith('P') and len(pid) == 4:
-            try:
-                num = int(pid[1:])
-                if num > max_num:
-                    max_num = num
-            except ValueError:
-                continue
-    
-    # Find next available ID
-    while True:
-        max_num += 1
-        candidate = f"P{max_num:03d}"
-        if candidate not in existing_ids:
-            return candidate
+    """Generate next product ID (P###) from the product sequence"""
+    return allocate_id('product')
 
 def generate_next_customer_id():
-    """Generate next customer ID safely to avoid duplicates"""
-    existing_ids = {cid for (cid,) in db.session.query(Customer.c_id).all()}
-    max_num = 0
-    
-    # Extract numbers from existing C### format IDs
-    for cid in existing_ids:
-        if cid and cid.startswith('C') and len(cid) == 4:
-            try:
-                num = int(cid[1:])
-                if num > max_num:
-                    max_num = num
-            except ValueError:
-                continue
-    
-    # Find next available ID
-    while True:
-        max_num += 1
-        candidate = f"C{max_num:03d}"
-        if candidate not in existing_ids:
-            return candidate
+    """Generate next customer ID (C###) from the customer sequence"""
+    return allocate_id('customer')
+
+def generate_next_invoice_id(seller_id):
+    """Generate next invoice number (INV-###, or INV-<seller>-### when numbered per seller)"""
+    if app.config.get('INVOICE_NUMBERS_PER_SELLER'):
+        return allocate_id('invoice', scope=seller_id)
+    return allocate_id('invoice')
 
 def login_required(f):
     from functools import wraps
@@ -148,40 +252,16 @@ def role_required(role):
         return decorated_function
     return decorator
 
-def log_activity(action_type, description):
-    """Log an activity for the current user"""
-    if 'user_id' in session and 'user_role' in session:
-        activity = Activity(
-            user_id=session['user_id'],
-            user_role=session['user_role'],
-            action_type=action_type,
-            description=description
-        )
-        db.session.add(activity)
-        db.session.commit()
+def log_activity(action_type, description, user_id=None, user_role=None):
+    """Log an activity for the given user (default: the logged-in user).
 
-def update_overdue_invoices():
-    """Update invoice status to overdue if current date > due_date"""
-    today = date.today()
-    overdue_invoices = Invoice.query.filter(
-        Invoice.status.in_(['pending', 'overdue']),
-        Invoice.due_date.isnot(None),
-        Invoice.due_date < today
-    ).all()
-    
-    for invoice in overdue_invoices:
-        if invoice.status != 'overdue':
-            invoice.status = 'overdue'
-    
-    if overdue_invoices:
-        db.session.commit()
-
-def restore_stock_on_cancellation(invoice):
-    """Restore product stock when invoice is cancelled"""
-    for item in invoice.items:
-        product = item.product
-        if product:
-            product.p_stock = product.p_stock + item.item_quantity
+    The event is written with the next commit of the current request, or
+    queued for the background writer in async mode (see activity_sink).
+    """
+    if user_id is None and has_request_context() and 'user_id' in session and 'user_role' in session:
+        user_id, user_role = session['user_id'], session['user_role']
+    if user_id is not None and user_role is not None:
+        activity_sink.record(user_id, user_role, action_type, description)
 
 @app.route('/')
 def index():
@@ -249,8 +329,7 @@ def register():
                     return render_template('auth/register.html')
                 
                 # Generate unique seller ID
-                seller_count = Seller.query.count()
-                seller_id = f"S{seller_count + 1:03d}"
+                seller_id = allocate_id('seller')
                 
                 # Create new seller
                 seller = Seller(
@@ -262,6 +341,8 @@ def register():
                 )
                 seller.set_password(password)
                 db.session.add(seller)
+                db.session.flush()
+                rebuild_seller_stats(seller.s_id)
                 db.session.commit()
                 
                 # Auto-login
@@ -291,7 +372,7 @@ def logout():
 @role_required('customer')
 def customer_dashboard():
     # Fetch customer invoices
-    invoices = Invoice.query.filter_by(c_id=session['user_id']).order_by(Invoice.invoice_datetime.desc()).all()
+    invoices = Invoice.query.options(*LOAD_PROFILES['invoice_list']).filter_by(c_id=session['user_id']).order_by(Invoice.invoice_datetime.desc()).all()
     
     # Calculate customer statistics
     total_invoices = len(invoices)
@@ -312,35 +393,13 @@ def customer_dashboard():
 @login_required
 @role_required('seller')
 def seller_dashboard():
-    # Calculate stats from database
-    total_products = Product.query.filter_by(s_id=session['user_id']).count()
-    # Count customers created by this seller
-    total_customers = Customer.query.filter_by(s_id=session['user_id']).count()
-    total_invoices = Invoice.query.filter_by(s_id=session['user_id']).count()
-    paid_invoices_qs = Invoice.query.filter_by(s_id=session['user_id'], status='paid')
-    pending_invoices_qs = Invoice.query.filter_by(s_id=session['user_id'], status='pending')
-    overdue_invoices_qs = Invoice.query.filter_by(s_id=session['user_id'], status='overdue')
-    paid_invoices_count = paid_invoices_qs.count()
-    unpaid_invoices_count = pending_invoices_qs.count()
-    overdue_invoices_count = overdue_invoices_qs.count()
-    revenue_collected = sum(float(inv.amount) for inv in paid_invoices_qs.all())
-    revenue_due = sum(float(inv.amount) for inv in pending_invoices_qs.all()) + sum(float(inv.amount) for inv in overdue_invoices_qs.all())
+    # Read the incrementally maintained rollup row
+    stats = get_dashboard_stats(session['user_id'])
     
     # Get recent activities for this seller
-    recent_activities = Activity.query.filter_by(user_id=session['user_id']).order_by(Activity.timestamp.desc()).limit(5).all()
-    
-    stats = {
-        'total_products': total_products,
-        'total_customers': total_customers,
-        'total_invoices': total_invoices,
-        'paid_invoices': paid_invoices_count,
-        'unpaid_invoices': unpaid_invoices_count,
-        'overdue_invoices': overdue_invoices_count,
-        'revenue_collected': revenue_collected,
-        'revenue_due': revenue_due
-    }
+    activities = recent_activities(session['user_id'], app.config['ACTIVITY_HOT_MONTHS'])
     
-    return render_template('seller/dashboard.html', stats=stats, activities=recent_activities)
+    return render_template('seller/dashboard.html', stats=stats, activities=activities)
 
 @app.route('/seller/academy')
 @login_required
@@ -355,7 +414,7 @@ def seller_products():
     q = request.args.get('q', '').strip()
     base_query = Product.query.filter_by(s_id=session['user_id'])
     if q:
-        products = base_query.filter(Product.p_name.ilike(f"%{q}%")).all()
+        products = search(session['user_id'], 'product', q, limit=None)
     else:
         products = base_query.all()
     return render_template('seller/products.html', products=products, q=q)
@@ -384,10 +443,10 @@ def add_product():
             )
             
             db.session.add(new_product)
-            db.session.commit()
-            
-            # Log activity
+            apply_stats_delta(session['user_id'], total_products=1)
+            # Log activity (written in the same transaction)
             log_activity('product_added', f'Added new product "{name}"')
+            db.session.commit()
             
             flash('Product added successfully!', 'success')
             return redirect(url_for('seller_products'))
@@ -413,8 +472,13 @@ def edit_product(product_id):
             product.p_name = request.form['name']
             product.p_price = Decimal(request.form['price'])
             product.p_description = request.form['description']
-            product.p_stock = int(request.form['stock'])
+            shortages = set_stock(product, int(request.form['stock']))
+            if shortages:
+                db.session.rollback()
+                flash(f'Stock changed meanwhile for {describe_shortages(shortages)}', 'error')
+                return redirect(url_for('edit_product', product_id=product_id))
             
+            touch_seller_stats(session['user_id'])
             db.session.commit()
             flash('Product updated successfully!', 'success')
             return redirect(url_for('seller_products'))
@@ -442,6 +506,7 @@ def delete_product(product_id):
             return redirect(url_for('seller_products'))
         
         db.session.delete(product)
+        apply_stats_delta(session['user_id'], total_products=-1)
         db.session.commit()
         flash('Product deleted successfully!', 'success')
         
@@ -479,10 +544,10 @@ def api_add_product():
         )
         
         db.session.add(new_product)
-        db.session.commit()
-        
-        # Log activity
+        apply_stats_delta(session['user_id'], total_products=1)
+        # Log activity (written in the same transaction)
         log_activity('product_added', f'Added new product "{name}" from invoice creation')
+        db.session.commit()
         
         return jsonify({
             'success': True,
@@ -493,6 +558,27 @@ def api_add_product():
         db.session.rollback()
         return jsonify({'success': False, 'error': 'Internal server error'}), 500
 
+@app.route('/api/products/<product_id>/stock')
+@login_required
+@role_required('seller')
+def api_product_stock(product_id):
+    """Current stock, optional stock at ?at=YYYY-MM-DD[THH:MM:SS] (UTC) and recent ledger rows"""
+    product = Product.query.filter_by(p_id=product_id, s_id=session['user_id']).first()
+    if not product:
+        return jsonify({'success': False, 'error': 'Product not found'}), 404
+    
+    result = {'success': True, 'product_id': product.p_id, 'stock': product.p_stock}
+    at = request.args.get('at', '').strip()
+    if at:
+        try:
+            when = datetime.fromisoformat(at)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid "at" timestamp'}), 400
+        result['at'] = when.isoformat()
+        result['stock_at'] = stock_at([product.p_id], when).get(product.p_id)
+    result['movements'] = [m.to_dict() for m in stock_movements(product.p_id, min(request.args.get('limit', 50, type=int), 500))]
+    return jsonify(result)
+
 @app.route('/seller/customers')
 @login_required
 @role_required('seller')
@@ -507,12 +593,10 @@ def seller_customers():
             return redirect(url_for('login'))
         
         # Get customers created by this seller only (s_id must match)
-        base = Customer.query.filter(Customer.s_id == session['user_id'])
-        
         if q:
-            base = base.filter(Customer.c_name.ilike(f"%{q}%"))
-        
-        customers = base.order_by(Customer.c_name.asc()).all()
+            customers = search(session['user_id'], 'customer', q, limit=None)
+        else:
+            customers = Customer.query.filter(Customer.s_id == session['user_id']).order_by(Customer.c_name.asc()).all()
         return render_template('seller/customers.html', customers=customers, q=q)
     except Exception as e:
         # Log error but don't break the page
@@ -533,7 +617,7 @@ def view_customer_invoices(customer_id):
         flash('Customer not found or access denied', 'error')
         return redirect(url_for('seller_customers'))
     
-    invoices = Invoice.query.filter_by(c_id=customer_id, s_id=session['user_id']).all()
+    invoices = Invoice.query.options(*LOAD_PROFILES['invoice_list']).filter_by(c_id=customer_id, s_id=session['user_id']).all()
     return render_template('seller/customer_invoices.html', customer=customer, invoices=invoices)
 
 @app.route('/seller/customers/add', methods=['POST'])
@@ -566,10 +650,10 @@ def add_customer():
             s_id=session['user_id']  # Track which seller created this customer
         )
         db.session.add(customer)
-        db.session.commit()
-        
-        # Log activity
+        apply_stats_delta(session['user_id'], total_customers=1)
+        # Log activity (written in the same transaction)
         log_activity('customer_created', f'Created new customer "{name}"')
+        db.session.commit()
         
         flash('Customer added successfully!', 'success')
         return redirect(url_for('seller_customers'))
@@ -605,10 +689,10 @@ def edit_customer(customer_id):
             customer.c_phone_no = request.form['phone']
             customer.c_address = request.form['address']
             
-            db.session.commit()
-            
-            # Log activity
+            touch_seller_stats(session['user_id'])
+            # Log activity (written in the same transaction)
             log_activity('customer_updated', f'Updated customer "{customer.c_name}"')
+            db.session.commit()
             
             flash('Customer updated successfully!', 'success')
             return redirect(url_for('seller_customers'))
@@ -641,6 +725,7 @@ def delete_customer(customer_id):
         log_activity('customer_deleted', f'Deleted customer "{customer.c_name}"')
         
         db.session.delete(customer)
+        apply_stats_delta(session['user_id'], total_customers=-1)
         db.session.commit()
         flash('Customer deleted successfully!', 'success')
         
@@ -657,21 +742,21 @@ def admin_dashboard():
     """Admin dashboard to manage all sellers"""
     sellers = Seller.query.order_by(Seller.s_name.asc()).all()
     
-    # Get statistics
-    total_sellers = Seller.query.count()
-    total_customers = Customer.query.count()
-    total_products = Product.query.count()
-    total_invoices = Invoice.query.count()
-    
-    stats = {
-        'total_sellers': total_sellers,
-        'total_customers': total_customers,
-        'total_products': total_products,
-        'total_invoices': total_invoices
-    }
+    # Get statistics (summed from the per-seller rollup rows)
+    stats = get_admin_totals()
     
     return render_template('admin/dashboard.html', sellers=sellers, stats=stats)
 
+@app.route('/admin/ai/reload', methods=['POST'])
+@login_required
+@role_required('admin')
+def admin_reload_ai_clients():
+    """Re-read AI API keys from .env and reset the provider clients (after key rotation)"""
+    groq_api_key, gemini_api_key = ai_clients.reload_clients()
+    configured = [name for name, key in (('Groq', groq_api_key), ('Gemini', gemini_api_key)) if key]
+    flash(f"AI provider keys reloaded ({', '.join(configured) or 'none configured'}).", 'success')
+    return redirect(url_for('admin_dashboard'))
+
 @app.route('/admin/sellers')
 @login_required
 @role_required('admin')
@@ -723,6 +808,7 @@ def admin_delete_seller(seller_id):
             return redirect(url_for('admin_sellers'))
         
         db.session.delete(seller)
+        db.session.query(SellerStats).filter_by(s_id=seller_id).delete()
         db.session.commit()
         flash('Seller deleted successfully', 'success')
     except Exception as e:
@@ -841,46 +927,48 @@ def customer_analytics():
         end_date=end_date_str
     )
 
-@app.route('/seller/invoices')
-@login_required
-@role_required('seller')
-def seller_invoices():
-    # Update overdue invoices before displaying
-    update_overdue_invoices()
-    
-    q = request.args.get('q', '').strip()
-    customer_q = request.args.get('customer', '').strip()
-    status = request.args.get('status', '').strip()
-    start_date_str = request.args.get('start_date', '').strip()
-    end_date_str = request.args.get('end_date', '').strip()
-    min_amount_str = request.args.get('min_amount', '').strip()
-    max_amount_str = request.args.get('max_amount', '').strip()
+def filtered_invoice_query(seller_id):
+    """Seller's invoices narrowed by the list filters in request.args.
+
+    Returns (query, filters) where filters holds the raw filter strings for
+    re-rendering the form and building pagination links.
+    """
+    filters = {
+        'q': request.args.get('q', '').strip(),
+        'customer': request.args.get('customer', '').strip(),
+        'status': request.args.get('status', '').strip(),
+        'start_date': request.args.get('start_date', '').strip(),
+        'end_date': request.args.get('end_date', '').strip(),
+        'min_amount': request.args.get('min_amount', '').strip(),
+        'max_amount': request.args.get('max_amount', '').strip(),
+    }
 
-    query = Invoice.query.filter_by(s_id=session['user_id'])
+    query = Invoice.query.options(*LOAD_PROFILES['invoice_list']).filter_by(s_id=seller_id)
 
-    if q:
-        query = query.filter(Invoice.invoice_no.ilike(f"%{q}%"))
+    if filters['q']:
+        query = query.filter(match_clause('invoice', filters['q']))
 
-    if customer_q:
-        query = query.join(Customer).filter(
-            (Customer.c_name.ilike(f"%{customer_q}%")) | (Customer.c_email.ilike(f"%{customer_q}%"))
+    if filters['customer']:
+        matching_customers = select(Customer.c_id).where(
+            Customer.s_id == seller_id, match_clause('customer', filters['customer'])
         )
+        query = query.filter(Invoice.c_id.in_(matching_customers))
 
-    if status:
-        query = query.filter(Invoice.status == status)
+    if filters['status']:
+        query = query.filter(Invoice.status == filters['status'])
 
     # Date range filter (expects YYYY-MM-DD)
     try:
-        if start_date_str:
-            start_dt = datetime.strptime(start_date_str, '%Y-%m-%d')
+        if filters['start_date']:
+            start_dt = datetime.strptime(filters['start_date'], '%Y-%m-%d')
             query = query.filter(Invoice.invoice_datetime >= start_dt)
     except ValueError:
         pass
 
     try:
-        if end_date_str:
+        if filters['end_date']:
             # include entire end day by adding one day and using < next day
-            end_dt = datetime.strptime(end_date_str, '%Y-%m-%d')
+            end_dt = datetime.strptime(filters['end_date'], '%Y-%m-%d')
             end_dt_inclusive = end_dt.replace(hour=23, minute=59, second=59, microsecond=999999)
             query = query.filter(Invoice.invoice_datetime <= end_dt_inclusive)
     except ValueError:
@@ -888,29 +976,123 @@ def seller_invoices():
 
     # Amount range filter
     try:
-        if min_amount_str:
-            query = query.filter(Invoice.amount >= Decimal(min_amount_str))
+        if filters['min_amount']:
+            query = query.filter(Invoice.amount >= Decimal(filters['min_amount']))
     except Exception:
         pass
     try:
-        if max_amount_str:
-            query = query.filter(Invoice.amount <= Decimal(max_amount_str))
+        if filters['max_amount']:
+            query = query.filter(Invoice.amount <= Decimal(filters['max_amount']))
     except Exception:
         pass
 
-    invoices = query.order_by(Invoice.invoice_datetime.desc()).all()
+    return query, filters
+
+def encode_invoice_cursor(invoice):
+    """Opaque keyset cursor for an invoice's (invoice_datetime, invoice_no) position"""
+    import base64
+    raw = f"{invoice.invoice_datetime.isoformat()}|{invoice.invoice_no}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_invoice_cursor(token):
+    """Inverse of encode_invoice_cursor; None for a missing or malformed cursor"""
+    import base64
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+        dt_str, invoice_no = raw.split('|', 1)
+        return datetime.fromisoformat(dt_str), invoice_no
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+invoice_count_cache = LRUCache(maxsize=2048, ttl=60)
+
+def estimate_invoice_count(seller_id, query, filters):
+    """Matching-invoice count: the rollup total when unfiltered, else a briefly cached COUNT"""
+    if not any(filters.values()):
+        return get_dashboard_stats(seller_id)['total_invoices']
+    key = (seller_id, tuple(sorted(filters.items())))
+    count = invoice_count_cache.get(key)
+    if count is None:
+        count = query.order_by(None).count()
+        invoice_count_cache.set(key, count)
+    return count
+
+@app.route('/seller/invoices')
+@login_required
+@role_required('seller')
+def seller_invoices():
+    # Mark this seller's past-due invoices overdue if today's sweep has not run yet
+    ensure_seller_swept(session['user_id'])
+    
+    query, filters = filtered_invoice_query(session['user_id'])
+    total_estimate = estimate_invoice_count(session['user_id'], query, filters)
+
+    default_page_size = app.config['INVOICES_PAGE_SIZE']
+    try:
+        page_size = int(request.args.get('per_page', default_page_size))
+    except ValueError:
+        page_size = default_page_size
+    page_size = max(1, min(page_size, app.config['INVOICES_MAX_PAGE_SIZE']))
+
+    # Keyset pagination on (invoice_datetime, invoice_no), newest first
+    after = decode_invoice_cursor(request.args.get('after'))
+    before = decode_invoice_cursor(request.args.get('before')) if not after else None
+    if after:
+        after_dt, after_no = after
+        query = query.filter(or_(
+            Invoice.invoice_datetime < after_dt,
+            and_(Invoice.invoice_datetime == after_dt, Invoice.invoice_no < after_no)
+        ))
+    elif before:
+        before_dt, before_no = before
+        query = query.filter(or_(
+            Invoice.invoice_datetime > before_dt,
+            and_(Invoice.invoice_datetime == before_dt, Invoice.invoice_no > before_no)
+        ))
+
+    if before:
+        rows = query.order_by(Invoice.invoice_datetime.asc(), Invoice.invoice_no.asc()).limit(page_size + 1).all()
+        has_more_before = len(rows) > page_size
+        invoices = list(reversed(rows[:page_size]))
+        has_next, has_prev = True, has_more_before
+    else:
+        rows = query.order_by(Invoice.invoice_datetime.desc(), Invoice.invoice_no.desc()).limit(page_size + 1).all()
+        invoices = rows[:page_size]
+        has_next, has_prev = len(rows) > page_size, bool(after)
+
+    link_args = {key: value for key, value in filters.items() if value}
+    if page_size != default_page_size:
+        link_args['per_page'] = page_size
+    next_url = url_for('seller_invoices', after=encode_invoice_cursor(invoices[-1]), **link_args) if invoices and has_next else None
+    prev_url = url_for('seller_invoices', before=encode_invoice_cursor(invoices[0]), **link_args) if invoices and has_prev else None
+
     return render_template(
         'seller/invoices.html',
         invoices=invoices,
-        q=q,
-        customer_q=customer_q,
-        status=status,
-        start_date=start_date_str,
-        end_date=end_date_str,
-        min_amount=min_amount_str,
-        max_amount=max_amount_str,
+        q=filters['q'],
+        customer_q=filters['customer'],
+        status=filters['status'],
+        start_date=filters['start_date'],
+        end_date=filters['end_date'],
+        min_amount=filters['min_amount'],
+        max_amount=filters['max_amount'],
+        total_estimate=total_estimate,
+        next_url=next_url,
+        prev_url=prev_url,
+        export_url=url_for('export_invoices', **{key: value for key, value in filters.items() if value}),
     )
 
+@app.route('/seller/invoices/export')
+@login_required
+@role_required('seller')
+def export_invoices():
+    """Every matching invoice on one page, streamed as it renders"""
+    query, filters = filtered_invoice_query(session['user_id'])
+    invoices = query.order_by(Invoice.invoice_datetime.desc(), Invoice.invoice_no.desc()).yield_per(500)
+    return stream_template('seller/invoices_export.html', invoices=invoices, filters=filters)
+
 @app.route('/seller/invoices/create', methods=['GET', 'POST'])
 @login_required
 @role_required('seller')
@@ -962,6 +1144,7 @@ def create_invoice():
                 )
                 db.session.add(customer)
                 db.session.flush()  # Get the customer ID
+                apply_stats_delta(session['user_id'], total_customers=1)
                 
                 # Log activity
                 log_activity('customer_created', f'Created new customer "{customer_name}" during invoice creation')
@@ -1007,17 +1190,13 @@ def create_invoice():
                     )
                     db.session.add(product)
                     db.session.flush()
+                    apply_stats_delta(session['user_id'], total_products=1)
                     # Log activity for product creation
                     log_activity('product_added', f'Added new product "{temp_name}" during invoice creation')
                 else:
                     product = db.session.get(Product, product_id)
 
                 if product:
-                    # Ensure sufficient stock is available
-                    if product.p_stock < quantity:
-                        db.session.rollback()
-                        flash(f'Insufficient stock for product \"{product.p_name}\". Available: {product.p_stock}', 'error')
-                        return redirect(url_for('create_invoice'))
                     item_total = (product.p_price * quantity) - discount
                     subtotal += item_total
                     items.append({
@@ -1038,14 +1217,7 @@ def create_invoice():
             total = subtotal + tax
             
             # Create invoice with unique ID
-            # Generate unique invoice ID by checking existing ones
-            existing_invoice_nos = [inv.invoice_no for inv in Invoice.query.all()]
-            invoice_num = 1
-            while True:
-                invoice_id = f"INV-{invoice_num:03d}"
-                if invoice_id not in existing_invoice_nos:
-                    break
-                invoice_num += 1
+            invoice_id = generate_next_invoice_id(session['user_id'])
             
             new_invoice = Invoice(
                 invoice_no=invoice_id,
@@ -1071,20 +1243,25 @@ def create_invoice():
                     invoice_no=new_invoice.invoice_no,
                     p_id=item['product'].p_id,
                     item_quantity=item['quantity'],
-                    discount=item['discount']
+                    discount=item['discount'],
+                    unit_price=item['product'].p_price,
+                    line_total=item['total'],
+                    p_name=item['product'].p_name
                 )
                 db.session.add(invoice_item)
             
-            # Adjust product stock levels immediately
-            for item in items:
-                product = item['product']
-                if product:
-                    product.p_stock = product.p_stock - item['quantity']
-            
-            db.session.commit()
+            # Take stock for all line items in one conditional update
+            shortages = decrement_stock(merge_quantities((item['product'].p_id, item['quantity']) for item in items),
+                                        invoice_no=invoice_id)
+            if shortages:
+                db.session.rollback()
+                flash(f'Insufficient stock for {describe_shortages(shortages)}', 'error')
+                return redirect(url_for('create_invoice'))
             
-            # Log activity
+            record_invoice_change(session['user_id'], new=(new_invoice.status, new_invoice.amount))
+            # Log activity (written in the same transaction)
             log_activity('invoice_created', f'Created invoice {invoice_id} for {customer.c_name}')
+            db.session.commit()
             
             flash(f'Invoice {invoice_id} created successfully!', 'success')
             return redirect(url_for('seller_invoices'))
@@ -1104,7 +1281,7 @@ def create_invoice():
 @login_required
 @role_required('seller')
 def edit_invoice(invoice_id):
-    invoice = Invoice.query.filter_by(invoice_no=invoice_id, s_id=session['user_id']).first()
+    invoice = Invoice.query.options(*LOAD_PROFILES['invoice_detail']).filter_by(invoice_no=invoice_id, s_id=session['user_id']).first()
     
     if not invoice:
         flash('Invoice not found', 'error')
@@ -1120,10 +1297,17 @@ def edit_invoice(invoice_id):
             # Update invoice status
             new_status = request.form.get('status', invoice.status)
             old_status = invoice.status
+            old_amount = invoice.amount
+            
+            # Net stock change per product, applied in one update at the end
+            stock_deltas = {}
+            def change_stock(p_id, delta):
+                stock_deltas[p_id] = stock_deltas.get(p_id, 0) + delta
             
             # Handle cancellation - restore stock
             if new_status == 'cancelled' and old_status != 'cancelled':
-                restore_stock_on_cancellation(invoice)
+                for item in invoice.items:
+                    change_stock(item.p_id, item.item_quantity)
             
             invoice.status = new_status
             
@@ -1162,9 +1346,8 @@ def edit_invoice(invoice_id):
                 # Check if item should be deleted
                 delete_key = f'delete_{item_id}'
                 if delete_key in request.form:
-                    product = item.product
-                    if product:
-                        product.p_stock = product.p_stock + item.item_quantity
+                    if item.product:
+                        change_stock(item.p_id, item.item_quantity)
                     db.session.delete(item)
                     continue
                 
@@ -1172,14 +1355,8 @@ def edit_invoice(invoice_id):
                 quantity_key = f'quantity_{item_id}'
                 if quantity_key in request.form:
                     new_quantity = int(request.form[quantity_key])
-                    product = item.product
-                    if product:
-                        stock_diff = item.item_quantity - new_quantity
-                        if stock_diff < 0 and product.p_stock < abs(stock_diff):
-                            db.session.rollback()
-                            flash(f'Insufficient stock for product \"{product.p_name}\" while updating invoice.', 'error')
-                            return redirect(url_for('edit_invoice', invoice_id=invoice_id))
-                        product.p_stock = product.p_stock + stock_diff
+                    if item.product:
+                        change_stock(item.p_id, item.item_quantity - new_quantity)
                     item.item_quantity = new_quantity
                 
                 # Update discount
@@ -1196,23 +1373,21 @@ def edit_invoice(invoice_id):
                 if product_key in request.form:
                     new_product_id = request.form[product_key]
                     if new_product_id and new_product_id != item.p_id:
-                        old_product = item.product
-                        if old_product:
-                            old_product.p_stock = old_product.p_stock + item.item_quantity
+                        if item.product:
+                            change_stock(item.p_id, item.item_quantity)
                         new_product = db.session.get(Product, new_product_id)
                         if not new_product:
                             db.session.rollback()
                             flash('Selected product not found.', 'error')
                             return redirect(url_for('edit_invoice', invoice_id=invoice_id))
-                        if new_product.p_stock < item.item_quantity:
-                            db.session.rollback()
-                            flash(f'Insufficient stock for product \"{new_product.p_name}\".', 'error')
-                            return redirect(url_for('edit_invoice', invoice_id=invoice_id))
-                        new_product.p_stock = new_product.p_stock - item.item_quantity
+                        change_stock(new_product_id, -item.item_quantity)
                         item.p_id = new_product_id
                         item.product = new_product
+                        item.unit_price = new_product.p_price
+                        item.p_name = new_product.p_name
                 
-                subtotal += (item.product.p_price * item.item_quantity) - item.discount
+                # Existing lines keep the price they were invoiced at
+                subtotal += item.reprice()
             
             # Add new items
             new_item_indices = sorted(list(set([key.split('_')[1] for key in request.form if key.startswith('new_product_') and key.endswith('_id')])))
@@ -1229,31 +1404,36 @@ def edit_invoice(invoice_id):
                     
                     product = db.session.get(Product, product_id)
                     if product:
-                        if product.p_stock < quantity:
-                            db.session.rollback()
-                            flash(f'Insufficient stock for product \"{product.p_name}\".', 'error')
-                            return redirect(url_for('edit_invoice', invoice_id=invoice_id))
                         new_item = InvoiceItem(
                             invoice_no=invoice.invoice_no,
                             p_id=product_id,
                             item_quantity=quantity,
-                            discount=discount
+                            discount=discount,
+                            unit_price=product.p_price,
+                            p_name=product.p_name
                         )
                         db.session.add(new_item)
-                        product.p_stock = product.p_stock - quantity
-                        subtotal += (product.p_price * quantity) - discount
+                        change_stock(product_id, -quantity)
+                        subtotal += new_item.line_total
                     else:
                         db.session.rollback()
                         flash('Selected product not found.', 'error')
                         return redirect(url_for('edit_invoice', invoice_id=invoice_id))
             
+            cancelled = new_status == 'cancelled' and old_status != 'cancelled'
+            shortages = adjust_stock(stock_deltas, INVOICE_CANCELLED if cancelled else INVOICE_EDIT, invoice.invoice_no)
+            if shortages:
+                db.session.rollback()
+                flash(f'Insufficient stock for {describe_shortages(shortages)} while updating invoice.', 'error')
+                return redirect(url_for('edit_invoice', invoice_id=invoice_id))
+            
             # Recalculate total
             invoice.amount = subtotal + invoice.tax
             
-            db.session.commit()
-            
-            # Log activity
+            record_invoice_change(session['user_id'], old=(old_status, old_amount), new=(invoice.status, invoice.amount))
+            # Log activity (written in the same transaction)
             log_activity('invoice_updated', f'Updated invoice {invoice_id} - Status: {new_status}')
+            db.session.commit()
             
             flash('Invoice updated successfully!', 'success')
             return redirect(url_for('seller_invoices'))
@@ -1273,7 +1453,7 @@ def edit_invoice(invoice_id):
 @app.route('/invoice/<invoice_id>')
 @login_required
 def view_invoice(invoice_id):
-    invoice = db.session.get(Invoice, invoice_id)
+    invoice = db.session.get(Invoice, invoice_id, options=LOAD_PROFILES['invoice_view'])
     
     if not invoice:
         flash('Invoice not found', 'error')
@@ -1317,6 +1497,7 @@ def delete_invoice(invoice_id):
         log_activity('invoice_deleted', f'Deleted cancelled invoice {invoice_id} for {invoice.customer.c_name}')
         
         # Delete invoice (invoice_items will be cascade deleted due to relationship)
+        record_invoice_change(session['user_id'], old=(invoice.status, invoice.amount))
         db.session.delete(invoice)
         db.session.commit()
         flash('Invoice deleted successfully!', 'success')
@@ -1329,257 +1510,458 @@ def delete_invoice(invoice_id):
 
 
 
-@app.route('/api/ai/process', methods=['POST'])
-@login_required
-def process_ai_command():
-    try:
-        # Validate session first
-        if 'user_id' not in session or 'user_role' not in session:
-            return jsonify({'error': 'Session expired. Please log in again.', 'success': False}), 401
-        
-        if session.get('user_role') != 'seller':
-            return jsonify({'error': 'Access denied. This feature is only available for sellers.', 'success': False}), 403
-        
-        data = request.json
-        if not data:
-            return jsonify({'error': 'Invalid request data', 'success': False}), 400
-        
-        user_text = data.get('text', '').strip()
-        history = data.get('history', [])
-        language = data.get('language', 'en-IN')
-        
-        if not user_text:
-            return jsonify({'error': 'No text provided', 'success': False}), 400
-        
-        # Get context (products and customers) - only for current seller
-        products = Product.query.filter_by(s_id=session['user_id']).all()
-        customers = Customer.query.filter_by(s_id=session['user_id']).all()
-        
-        # Aggregate Business Stats
-        stats = {
-            'revenue': 0.0,
-            'invoices_count': 0,
-            'customers_count': 0,
-            'products_count': len(products),
-            'low_stock': [],
-            'top_selling': [],
-            'recent_invoices': []
-        }
+ai_context_cache = LRUCache(maxsize=app.config['AI_CONTEXT_CACHE_SIZE'], ttl=app.config['AI_CONTEXT_CACHE_TTL'])
+
+# How long an SSE client waits before asking again about an unfinished job
+AI_JOB_EVENTS_RETRY_MS = 1000
+
+ai_job_queue = JobQueue(app, workers=app.config['AI_JOB_WORKERS'], max_pending=app.config['AI_JOB_QUEUE_SIZE'],
+                        per_owner=app.config['AI_JOB_PER_SELLER'], result_ttl=app.config['AI_JOB_RESULT_TTL'])
+
+def run_ai_command(seller_id, user_text, history, language):
+    """Parse one assistant command for a seller and apply its side effects.
+
+    Needs only an app context (no request or session), so it runs the same
+    inline or on an AI job worker thread. Returns the response dict.
+    """
+    context = make_ai_context(seller_id, user_text)
+    result = ai_service.parse_command(user_text, context, history, language=language)
+    return apply_ai_result(seller_id, context, result)
+
+def make_ai_context(seller_id, user_text):
+    # Context is loaded lazily: only what the parser actually reads is queried
+    return SellerAIContext(seller_id, user_text, cache=ai_context_cache,
+                           max_entities=app.config['AI_CONTEXT_MAX_ENTITIES'])
+
+def apply_ai_result(seller_id, context, result):
+    """Carry out a parsed command (add product / customer, insights data) and return the response dict"""
+    # Inject live statistics context if the user requested business insights
+    if result.get('intent') == 'business_insights':
+        result['data'] = dict(context['stats'])
+        result['success'] = True
+    
+    # Point the invoice at existing customers and products (model output is only a guess)
+    if result.get('intent') == 'create_invoice':
+        resolve_invoice_entities(seller_id, result.get('data'))
+    
+    # Handle add_product intent - actually add to database
+    if result.get('intent') == 'add_product':
+        product_data = result.get('data', {})
+        print(f"DEBUG: Product data from AI: {product_data}")  # Debug logging
         try:
-            revenue_val = db.session.query(db.func.sum(Invoice.amount)).filter(Invoice.s_id == session['user_id']).scalar() or 0.0
-            stats['revenue'] = float(revenue_val)
-            stats['invoices_count'] = Invoice.query.filter_by(s_id=session['user_id']).count()
-            stats['customers_count'] = Customer.query.filter_by(s_id=session['user_id']).count()
-            
-            low_stock_products = Product.query.filter(Product.s_id == session['user_id'], Product.p_stock < 10).all()
-            stats['low_stock'] = [{'name': p.p_name, 'stock': p.p_stock} for p in low_stock_products]
-            
-            top_selling = db.session.query(
-                Product.p_name,
-                db.func.sum(InvoiceItem.item_quantity).label('qty')
-            ).join(
-                InvoiceItem, Product.p_id == InvoiceItem.p_id
-            ).join(
-                Invoice, InvoiceItem.invoice_no == Invoice.invoice_no
-            ).filter(
-                Invoice.s_id == session['user_id']
-            ).group_by(
-                Product.p_name
-            ).order_by(
-                db.text('qty DESC')
-            ).limit(3).all()
-            stats['top_selling'] = [{'name': name, 'quantity': int(qty)} for name, qty in top_selling]
+            # Validate required fields
+            product_name = product_data.get('name')
+            print(f"DEBUG: Product name extracted: {product_name}, type: {type(product_name)}")  # Debug logging
+            # Handle None or empty string
+            if not product_name or (isinstance(product_name, str) and product_name.strip() == ''):
+                result['response_text'] = "❌ Product name is required. Please specify a product name. For example: 'Add product Milk price 50'"
+                result['success'] = False
+            else:
+                # Verify seller exists using query (more reliable than db.session.get)
+                seller = Seller.query.filter_by(s_id=seller_id).first()
+                if not seller:
+                    result['response_text'] = f"❌ Seller with ID '{seller_id}' not found. Please log in again."
+                    result['success'] = False
+                else:
+                    # Generate product ID
+                    new_product_id = generate_next_product_id()
+                    
+                    # Get and validate price
+                    price = product_data.get('price', 0)
+                    try:
+                        price_decimal = Decimal(str(price)) if price else Decimal('0')
+                    except (ValueError, TypeError):
+                        price_decimal = Decimal('0')
+                    
+                    # Get and validate stock
+                    stock = product_data.get('stock', 0)
+                    try:
+                        stock_int = int(stock) if stock else 0
+                    except (ValueError, TypeError):
+                        stock_int = 0
+                    
+                    # Create product - ensure product_name is a valid string
+                    product_name_str = product_name.strip() if isinstance(product_name, str) else (str(product_name) if product_name else '')
+                    if not product_name_str:
+                        result['response_text'] = "❌ Product name is required. Please specify a product name. For example: 'Add product Milk price 50'"
+                        result['success'] = False
+                    else:
+                        description = product_data.get('description', '')
+                        description_str = description.strip() if description and isinstance(description, str) else ''
+                        
+                        new_product = Product(
+                            p_id=new_product_id,
+                            p_name=product_name_str,
+                            p_price=price_decimal,
+                            p_description=description_str,
+                            p_stock=stock_int,
+                            s_id=seller_id
+                        )
+                        db.session.add(new_product)
+                        apply_stats_delta(seller_id, total_products=1)
+                        # Log activity (written in the same transaction)
+                        log_activity('product_added', f'Added product "{product_name_str}" via AI assistant',
+                                         user_id=seller_id, user_role='seller')
+                        db.session.commit()
+                        
+                        # Update response
+                        result['response_text'] = f"✅ Product '{product_name_str}' has been added successfully! You can view it in the Products tab."
+                        result['success'] = True
+                        result['product_id'] = new_product_id
             
-            recent_invoices = Invoice.query.filter_by(s_id=session['user_id']).order_by(Invoice.invoice_datetime.desc()).limit(3).all()
-            stats['recent_invoices'] = [{
-                'invoice_no': inv.invoice_no,
-                'customer_name': inv.customer.c_name if inv.customer else 'Unknown',
-                'amount': float(inv.amount),
-                'status': inv.status
-            } for inv in recent_invoices]
         except Exception as e:
-            print(f"Error compiling business stats context: {e}")
+            db.session.rollback()
+            error_msg = str(e)
+            # Provide more user-friendly error messages
+            if 'foreign key constraint' in error_msg.lower():
+                result['response_text'] = f"❌ Failed to add product: Seller account issue. Please try logging in again."
+            elif "'NoneType' object has no attribute" in error_msg:
+                result['response_text'] = f"❌ Failed to add product: Missing product information. Please provide product name, price, and other details. Example: 'Add product Milk price 50 stock 100'"
+            else:
+                result['response_text'] = f"❌ Failed to add product: {error_msg}"
+            result['success'] = False
+            print(f"Product addition error: {e}")  # Debug logging
+            import traceback
+            traceback.print_exc()  # Print full traceback for debugging
+    
+    # Handle add_customer intent - actually add to database
+    elif result.get('intent') == 'add_customer':
+        customer_data = result.get('data', {})
+        try:
+            # Validate required fields - safely handle None values
+            name_raw = customer_data.get('name')
+            email_raw = customer_data.get('email')
             
-        context = {
-            'products': [p.to_dict() for p in products],
-            'customers': [c.to_dict() for c in customers],
-            'stats': stats
-        }
-        
-        result = ai_service.parse_command(user_text, context, history, language=language)
-        
-        # Inject live statistics context if the user requested business insights
-        if result.get('intent') == 'business_insights':
-            result['data'] = stats
-            result['success'] = True
-        
-        # Handle add_product intent - actually add to database
-        if result.get('intent') == 'add_product':
-            product_data = result.get('data', {})
-            print(f"DEBUG: Product data from AI: {product_data}")  # Debug logging
-            try:
-                # Validate required fields
-                product_name = product_data.get('name')
-                print(f"DEBUG: Product name extracted: {product_name}, type: {type(product_name)}")  # Debug logging
-                # Handle None or empty string
-                if not product_name or (isinstance(product_name, str) and product_name.strip() == ''):
-                    result['response_text'] = "❌ Product name is required. Please specify a product name. For example: 'Add product Milk price 50'"
+            customer_name = (name_raw or '').strip() if name_raw else ''
+            customer_email = (email_raw or '').strip() if email_raw else ''
+            
+            if not customer_name:
+                result['response_text'] = "❌ Customer name is required. Please specify a customer name. Example: 'Add customer John Doe email john@example.com'"
+                result['success'] = False
+            elif not customer_email:
+                result['response_text'] = "❌ Customer email is required. Please specify an email address. Example: 'Add customer John Doe email john@example.com'"
+                result['success'] = False
+            else:
+                # Check if customer email already exists
+                existing = Customer.query.filter_by(c_email=customer_email).first()
+                if existing:
+                    result['response_text'] = f"❌ Customer with email '{customer_email}' already exists!"
                     result['success'] = False
                 else:
-                    # Verify seller exists using query (more reliable than db.session.get)
-                    seller = Seller.query.filter_by(s_id=session['user_id']).first()
+                    # Verify seller exists
+                    seller = Seller.query.filter_by(s_id=seller_id).first()
                     if not seller:
-                        result['response_text'] = f"❌ Seller with ID '{session['user_id']}' not found. Please log in again."
+                        result['response_text'] = f"❌ Seller account not found. Please log in again."
                         result['success'] = False
                     else:
-                        # Generate product ID
-                        new_product_id = generate_next_product_id()
+                        # Generate customer ID safely
+                        customer_id = generate_next_customer_id()
                         
-                        # Get and validate price
-                        price = product_data.get('price', 0)
-                        try:
-                            price_decimal = Decimal(str(price)) if price else Decimal('0')
-                        except (ValueError, TypeError):
-                            price_decimal = Decimal('0')
+                        # Safely handle optional fields (phone and address)
+                        phone_raw = customer_data.get('phone')
+                        address_raw = customer_data.get('address')
                         
-                        # Get and validate stock
-                        stock = product_data.get('stock', 0)
-                        try:
-                            stock_int = int(stock) if stock else 0
-                        except (ValueError, TypeError):
-                            stock_int = 0
+                        phone_value = (phone_raw or '').strip() if phone_raw else ''
+                        address_value = (address_raw or '').strip() if address_raw else ''
                         
-                        # Create product - ensure product_name is a valid string
-                        product_name_str = product_name.strip() if isinstance(product_name, str) else (str(product_name) if product_name else '')
-                        if not product_name_str:
-                            result['response_text'] = "❌ Product name is required. Please specify a product name. For example: 'Add product Milk price 50'"
-                            result['success'] = False
-                        else:
-                            description = product_data.get('description', '')
-                            description_str = description.strip() if description and isinstance(description, str) else ''
-                            
-                            new_product = Product(
-                                p_id=new_product_id,
-                                p_name=product_name_str,
-                                p_price=price_decimal,
-                                p_description=description_str,
-                                p_stock=stock_int,
-                                s_id=session['user_id']
-                            )
-                            db.session.add(new_product)
-                            db.session.commit()
-                            
-                            # Log activity
-                            log_activity('product_added', f'Added product "{product_name_str}" via AI assistant')
-                            
-                            # Update response
-                            result['response_text'] = f"✅ Product '{product_name_str}' has been added successfully! You can view it in the Products tab."
-                            result['success'] = True
-                            result['product_id'] = new_product_id
+                        # Create customer with all required fields
+                        new_customer = Customer(
+                            c_id=customer_id,
+                            c_name=customer_name,
+                            c_email=customer_email,
+                            c_phone_no=phone_value,
+                            c_address=address_value,
+                            password='',
+                            s_id=seller_id  # Always set s_id
+                        )
+                        db.session.add(new_customer)
+                        apply_stats_delta(seller_id, total_customers=1)
+                        # Log activity (written in the same transaction)
+                        log_activity('customer_created', f'Added customer "{customer_name}" via AI assistant',
+                                         user_id=seller_id, user_role='seller')
+                        db.session.commit()
+                        
+                        # Update response
+                        result['response_text'] = f"✅ Customer '{customer_name}' has been added successfully! You can view them in the Customers tab."
+                        result['success'] = True
+                        result['customer_id'] = customer_id
                 
-            except Exception as e:
-                db.session.rollback()
-                error_msg = str(e)
-                # Provide more user-friendly error messages
-                if 'foreign key constraint' in error_msg.lower():
-                    result['response_text'] = f"❌ Failed to add product: Seller account issue. Please try logging in again."
-                elif "'NoneType' object has no attribute" in error_msg:
-                    result['response_text'] = f"❌ Failed to add product: Missing product information. Please provide product name, price, and other details. Example: 'Add product Milk price 50 stock 100'"
-                else:
-                    result['response_text'] = f"❌ Failed to add product: {error_msg}"
-                result['success'] = False
-                print(f"Product addition error: {e}")  # Debug logging
-                import traceback
-                traceback.print_exc()  # Print full traceback for debugging
+        except Exception as e:
+            db.session.rollback()
+            error_msg = str(e)
+            if 'foreign key constraint' in error_msg.lower():
+                result['response_text'] = "❌ Failed to add customer: Seller account issue. Please try logging in again."
+            elif 'unique constraint' in error_msg.lower() or 'duplicate' in error_msg.lower():
+                result['response_text'] = f"❌ Failed to add customer: Email already exists."
+            else:
+                result['response_text'] = f"❌ Failed to add customer: {error_msg}"
+            result['success'] = False
+            print(f"Customer addition error: {e}")
+            import traceback
+            traceback.print_exc()
+    
+    return result
+
+def read_ai_request():
+    """Validate an assistant request; returns (payload, None) or (None, error response)"""
+    # Validate session first
+    if 'user_id' not in session or 'user_role' not in session:
+        return None, (jsonify({'error': 'Session expired. Please log in again.', 'success': False}), 401)
+    
+    if session.get('user_role') != 'seller':
+        return None, (jsonify({'error': 'Access denied. This feature is only available for sellers.', 'success': False}), 403)
+    
+    data = request.get_json(silent=True)
+    if not data:
+        return None, (jsonify({'error': 'Invalid request data', 'success': False}), 400)
+    
+    user_text = (data.get('text') or '').strip()
+    if not user_text:
+        return None, (jsonify({'error': 'No text provided', 'success': False}), 400)
+    
+    return {
+        'text': user_text,
+        'history': data.get('history', []),
+        'language': data.get('language', 'en-IN'),
+        'async': bool(data.get('async'))
+    }, None
+
+def sse_event(event, data):
+    """One server-sent event carrying JSON data"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/ai/process', methods=['POST'])
+@login_required
+def process_ai_command():
+    try:
+        data, error = read_ai_request()
+        if error:
+            return error
+        user_text, history, language = data['text'], data['history'], data['language']
         
-        # Handle add_customer intent - actually add to database
-        elif result.get('intent') == 'add_customer':
-            customer_data = result.get('data', {})
+        if data['async'] and app.config['AI_ASYNC_JOBS']:
             try:
-                # Validate session
-                if 'user_id' not in session:
-                    result['response_text'] = "❌ Session expired. Please log in again."
-                    result['success'] = False
-                    return jsonify(result)
-                
-                # Validate required fields - safely handle None values
-                name_raw = customer_data.get('name')
-                email_raw = customer_data.get('email')
-                
-                customer_name = (name_raw or '').strip() if name_raw else ''
-                customer_email = (email_raw or '').strip() if email_raw else ''
-                
-                if not customer_name:
-                    result['response_text'] = "❌ Customer name is required. Please specify a customer name. Example: 'Add customer John Doe email john@example.com'"
-                    result['success'] = False
-                elif not customer_email:
-                    result['response_text'] = "❌ Customer email is required. Please specify an email address. Example: 'Add customer John Doe email john@example.com'"
-                    result['success'] = False
-                else:
-                    # Check if customer email already exists
-                    existing = Customer.query.filter_by(c_email=customer_email).first()
-                    if existing:
-                        result['response_text'] = f"❌ Customer with email '{customer_email}' already exists!"
-                        result['success'] = False
-                    else:
-                        # Verify seller exists
-                        seller = Seller.query.filter_by(s_id=session['user_id']).first()
-                        if not seller:
-                            result['response_text'] = f"❌ Seller account not found. Please log in again."
-                            result['success'] = False
-                        else:
-                            # Generate customer ID safely
-                            customer_id = generate_next_customer_id()
-                            
-                            # Safely handle optional fields (phone and address)
-                            phone_raw = customer_data.get('phone')
-                            address_raw = customer_data.get('address')
-                            
-                            phone_value = (phone_raw or '').strip() if phone_raw else ''
-                            address_value = (address_raw or '').strip() if address_raw else ''
-                            
-                            # Create customer with all required fields
-                            new_customer = Customer(
-                                c_id=customer_id,
-                                c_name=customer_name,
-                                c_email=customer_email,
-                                c_phone_no=phone_value,
-                                c_address=address_value,
-                                password='',
-                                s_id=session['user_id']  # Always set s_id
-                            )
-                            db.session.add(new_customer)
-                            db.session.commit()
-                            
-                            # Log activity
-                            log_activity('customer_created', f'Added customer "{customer_name}" via AI assistant')
-                            
-                            # Update response
-                            result['response_text'] = f"✅ Customer '{customer_name}' has been added successfully! You can view them in the Customers tab."
-                            result['success'] = True
-                            result['customer_id'] = customer_id
-                    
-            except Exception as e:
-                db.session.rollback()
-                error_msg = str(e)
-                if 'foreign key constraint' in error_msg.lower():
-                    result['response_text'] = "❌ Failed to add customer: Seller account issue. Please try logging in again."
-                elif 'unique constraint' in error_msg.lower() or 'duplicate' in error_msg.lower():
-                    result['response_text'] = f"❌ Failed to add customer: Email already exists."
-                else:
-                    result['response_text'] = f"❌ Failed to add customer: {error_msg}"
-                result['success'] = False
-                print(f"Customer addition error: {e}")
-                import traceback
-                traceback.print_exc()
+                job = ai_job_queue.submit(session['user_id'], run_ai_command,
+                                     session['user_id'], user_text, history, language)
+            except JobRejected as e:
+                return jsonify({'error': str(e), 'success': False}), e.status_code
+            status_url = url_for('ai_job_status', job_id=job.id)
+            return jsonify({
+                'job_id': job.id,
+                'status': job.status,
+                'status_url': status_url,
+                'events_url': url_for('ai_job_events', job_id=job.id)
+            }), 202, {'Location': status_url}
         
-        return jsonify(result)
+        return jsonify(run_ai_command(session['user_id'], user_text, history, language))
     except Exception as e:
         print(f"AI Processing Error: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e), 'success': False}), 500
 
+@app.route('/api/ai/jobs/<job_id>')
+@login_required
+def ai_job_status(job_id):
+    """Result of an async AI command: 202 while it runs, then the same body /api/ai/process returns"""
+    job = ai_job_queue.get(job_id, session['user_id'])
+    if not job:
+        return jsonify({'error': 'Job not found', 'success': False}), 404
+    if job.status == 'done':
+        return jsonify(job.result)
+    if job.status == 'failed':
+        return jsonify({'error': job.error, 'success': False}), 500
+    return jsonify({'job_id': job.id, 'status': job.status}), 202
+
+@app.route('/api/ai/jobs/<job_id>/events')
+@login_required
+def ai_job_events(job_id):
+    """Server-sent events for a job: its result once it has finished, until then
+    a `status` event and a retry delay. The response ends straight away, so a
+    waiting client reconnects (EventSource does so by itself) instead of
+    holding a worker for the whole job."""
+    job = ai_job_queue.get(job_id, session['user_id'])
+    if not job:
+        return jsonify({'error': 'Job not found', 'success': False}), 404
+    
+    if job.status == 'done':
+        body = sse_event('result', job.result)
+    elif job.status == 'failed':
+        body = sse_event('error', {'error': job.error, 'success': False})
+    else:
+        body = f"retry: {AI_JOB_EVENTS_RETRY_MS}\n" + sse_event('status', {'job_id': job.id, 'status': job.status})
+    return Response(body, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/ai/stream', methods=['POST'])
+@login_required
+def stream_ai_command():
+    """Streaming variant of /api/ai/process as server-sent events: `intent` once the
+    model has decided it, `text` chunks of the reply as they are generated, then
+    the same `result` body /api/ai/process returns"""
+    data, error = read_ai_request()
+    if error:
+        return error
+    seller_id = session['user_id']
+    # Same queue bound and per-seller cap as async jobs: a stream holds this worker for the model round trip
+    try:
+        job_id = ai_job_queue.start_inline(seller_id)
+    except JobRejected as e:
+        return jsonify({'error': str(e), 'success': False}), e.status_code
+    outcome = {}
+    
+    def events():
+        try:
+            context = make_ai_context(seller_id, data['text'])
+            result = None
+            for kind, value in ai_service.parse_command_stream(data['text'], context, data['history'],
+                                                               language=data['language']):
+                if kind == 'result':
+                    result = value
+                else:
+                    yield sse_event(kind, value)
+            yield sse_event('result', apply_ai_result(seller_id, context, result))
+        except Exception as e:
+            print(f"AI Streaming Error: {e}")
+            import traceback
+            traceback.print_exc()
+            outcome['error'] = str(e)
+            yield sse_event('error', {'error': str(e), 'success': False})
+    
+    response = Response(stream_with_context(events()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Runs when the response is closed, even if the client left before the stream started
+    response.call_on_close(lambda: ai_job_queue.finish_inline(job_id, outcome.get('error')))
+    return response
+
+def explain_index_usage(seller_id=None):
+    """EXPLAIN the dashboard and list queries and report whether each uses its index.
+
+    Returns a list of dicts with the query name, the acceptable indexes, plan
+    text and a `uses_index` flag.
+    """
+    from sqlalchemy import text
+    
+    if seller_id is None:
+        seller = Seller.query.first()
+        seller_id = seller.s_id if seller else 'S001'
+    today = date.today()
+    checks = [
+        ('dashboard_status_counts', 'ix_invoice_seller_status_datetime',
+         Invoice.query.filter_by(s_id=seller_id, status='paid')),
+        ('invoice_list', ('ix_invoice_seller_status_datetime', 'ix_invoice_seller_customer'),
+         Invoice.query.filter_by(s_id=seller_id).order_by(Invoice.invoice_datetime.desc())),
+        ('overdue_candidates', 'ix_invoice_seller_status_datetime',
+         Invoice.query.filter(Invoice.s_id == seller_id, Invoice.status == 'pending', Invoice.due_date < today)),
+        ('customer_invoices', 'ix_invoice_seller_customer',
+         Invoice.query.filter_by(s_id=seller_id, c_id='C001')),
+        ('invoice_items', 'ix_invoice_item_invoice_no',
+         InvoiceItem.query.filter_by(invoice_no='INV-001')),
+        ('product_in_invoices', 'ix_invoice_item_p_id',
+         InvoiceItem.query.filter_by(p_id='P001')),
+        ('product_list', 'ix_product_seller_name',
+         Product.query.filter_by(s_id=seller_id).order_by(Product.p_name)),
+        ('customer_list', 'ix_customer_seller_name',
+         Customer.query.filter_by(s_id=seller_id).order_by(Customer.c_name.asc())),
+        ('recent_activities', 'ix_activity_user_timestamp',
+         Activity.query.filter(Activity.user_id == seller_id, Activity.timestamp >= hot_cutoff(app.config['ACTIVITY_HOT_MONTHS']))
+         .order_by(Activity.timestamp.desc()).limit(5)),
+    ]
+    
+    dialect = db.engine.dialect.name
+    if dialect == 'sqlite':
+        explain_prefix = 'EXPLAIN QUERY PLAN '
+    else:
+        explain_prefix = 'EXPLAIN '
+    
+    results = []
+    with db.engine.connect() as conn:
+        if dialect == 'postgresql':
+            # Tiny tables make the planner prefer a seq scan; ask whether the index is usable at all
+            conn.execute(text('SET enable_seqscan = off'))
+        for name, index_names, query in checks:
+            if isinstance(index_names, str):
+                index_names = (index_names,)
+            sql = str(query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+            rows = conn.execute(text(explain_prefix + sql)).fetchall()
+            plan = '\n'.join(' '.join(str(col) for col in row) for row in rows)
+            results.append({
+                'query': name,
+                'indexes': index_names,
+                'uses_index': any(index_name in plan for index_name in index_names),
+                'plan': plan
+            })
+    return results
+
+@app.cli.command('check-indexes')
+def check_indexes_command():
+    """EXPLAIN the hot queries and fail if any of them skips its index"""
+    import sys
+    
+    results = explain_index_usage()
+    for result in results:
+        mark = '✓' if result['uses_index'] else '✗'
+        print(f"{mark} {result['query']}: expects {' or '.join(result['indexes'])}")
+        if not result['uses_index']:
+            print(f"    {result['plan']}")
+    if not all(result['uses_index'] for result in results):
+        sys.exit(1)
+
+@app.cli.command('sweep-overdue')
+@click.option('--force', is_flag=True, help='Run even if it already ran today')
+def sweep_overdue_command(force):
+    """Mark past-due pending invoices as overdue (once per day across all workers)"""
+    count = run_overdue_sweep(force=force)
+    if count is None:
+        print("Overdue sweep already ran today, skipping.")
+    else:
+        print(f"Overdue sweep: {count} invoice(s) marked overdue.")
+
+@app.cli.command('rebuild-seller-stats')
+def rebuild_seller_stats_command():
+    """Recompute the seller_stats rollup for every seller from the base tables"""
+    count = rebuild_all_seller_stats()
+    print(f"Rebuilt dashboard stats for {count} seller(s).")
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Create (if needed) and rebuild the product/customer/invoice search index"""
+    backend = rebuild_search_index()
+    print(f"Search index rebuilt ({backend}).")
+
+@app.cli.command('archive-activity')
+@click.option('--force', is_flag=True, help='Run even if it already ran today')
+def archive_activity_command(force):
+    """Move old activity rows to monthly tables and archive months past retention"""
+    outcome = run_activity_retention(app.config['ACTIVITY_HOT_MONTHS'], app.config['ACTIVITY_RETENTION_MONTHS'],
+                                     app.config['ACTIVITY_ARCHIVE_DIR'], force=force)
+    if outcome is None:
+        print("Activity retention already ran today, skipping.")
+        return
+    moved, compacted = outcome
+    for month, count in moved.items():
+        print(f"Moved {count} activity row(s) to activity_{month:%Y%m}.")
+    for month, count in compacted.items():
+        print(f"Archived {count} activity row(s) from {month:%Y-%m} to {app.config['ACTIVITY_ARCHIVE_DIR']}.")
+    if not moved and not compacted:
+        print("Activity log is within its retention window.")
+
+@app.cli.command('stock-ledger')
+@click.option('--repair', is_flag=True, help='Record mismatches as correction movements')
+@click.option('--force', is_flag=True, help='Run even if it already ran today')
+def stock_ledger_command(repair, force):
+    """Compact old stock movements and check every product's balance against the ledger"""
+    outcome = run_stock_ledger_job(app.config['STOCK_LEDGER_KEEP_DAYS'], repair=repair, force=force)
+    if outcome is None:
+        print("Stock ledger job already ran today, skipping.")
+        return
+    removed, mismatches = outcome
+    print(f"Compacted {removed} stock movement(s) older than {app.config['STOCK_LEDGER_KEEP_DAYS']} days.")
+    for p_id, stock, total in mismatches:
+        print(f"{p_id}: stock {stock}, ledger {total}" + (" (corrected)" if repair else ""))
+    if not mismatches:
+        print("Every product's stock matches its ledger.")
+
 @app.errorhandler(500)
 def handle_internal_error(error):
     flash('An unexpected error occurred. Please try again later.', 'error')
@@ -1668,7 +2050,8 @@ def auto_seed():
                 prod = Product.query.filter_by(p_price=Decimal(str(price)), s_id="DEMO01").first()
                 if prod:
                     db.session.add(InvoiceItem(invoice_no=inv_no, p_id=prod.p_id,
-                                               item_quantity=qty, discount=Decimal(str(disc))))
+                                               item_quantity=qty, discount=Decimal(str(disc)),
+                                               unit_price=prod.p_price, p_name=prod.p_name))
 
         # Paid invoices (revenue already collected)
         make_invoice("INV-2024-001", "DC001", "paid",    90, [(1299, 2, 0),   (999, 1, 0)])
@@ -1727,10 +2110,16 @@ def auto_seed():
 with app.app_context():
     migrate_database()
     db.create_all()
+    ensure_search_index()
     auto_seed()
+    rebuild_all_seller_stats(missing_only=True)
+    backfill_opening_balances()
+
+if app.config.get('OVERDUE_SWEEP_INTERVAL'):
+    start_background_sweeper(app, app.config['OVERDUE_SWEEP_INTERVAL'])
 
 if __name__ == '__main__':
     import os
     port = int(os.environ.get('PORT', 5000))
     app.run(debug=False, host='0.0.0.0', port=port)
-
\ No newline at end of file
+
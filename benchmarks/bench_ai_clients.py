@@ -0,0 +1,107 @@
+"""Provider call latency, per request vs shared client, against a local stub server.
+
+"per-request" is the old call path: load_dotenv(override=True) and a bare
+requests.post, so every call opens a new connection (and TLS handshake with
+--tls). "shared" goes through ai_clients: keys read once and the pooled
+keep-alive session.
+
+    python benchmarks/bench_ai_clients.py [--requests 500] [--tls]
+"""
+import argparse
+import json
+import os
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+import urllib3
+from dotenv import load_dotenv
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ai_clients import get_api_keys, http_session  # noqa: E402
+
+REPLY = json.dumps({'choices': [{'message': {'content': json.dumps({
+    'intent': 'navigation', 'data': {'target': 'dashboard'}, 'missing_info': None,
+    'response_text': 'Opening the dashboard.'})}}]}).encode()
+PAYLOAD = {'model': 'stub', 'messages': [{'role': 'user', 'content': 'open dashboard'}]}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(REPLY)))
+        self.end_headers()
+        self.wfile.write(REPLY)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub(tls):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    scheme = 'http'
+    if tls:
+        workdir = tempfile.mkdtemp()
+        cert, key = os.path.join(workdir, 'cert.pem'), os.path.join(workdir, 'key.pem')
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj',
+                        '/CN=127.0.0.1', '-keyout', key, '-out', cert], check=True, capture_output=True)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = 'https'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'{scheme}://127.0.0.1:{server.server_port}/openai/v1/chat/completions'
+
+
+def per_request(url):
+    load_dotenv(override=True)
+    return requests.post(url, json=PAYLOAD, timeout=10, verify=False)
+
+
+def shared(url):
+    get_api_keys()
+    return http_session().post(url, json=PAYLOAD, timeout=10, verify=False)
+
+
+def measure(call, url, count):
+    call(url)  # warm-up (opens the pooled connection for the shared client)
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        call(url).json()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--tls', action='store_true', help='serve HTTPS with a throwaway self-signed certificate')
+    args = parser.parse_args()
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    server, url = start_stub(args.tls)
+    try:
+        for label, call in (('per-request', per_request), ('shared', shared)):
+            p50, p99 = measure(call, url, args.requests)
+            print(f"{label:12} p50 {p50:7.2f} ms   p99 {p99:7.2f} ms")
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
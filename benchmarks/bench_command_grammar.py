@@ -0,0 +1,53 @@
+"""Throughput and latency of the offline command grammar over benchmarks/corpus/commands.tsv.
+
+    python benchmarks/bench_command_grammar.py [--rounds 200]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from command_grammar import GRAMMAR_MIN_CONFIDENCE, parse_structured_command  # noqa: E402
+
+CORPUS = os.path.join(ROOT, 'benchmarks', 'corpus', 'commands.tsv')
+
+
+def load_corpus(path=CORPUS):
+    commands = []
+    with open(path, encoding='utf-8') as corpus:
+        for line in corpus:
+            if line.strip() and not line.startswith('#'):
+                language, text = line.rstrip('\n').split('\t', 1)
+                commands.append((text, language))
+    return commands
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    commands = load_corpus()
+    confident = sum(parse_structured_command(text, language)[1] >= GRAMMAR_MIN_CONFIDENCE
+                    for text, language in commands)
+    timings = []
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        for text, language in commands:
+            t0 = time.perf_counter()
+            parse_structured_command(text, language)
+            timings.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+
+    timings.sort()
+    print(f"{len(commands)} commands, {confident} parsed confidently (>= {GRAMMAR_MIN_CONFIDENCE})")
+    print(f"{len(timings) / elapsed:,.0f} commands/s over {args.rounds} rounds")
+    print(f"p50 {statistics.median(timings) * 1e6:.1f} µs, p99 {timings[int(len(timings) * 0.99)] * 1e6:.1f} µs")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Micro-benchmark of the heuristic router's phrase matching.
+
+Compares the single named-group navigation scan with one regex per target,
+and times route_heuristically end to end over benchmarks/corpus/commands.tsv.
+
+    python benchmarks/bench_heuristic_router.py [--number 2000]
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ai_service import NAV_TARGETS, match_nav_target, route_heuristically, _alternation  # noqa: E402
+from bench_command_grammar import load_corpus  # noqa: E402
+
+STATS = {'revenue': 0.0, 'invoices_count': 0, 'customers_count': 0, 'products_count': 0,
+         'low_stock': [], 'top_selling': [], 'recent_invoices': []}
+
+PER_TARGET = [(target, re.compile(_alternation(phrases))) for target, phrases in NAV_TARGETS.items()]
+
+
+def match_per_target(text_lower):
+    for target, pattern in PER_TARGET:
+        if pattern.search(text_lower):
+            return target
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=2000)
+    args = parser.parse_args()
+
+    texts = [(text.lower(), language) for text, language in load_corpus()]
+    texts += [(phrase.lower(), 'en-IN') for phrases in NAV_TARGETS.values() for phrase in phrases[:2]]
+    mismatched = [text for text, _ in texts if match_nav_target(text) != match_per_target(text)]
+    if mismatched:
+        print(f"Results differ for {len(mismatched)} texts, e.g. {mismatched[0]!r}")
+
+    lookups = len(texts) * args.number
+    for label, match in (('one scan, named groups', match_nav_target), ('one regex per target', match_per_target)):
+        seconds = timeit.timeit(lambda: [match(text) for text, _ in texts], number=args.number)
+        print(f"{label:24} {seconds / lookups * 1e9:8.0f} ns/lookup")
+
+    context = {'stats': STATS}
+    number = max(1, args.number // 10)
+    seconds = timeit.timeit(lambda: [route_heuristically(text, context, language) for text, language in texts],
+                            number=number)
+    print(f"{'route_heuristically':24} {seconds / (len(texts) * number) * 1e6:8.1f} µs/command")
+
+
+if __name__ == '__main__':
+    main()
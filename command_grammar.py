@@ -0,0 +1,348 @@
+"""Offline slot-filling grammar for the structured add_product / add_customer
+commands, e.g. "add product Milk price 50 stock 100" or
+"ग्राहक जोड़ो राहुल ईमेल rahul@example.com", in every assistant language.
+
+parse_structured_command() returns the same result dict the model would
+produce plus a confidence in [0, 1]. Confident parses skip the model
+entirely; uncertain ones are only used when no model is configured.
+"""
+import os
+import re
+
+GRAMMAR_MIN_CONFIDENCE = float(os.environ.get('AI_GRAMMAR_MIN_CONFIDENCE', 0.8))
+# Below this a parse is discarded even when no model is available
+GRAMMAR_FALLBACK_CONFIDENCE = 0.4
+
+ADD_VERBS = [
+    'add', 'create', 'register', 'new',
+    'जोड़ो', 'जोड़ें', 'जोड़िए', 'जोड़', 'जोडो', 'जोडें', 'बनाओ', 'बनाएं', 'नया', 'नई', 'ऐड',
+    'ajouter', 'ajoute', 'ajoutez', 'créer', 'crée', 'créez', 'nouveau', 'nouvelle',
+    'agregar', 'agrega', 'agregue', 'añadir', 'añade', 'añada', 'crear', 'crea', 'nuevo', 'nueva', 'registrar',
+    'hinzufügen', 'füge', 'fügen', 'erstellen', 'erstelle', 'anlegen', 'lege', 'neu', 'neue', 'neuen', 'neuer',
+    '追加', '登録', '新規', '作成',
+]
+ENTITY_WORDS = {
+    'add_product': [
+        'product', 'item',
+        'प्रोडक्ट', 'उत्पाद', 'सामान', 'आइटम',
+        'produit', 'article',
+        'producto', 'artículo',
+        'produkt', 'artikel',
+        '商品', '製品',
+    ],
+    'add_customer': [
+        'customer', 'client',
+        'ग्राहक', 'कस्टमर',
+        'cliente',
+        'kunde', 'kunden', 'kundin',
+        '顧客', 'お客様',
+    ],
+}
+POLITE_WORDS = ['please', 'कृपया', "s'il vous plaît", 'por favor', 'bitte', 'ください', 'してください']
+
+# slot -> keywords introducing its value
+SLOT_WORDS = {
+    'price': ['price', 'cost', 'rate', 'mrp', 'कीमत', 'दाम', 'मूल्य', 'रेट', 'प्राइस',
+              'prix', 'tarif', 'precio', 'costo', 'preis', '価格', '値段', '単価'],
+    'stock': ['stock', 'quantity', 'qty', 'स्टॉक', 'मात्रा', 'quantité', 'existencias', 'cantidad', 'inventario',
+              'bestand', 'lagerbestand', 'lager', 'menge', '在庫', '数量'],
+    'description': ['description', 'desc', 'विवरण', 'descripción', 'beschreibung', '説明'],
+    'email': ['email', 'e-mail', 'mail', 'ईमेल', 'courriel', 'correo', 'メール'],
+    'phone': ['phone', 'mobile', 'contact', 'फोन', 'फ़ोन', 'मोबाइल', 'नंबर', 'téléphone', 'portable',
+              'teléfono', 'móvil', 'celular', 'telefon', 'handy', '電話', '携帯'],
+    'address': ['address', 'पता', 'adresse', 'dirección', 'anschrift', '住所'],
+}
+INTENT_SLOTS = {
+    'add_product': ('price', 'stock', 'description'),
+    'add_customer': ('email', 'phone', 'address'),
+}
+
+# Words dropped from the edges of a name or value ("a new product called Milk")
+FILLER_WORDS = {
+    'a', 'an', 'the', 'called', 'named', 'name', 'with', 'and', 'of', 'is', 'as', 'to', 'at', 'for',
+    'नाम', 'का', 'की', 'के', 'है', 'वाला', 'वाली', 'और', 'करो', 'करें', 'कीजिए', 'में', 'से',
+    'un', 'une', 'le', 'la', 'nommé', 'nommée', 'appelé', 'appelée', 'avec', 'et', 'nom', 'de', 'du', 'à',
+    'una', 'el', 'llamado', 'llamada', 'con', 'y', 'nombre', 'del', 'a',
+    'ein', 'eine', 'einen', 'namens', 'mit', 'und', 'hinzu', 'als', 'von', 'zu',
+}
+# Japanese particles dropped from the end of a name ("牛乳を")
+JA_PARTICLES = ('として', 'を', 'は', 'の', 'に', 'で', 'と', '、', '。', '：', ':')
+# Tokens that may accompany a price or stock figure
+UNIT_WORDS = {
+    'rs', 'rs.', 'inr', 'rupees', 'rupee', '₹', 'रुपये', 'रुपए', 'रु', 'euros', 'euro', '€', '$', 'dollars',
+    '円', 'yen', 'units', 'unit', 'pcs', 'pieces', 'piece', 'नग', 'पीस', 'unités', 'piezas', 'unidades',
+    'stück', 'einheiten', '個', '本', '点', 'each', 'per',
+}
+# Words that mean a name has swallowed more than a name ("Milk for 50 rupees",
+# "Milk to invoice 4", "the bill"): linking words and references to documents
+NAME_LINK_WORDS = {
+    'for', 'to', 'on', 'into', 'onto', 'in', 'लिए', 'में', 'pour', 'sur', 'dans', 'para', 'für', 'auf', 'zur', 'zum',
+}
+DOCUMENT_WORDS = {
+    'invoice', 'invoices', 'bill', 'bills', 'receipt', 'बिल', 'इनवॉइस', 'चालान', 'facture', 'factura', 'rechnung',
+    '請求書', 'インボイス',
+}
+QUESTION_WORDS = {'how', 'what', 'why', 'can', 'should', 'कैसे', 'क्या', 'क्यों', 'comment', 'pourquoi',
+                  'cómo', 'qué', 'por qué', 'wie', 'was', 'warum', 'どう', 'どうやって', '何'}
+
+REPLIES = {
+    'add_product': {
+        'hi-IN': 'उत्पाद "{name}" जोड़ रहा हूँ।',
+        'fr-FR': 'J\'ajoute le produit « {name} ».',
+        'es-ES': 'Agregando el producto "{name}".',
+        'de-DE': 'Ich füge das Produkt „{name}" hinzu.',
+        'ja-JP': '商品「{name}」を追加します。',
+        'default': 'Adding product "{name}".',
+    },
+    'add_customer': {
+        'hi-IN': 'ग्राहक "{name}" जोड़ रहा हूँ।',
+        'fr-FR': 'J\'ajoute le client « {name} ».',
+        'es-ES': 'Agregando el cliente "{name}".',
+        'de-DE': 'Ich füge den Kunden „{name}" hinzu.',
+        'ja-JP': '顧客「{name}」を追加します。',
+        'default': 'Adding customer "{name}".',
+    },
+    'missing_email': {
+        'hi-IN': '{name} का ईमेल पता क्या है?',
+        'fr-FR': 'Quelle est l\'adresse e-mail de {name} ?',
+        'es-ES': '¿Cuál es el correo electrónico de {name}?',
+        'de-DE': 'Wie lautet die E-Mail-Adresse von {name}?',
+        'ja-JP': '{name}様のメールアドレスを教えてください。',
+        'default': 'What is the email address of {name}?',
+    },
+}
+
+
+def _is_spaced(word):
+    """Words of space-separated scripts get word-boundary matching; CJK words do not"""
+    return not re.search(r'[぀-ヿ一-鿿]', word)
+
+
+def _keyword_pattern(words):
+    alternatives = []
+    for word in sorted(set(words), key=len, reverse=True):
+        escaped = re.escape(word.lower())
+        alternatives.append(rf'(?<![\w@.]){escaped}(?![\w@])' if _is_spaced(word) else escaped)
+    return re.compile('|'.join(alternatives))
+
+
+VERB_PATTERN = _keyword_pattern(ADD_VERBS)
+ENTITY_PATTERNS = {intent: _keyword_pattern(words) for intent, words in ENTITY_WORDS.items()}
+POLITE_PATTERN = _keyword_pattern(POLITE_WORDS)
+SLOT_PATTERNS = {slot: _keyword_pattern(words) for slot, words in SLOT_WORDS.items()}
+QUESTION_PATTERN = _keyword_pattern(QUESTION_WORDS)
+
+EMAIL_PATTERN = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+PHONE_PATTERN = re.compile(r'\+?\d[\d\s-]{5,}\d')
+NUMBER_PATTERN = re.compile(r'(?:(?<=\s)|^)[-−]?\d[\d.,]*|\d[\d.,]*')
+# Languages written with a decimal comma ("12,5") and dot thousands ("1.299")
+DECIMAL_COMMA_LANGUAGES = ('fr', 'es', 'de')
+# Thousands grouping with commas, including lakh style ("12,000", "1,00,000")
+_COMMA_GROUPED = re.compile(r'\d{1,3}(?:,\d{2,3})*,\d{3}(?:\.\d+)?')
+_DOT_GROUPED = re.compile(r'\d{1,3}(?:\.\d{3})+(?:,\d+)?')
+# Confidence lost for a number that could be read two ways, or is negative / fractional
+# where it can't be: enough to go below the no-model fallback as well
+DOUBTFUL_NUMBER_PENALTY = 0.7
+# Confidence lost for digits in a name ("iPhone 15" is fine, but the model should confirm)
+NAME_DIGIT_PENALTY = 0.3
+# Confidence lost for a name holding unit, linking or document words: too low even without a model
+NAME_JUNK_PENALTY = 0.7
+_EDGE_PUNCTUATION = ' ,;:-–—"\'“”«»„「」.।。'
+
+
+def _strip_fillers(text):
+    """Drop filler words from both ends of a name or value (and trailing particles)"""
+    text = text.strip(_EDGE_PUNCTUATION)
+    changed = True
+    while text and changed:
+        changed = False
+        words = text.split()
+        if words and words[0].lower() in FILLER_WORDS:
+            words, changed = words[1:], True
+        if words and words[-1].lower() in FILLER_WORDS:
+            words, changed = words[:-1], True
+        text = ' '.join(words)
+        for particle in JA_PARTICLES:
+            if text.endswith(particle):
+                text, changed = text[:-len(particle)], True
+        text = text.strip(_EDGE_PUNCTUATION)
+    return text
+
+
+def _leftover_words(text):
+    """Words in a value segment that nothing accounts for"""
+    return [word for word in _strip_fillers(text).split()
+            if word.lower() not in FILLER_WORDS and word.lower() not in UNIT_WORDS]
+
+
+def _read_number(raw, decimal_comma):
+    """(value, doubtful) for a digit string with separators, value None if unreadable"""
+    if re.fullmatch(r'\d+', raw):
+        return float(raw), False
+    if decimal_comma:
+        if _DOT_GROUPED.fullmatch(raw):
+            return float(raw.replace('.', '').replace(',', '.')), False
+        if re.fullmatch(r'\d+,\d+', raw):
+            # "1,000" may still be an English-style thousands figure
+            return float(raw.replace(',', '.')), bool(re.fullmatch(r'\d+,\d{3}', raw))
+        if re.fullmatch(r'\d+\.\d+', raw):
+            return float(raw), False
+        if _COMMA_GROUPED.fullmatch(raw):
+            return float(raw.replace(',', '')), True
+        return None, True
+    if _COMMA_GROUPED.fullmatch(raw):
+        return float(raw.replace(',', '')), False
+    if re.fullmatch(r'\d+\.\d+', raw):
+        return float(raw), False
+    if re.fullmatch(r'\d+,\d+', raw):
+        # "12,5": a decimal comma, or a typo'd grouping
+        return float(raw.replace(',', '.')), True
+    return None, True
+
+
+def _number(segment, language, integer=False):
+    """(value, confidence penalty) for the first number in segment; value None if there is
+    no usable number. Leftover words, negative, ambiguous and fractional counts cost confidence."""
+    match = NUMBER_PATTERN.search(segment)
+    if not match:
+        return None, 0.5 + 0.15 * len(_leftover_words(segment))
+    rest = segment[:match.start()] + ' ' + segment[match.end():]
+    penalty = 0.15 * len(_leftover_words(rest))
+    raw = match.group().rstrip('.,')
+    if raw[0] in '-−':
+        return None, penalty + DOUBTFUL_NUMBER_PENALTY
+    value, doubtful = _read_number(raw, language.split('-')[0].lower() in DECIMAL_COMMA_LANGUAGES)
+    if value is None:
+        return None, penalty + DOUBTFUL_NUMBER_PENALTY
+    if integer:
+        doubtful = doubtful or value != int(value)
+        value = int(value)
+    if doubtful:
+        penalty += DOUBTFUL_NUMBER_PENALTY
+    return value, penalty
+
+
+def _name_penalty(name):
+    """Confidence lost for a name that probably holds a price, quantity or target as well"""
+    penalty = NAME_DIGIT_PENALTY if re.search(r'\d', name) else 0.0
+    words = {word.strip(_EDGE_PUNCTUATION) for word in name.lower().split()}
+    if words & (UNIT_WORDS | NAME_LINK_WORDS | DOCUMENT_WORDS):
+        penalty += NAME_JUNK_PENALTY
+    return penalty
+
+
+def _detect_intent(lower):
+    """add_product / add_customer when the text has an add verb and an entity word
+    (the first entity word decides), else None"""
+    if not VERB_PATTERN.search(lower):
+        return None
+    found = []
+    for intent, pattern in ENTITY_PATTERNS.items():
+        match = pattern.search(lower)
+        if match:
+            found.append((match.start(), intent))
+    return min(found)[1] if found else None
+
+
+def parse_structured_command(user_text, language='en-IN'):
+    """(result, confidence) for an add_product / add_customer command, or (None, 0.0)"""
+    text = ' '.join((user_text or '').split())
+    lower = text.lower()
+    if len(lower) != len(text):
+        text = lower
+    intent = _detect_intent(lower)
+    if intent is None:
+        return None, 0.0
+    confidence = 1.0
+
+    # Slot keywords belonging to this intent, in order of appearance
+    slots = sorted(
+        (m.start(), m.end(), slot)
+        for slot in INTENT_SLOTS[intent]
+        for m in SLOT_PATTERNS[slot].finditer(lower)
+    )
+    # A keyword inside an e-mail address ("mail" in gmail.com) is not a keyword
+    emails = [m.span() for m in EMAIL_PATTERN.finditer(lower)]
+    slots = [s for s in slots if not any(start <= s[0] < end for start, end in emails)]
+
+    head_end = slots[0][0] if slots else len(text)
+    values = {}
+    for i, (start, end, slot) in enumerate(slots):
+        segment_end = slots[i + 1][0] if i + 1 < len(slots) else len(text)
+        if slot in values:
+            confidence -= 0.3
+        values[slot] = text[end:segment_end]
+
+    # Name: what is left of the head once command words are masked out
+    masked = list(text[:head_end])
+    for pattern in (VERB_PATTERN, ENTITY_PATTERNS[intent], POLITE_PATTERN):
+        for m in pattern.finditer(lower[:head_end]):
+            masked[m.start():m.end()] = ' ' * (m.end() - m.start())
+    head = ''.join(masked)
+    if intent == 'add_customer':
+        for m in EMAIL_PATTERN.finditer(head):
+            values.setdefault('email', m.group())
+            head = head[:m.start()] + ' ' * len(m.group()) + head[m.end():]
+    runs = [run for run in (_strip_fillers(part) for part in re.split(r'\s{2,}', head)) if run]
+    name = runs[0] if runs else ''
+    if len(runs) > 1:
+        # Name split around a command word: join if short, else unclear
+        name = ' '.join(runs)
+        confidence -= 0.3
+
+    if not name:
+        confidence = min(confidence, 0.3)
+    elif len(name.split()) > 5:
+        confidence -= 0.3
+    elif NUMBER_PATTERN.fullmatch(name):
+        confidence -= 0.5
+    else:
+        confidence -= _name_penalty(name)
+    if '?' in text or '？' in text or QUESTION_PATTERN.match(lower):
+        confidence -= 0.6
+
+    if intent == 'add_product':
+        data = {"name": name, "price": 0.0, "stock": 0, "description": ""}
+        if 'price' in values:
+            price, penalty = _number(values['price'], language)
+            if price is not None:
+                data['price'] = price
+            confidence -= penalty
+        if 'stock' in values:
+            stock, penalty = _number(values['stock'], language, integer=True)
+            if stock is not None:
+                data['stock'] = stock
+            confidence -= penalty
+        if 'description' in values:
+            data['description'] = _strip_fillers(values['description'])
+    else:
+        data = {"name": name, "email": "", "phone": "", "address": ""}
+        if 'email' in values:
+            email = EMAIL_PATTERN.search(values['email'])
+            if email:
+                data['email'] = email.group()
+                confidence -= 0.15 * len(_leftover_words(values['email'].replace(email.group(), ' ')))
+            else:
+                confidence -= 0.4
+        else:
+            confidence -= 0.3
+        if 'phone' in values:
+            phone = PHONE_PATTERN.search(values['phone'])
+            if phone:
+                data['phone'] = re.sub(r'[\s-]', '', phone.group())
+            else:
+                confidence -= 0.3
+        if 'address' in values:
+            data['address'] = _strip_fillers(values['address'])
+
+    replies = REPLIES[intent]
+    result = {
+        "intent": intent,
+        "data": data,
+        "missing_info": None,
+        "response_text": replies.get(language, replies['default']).format(name=name)
+    }
+    if intent == 'add_customer' and name and not data['email']:
+        question = REPLIES['missing_email']
+        result['missing_info'] = question.get(language, question['default']).format(name=name)
+    return result, max(0.0, min(1.0, confidence))
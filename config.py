@@ -33,5 +33,56 @@ class Config:
             
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # ID allocation: numbers reserved per worker round trip (MySQL/PostgreSQL only)
+    ID_BLOCK_SIZE = int(os.environ.get('ID_BLOCK_SIZE', 1))
+    # Number invoices per seller (INV-<seller>-001) instead of one global INV-### series
+    INVOICE_NUMBERS_PER_SELLER = os.environ.get('INVOICE_NUMBERS_PER_SELLER', 'False').lower() == 'true'
+    
     # Other configurations
     DEBUG = os.environ.get('FLASK_DEBUG', 'True').lower() == 'true'
+    
+    # Invoice list pagination
+    INVOICES_PAGE_SIZE = int(os.environ.get('INVOICES_PAGE_SIZE', 25))
+    INVOICES_MAX_PAGE_SIZE = 200
+    
+    # Catalogs larger than this send only the best search matches to the AI
+    AI_CONTEXT_MAX_ENTITIES = int(os.environ.get('AI_CONTEXT_MAX_ENTITIES', 200))
+    # Per-seller AI context cache (entries also drop when the seller's data changes)
+    AI_CONTEXT_CACHE_SIZE = int(os.environ.get('AI_CONTEXT_CACHE_SIZE', 256))
+    AI_CONTEXT_CACHE_TTL = int(os.environ.get('AI_CONTEXT_CACHE_TTL', 300))
+    
+    # Async AI assistant jobs: worker threads, queue bound, per-seller cap,
+    # and how long finished results stay available for polling (seconds).
+    # Job state is kept in the ai_job table, so polls work across gunicorn workers
+    AI_ASYNC_JOBS = os.environ.get('AI_ASYNC_JOBS', 'True').lower() == 'true'
+    AI_JOB_WORKERS = int(os.environ.get('AI_JOB_WORKERS', 4))
+    AI_JOB_QUEUE_SIZE = int(os.environ.get('AI_JOB_QUEUE_SIZE', 32))
+    AI_JOB_PER_SELLER = int(os.environ.get('AI_JOB_PER_SELLER', 2))
+    AI_JOB_RESULT_TTL = int(os.environ.get('AI_JOB_RESULT_TTL', 300))
+    
+    # Activity log writes: 'transaction' commits events with the request's own
+    # changes; 'async' batches them from a bounded queue on a background thread.
+    # ACTIVITY_DURABILITY 'strict' writes inline when the queue is full and retries
+    # failed batches row by row; 'relaxed' drops those events instead.
+    ACTIVITY_SINK_MODE = os.environ.get('ACTIVITY_SINK_MODE', 'transaction')
+    ACTIVITY_DURABILITY = os.environ.get('ACTIVITY_DURABILITY', 'strict')
+    ACTIVITY_QUEUE_SIZE = int(os.environ.get('ACTIVITY_QUEUE_SIZE', 1000))
+    ACTIVITY_BATCH_SIZE = int(os.environ.get('ACTIVITY_BATCH_SIZE', 100))
+    ACTIVITY_FLUSH_INTERVAL = float(os.environ.get('ACTIVITY_FLUSH_INTERVAL', 1.0))
+    
+    # Activity retention (`flask archive-activity`): months kept in the hot activity
+    # table besides the current one, months kept as monthly tables before their
+    # events are archived to gzipped JSONL and reduced to daily counts
+    ACTIVITY_HOT_MONTHS = int(os.environ.get('ACTIVITY_HOT_MONTHS', 1))
+    ACTIVITY_RETENTION_MONTHS = int(os.environ.get('ACTIVITY_RETENTION_MONTHS', 12))
+    ACTIVITY_ARCHIVE_DIR = os.environ.get('ACTIVITY_ARCHIVE_DIR', 'archive/activity')
+    
+    # Stock ledger (`flask stock-ledger`): movements older than this many days are
+    # folded into one row per product; point-in-time stock is exact after that
+    STOCK_LEDGER_KEEP_DAYS = int(os.environ.get('STOCK_LEDGER_KEEP_DAYS', 365))
+    
+    # Seconds between background overdue-sweep attempts (0 = rely on `flask sweep-overdue` / cron)
+    OVERDUE_SWEEP_INTERVAL = int(os.environ.get('OVERDUE_SWEEP_INTERVAL', 0))
+    
+    # Raise when a relationship lazy-loads while a template renders (use in tests)
+    LAZY_LOAD_GUARD = os.environ.get('LAZY_LOAD_GUARD', 'False').lower() == 'true'
@@ -1,35 +1,285 @@
 import mysql.connector
 import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 from mysql.connector import Error
 
+# Pool tuning (all optional, read once at import)
+POOL_SIZE = int(os.environ.get('MYSQL_POOL_SIZE', 5))
+POOL_MAX_OVERFLOW = int(os.environ.get('MYSQL_POOL_MAX_OVERFLOW', 10))
+POOL_TIMEOUT = float(os.environ.get('MYSQL_POOL_TIMEOUT', 30))
+POOL_RECYCLE = int(os.environ.get('MYSQL_POOL_RECYCLE', 1800))
+POOL_PRE_PING = os.environ.get('MYSQL_POOL_PRE_PING', 'True').lower() == 'true'
+
+
+class PoolTimeoutError(Error):
+    """Raised when no pooled connection became available within the timeout"""
+
+
+def _connect(database=True):
+    params = {
+        'host': os.environ.get('MYSQL_HOST', 'localhost'),
+        'user': os.environ.get('MYSQL_USER', 'root'),
+        'password': os.environ.get('MYSQL_PASSWORD', ''),
+    }
+    if database:
+        params['database'] = os.environ.get('MYSQL_DB', 'inventory_db')
+    return mysql.connector.connect(**params)
+
+
+class PooledConnection:
+    """Proxy around a raw connection; close() hands it back to the pool instead of closing it.
+
+    When the connection belongs to a connection_scope(), commit() and close() are
+    deferred to the scope so every query inside it shares one transaction, and
+    rollback() marks that transaction to be rolled back when the scope exits.
+    """
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = time.monotonic()
+        self._scoped = False
+        self._rollback_only = False
+        self._checked_out = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def cursor(self, *args, **kwargs):
+        return self._raw.cursor(*args, **kwargs)
+
+    def commit(self):
+        if not self._scoped:
+            self._raw.commit()
+
+    def rollback(self):
+        if self._scoped:
+            # A helper gave up on its writes: the scope must not commit them
+            self._rollback_only = True
+        else:
+            self._raw.rollback()
+
+    def close(self):
+        if not self._scoped and self._checked_out:
+            self._pool.checkin(self)
+
+
+class ConnectionPool:
+    """Thread-safe pool with overflow, health check on checkout and idle recycling"""
+
+    def __init__(self, creator, size=POOL_SIZE, max_overflow=POOL_MAX_OVERFLOW,
+                 timeout=POOL_TIMEOUT, recycle=POOL_RECYCLE, pre_ping=POOL_PRE_PING):
+        self._creator = creator
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self._idle = deque()
+        self._opened = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time': 0.0,
+            'timeouts': 0,
+            'recycled': 0,
+            'invalidated': 0,
+        }
+
+    def _is_stale(self, conn):
+        reason = None
+        if self.recycle and time.monotonic() - conn._created_at > self.recycle:
+            reason = 'recycled'
+        elif self.pre_ping:
+            try:
+                conn._raw.ping(reconnect=False)
+            except Exception:
+                reason = 'invalidated'
+        if reason is None:
+            return False
+        with self._cond:
+            self._stats[reason] += 1
+        return True
+
+    def _discard(self, conn):
+        try:
+            conn._raw.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._opened -= 1
+            self._cond.notify()
+
+    def checkout(self):
+        deadline = time.monotonic() + self.timeout
+        waited_since = None
+        while True:
+            conn = None
+            create = False
+            with self._cond:
+                if self._idle:
+                    conn = self._idle.pop()
+                elif self._opened < self.size + self.max_overflow:
+                    self._opened += 1
+                    create = True
+                else:
+                    if waited_since is None:
+                        waited_since = time.monotonic()
+                        self._stats['waits'] += 1
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        self._stats['wait_time'] += time.monotonic() - waited_since
+                        raise PoolTimeoutError(msg=f"Connection pool exhausted after {self.timeout}s")
+                    self._cond.wait(remaining)
+                    continue
+
+            if create:
+                try:
+                    conn = PooledConnection(self, self._creator())
+                except Exception:
+                    with self._cond:
+                        self._opened -= 1
+                        self._cond.notify()
+                    raise
+            elif self._is_stale(conn):
+                self._discard(conn)
+                continue
+
+            with self._cond:
+                self._stats['checkouts'] += 1
+                if waited_since is not None:
+                    self._stats['wait_time'] += time.monotonic() - waited_since
+            conn._checked_out = True
+            return conn
+
+    def checkin(self, conn):
+        conn._checked_out = False
+        conn._scoped = False
+        conn._rollback_only = False
+        try:
+            # Never hand out a connection with a half-finished transaction
+            if conn._raw.in_transaction:
+                conn._raw.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        with self._cond:
+            if len(self._idle) < self.size:
+                self._idle.append(conn)
+                self._cond.notify()
+                return
+        self._discard(conn)
+
+    def dispose(self):
+        """Close every idle connection (checked-out ones are closed on checkin)"""
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for conn in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'opened': self._opened,
+                'idle': len(self._idle),
+                'checked_out': self._opened - len(self._idle),
+                'overflow': max(0, self._opened - self.size),
+            })
+        return stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(_connect)
+    return _pool
+
+
+def get_pool_stats():
+    """Pool counters for monitoring (checked out, waits, wait time, ...)"""
+    return get_pool().stats()
+
+
+def dispose_pool():
+    if _pool is not None:
+        _pool.dispose()
+
+
 def get_db_connection():
-    """Create a connection to the MySQL database"""
+    """Check out a pooled connection to the MySQL database.
+
+    Inside connection_scope() the scope's connection is returned so callers share it.
+    """
+    scoped = getattr(_local, 'connection', None)
+    if scoped is not None:
+        return scoped
     try:
-        connection = mysql.connector.connect(
-            host=os.environ.get('MYSQL_HOST', 'localhost'),
-            user=os.environ.get('MYSQL_USER', 'root'),
-            password=os.environ.get('MYSQL_PASSWORD', ''),
-            database=os.environ.get('MYSQL_DB', 'inventory_db')
-        )
-        return connection
+        return get_pool().checkout()
     except Error as e:
         print(f"Error connecting to MySQL: {e}")
         return None
 
+
+@contextmanager
+def connection_scope():
+    """Share one pooled connection and one transaction across several query helpers.
+
+    Commits when the block exits cleanly, rolls back on error or when a helper
+    called rollback() inside it. Nested scopes join the outermost one; an error
+    raised out of a nested scope also rolls the outer one back, even if the
+    caller catches it.
+    """
+    scoped = getattr(_local, 'connection', None)
+    if scoped is not None:
+        try:
+            yield scoped
+        except Exception:
+            scoped._rollback_only = True
+            raise
+        return
+
+    conn = get_pool().checkout()
+    conn._scoped = True
+    _local.connection = conn
+    try:
+        yield conn
+        if conn._rollback_only:
+            conn._raw.rollback()
+        else:
+            conn._raw.commit()
+    except Exception:
+        conn._raw.rollback()
+        raise
+    finally:
+        _local.connection = None
+        conn._pool.checkin(conn)
+
+
 def init_db():
     """Initialize the database with schema"""
     # Connect without database to create it if it doesn't exist
     try:
-        conn = mysql.connector.connect(
-            host=os.environ.get('MYSQL_HOST', 'localhost'),
-            user=os.environ.get('MYSQL_USER', 'root'),
-            password=os.environ.get('MYSQL_PASSWORD', '')
-        )
+        conn = _connect(database=False)
         cursor = conn.cursor()
         db_name = os.environ.get('MYSQL_DB', 'inventory_db')
         cursor.execute(f"CREATE DATABASE IF NOT EXISTS {db_name}")
         conn.close()
-        
+
         # Now connect to the database and run schema
         conn = get_db_connection()
         if conn:
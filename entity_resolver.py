@@ -0,0 +1,297 @@
+"""In-process fuzzy matching of spoken product and customer names.
+
+Each seller gets a trigram index over p_name and c_name. Names are folded
+to a common spelling first (Devanagari transliterated to Latin letters,
+accents and doubled vowels collapsed), so "राहुल" finds "Rahul" and "doodh"
+finds "Dudh". Candidates sharing trigrams with the query are ranked by edit
+distance. An index is built from the database on first use and rebuilt
+when the seller's seller_stats.version has moved on, so writes made by any
+worker are picked up on the next lookup (as SellerAIContext does).
+"""
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+
+from caching import LRUCache
+from models import Product, Customer
+from stats import get_stats_version
+
+RESOLVER_MIN_SCORE = float(os.environ.get('AI_RESOLVER_MIN_SCORE', 0.75))
+# The best match must beat the runner-up by this much, or the name is ambiguous
+RESOLVER_MARGIN = float(os.environ.get('AI_RESOLVER_MARGIN', 0.05))
+RESOLVER_CACHE_SIZE = int(os.environ.get('AI_RESOLVER_CACHE_SIZE', 256))
+# Indexes are also rebuilt after this many seconds, for writes that did not bump the seller's version
+RESOLVER_TTL = int(os.environ.get('AI_RESOLVER_TTL', 3600))
+
+# Candidates (by shared trigrams) scored with edit distance per lookup
+MAX_CANDIDATES = 25
+# A match on only some of a name's words scores at most this
+PARTIAL_MATCH_WEIGHT = 0.9
+
+# kind -> (model, id column, name column)
+ENTITY_KINDS = {
+    'product': (Product, 'p_id', 'p_name'),
+    'customer': (Customer, 'c_id', 'c_name'),
+}
+
+_CONSONANTS = {
+    'क': 'k', 'ख': 'kh', 'ग': 'g', 'घ': 'gh', 'ङ': 'n',
+    'च': 'ch', 'छ': 'chh', 'ज': 'j', 'झ': 'jh', 'ञ': 'n',
+    'ट': 't', 'ठ': 'th', 'ड': 'd', 'ढ': 'dh', 'ण': 'n',
+    'त': 't', 'थ': 'th', 'द': 'd', 'ध': 'dh', 'न': 'n',
+    'प': 'p', 'फ': 'ph', 'ब': 'b', 'भ': 'bh', 'म': 'm',
+    'य': 'y', 'र': 'r', 'ल': 'l', 'व': 'v', 'श': 'sh', 'ष': 'sh', 'स': 's', 'ह': 'h',
+}
+_NUKTA_FORMS = {'क': 'q', 'ख': 'kh', 'ग': 'g', 'ज': 'z', 'ड': 'r', 'ढ': 'rh', 'फ': 'f'}
+_VOWELS = {
+    'अ': 'a', 'आ': 'a', 'इ': 'i', 'ई': 'i', 'उ': 'u', 'ऊ': 'u', 'ऋ': 'ri',
+    'ए': 'e', 'ऐ': 'ai', 'ओ': 'o', 'औ': 'au', 'ऑ': 'o',
+}
+_MATRAS = {
+    'ा': 'a', 'ि': 'i', 'ी': 'i', 'ु': 'u', 'ू': 'u', 'ृ': 'ri',
+    'े': 'e', 'ै': 'ai', 'ो': 'o', 'ौ': 'au', 'ॅ': 'e', 'ॉ': 'o',
+}
+_NASALS = {'ं': 'n', 'ँ': 'n', 'ः': 'h'}
+_NUKTA = '़'
+_VIRAMA = '्'
+
+# Spelling variants folded together after transliteration
+_SPELLING_FOLDS = (('aa', 'a'), ('ee', 'i'), ('oo', 'u'), ('w', 'v'), ('ph', 'f'), ('z', 'j'))
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def transliterate(text):
+    """Latin spelling of Devanagari text (other characters pass through)"""
+    out = []
+    pending_a = False
+    chars = list(text)
+    for i, ch in enumerate(chars):
+        if ch in _CONSONANTS:
+            if pending_a:
+                out.append('a')
+            if i + 1 < len(chars) and chars[i + 1] == _NUKTA:
+                out.append(_NUKTA_FORMS.get(ch, _CONSONANTS[ch]))
+            else:
+                out.append(_CONSONANTS[ch])
+            pending_a = True
+            continue
+        if ch == _NUKTA:
+            continue
+        if ch in _MATRAS:
+            out.append(_MATRAS[ch])
+        elif ch == _VIRAMA:
+            pass
+        elif ch in _NASALS:
+            if pending_a:
+                out.append('a')
+            out.append(_NASALS[ch])
+        else:
+            # Word boundary: the final inherent vowel is silent ("राहुल" -> "rahul")
+            out.append(_VOWELS.get(ch, ch))
+        pending_a = False
+    return ''.join(out)
+
+
+def normalize_name(text):
+    """Folded form used for matching"""
+    text = transliterate(text or '')
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = _NON_WORD.sub(' ', text).strip()
+    for variant, folded in _SPELLING_FOLDS:
+        text = text.replace(variant, folded)
+    return ' '.join(text.split())
+
+
+def trigrams(normalized):
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b):
+    """Levenshtein distance"""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def name_similarity(query, name):
+    """Similarity of two normalized names (0..1); a query matching a run of the
+    name's words (say "milk" for "amul milk") scores up to PARTIAL_MATCH_WEIGHT"""
+    if query == name:
+        return 1.0
+    longest = max(len(query), len(name)) or 1
+    score = 1 - edit_distance(query, name) / longest
+    query_words, name_words = query.split(), name.split()
+    if len(query_words) < len(name_words):
+        size = len(query_words)
+        for start in range(len(name_words) - size + 1):
+            window = ' '.join(name_words[start:start + size])
+            partial = 1 - edit_distance(query, window) / (max(len(query), len(window)) or 1)
+            score = max(score, partial * PARTIAL_MATCH_WEIGHT)
+    return score
+
+
+class Match:
+    __slots__ = ('entity_id', 'name', 'score')
+
+    def __init__(self, entity_id, name, score):
+        self.entity_id = entity_id
+        self.name = name
+        self.score = score
+
+    def __repr__(self):
+        return f"Match({self.entity_id!r}, {self.name!r}, {self.score:.2f})"
+
+
+class EntityIndex:
+    """Trigram index over one seller's product or customer names"""
+
+    def __init__(self, entries=()):
+        self._names = {}
+        self._exact = {}
+        self._grams = {}
+        self._lock = threading.Lock()
+        for entity_id, name in entries:
+            self._add(entity_id, name)
+
+    def __len__(self):
+        return len(self._names)
+
+    def _add(self, entity_id, name):
+        self._remove(entity_id)
+        normalized = normalize_name(name)
+        if not normalized:
+            return
+        self._names[entity_id] = (name, normalized)
+        self._exact.setdefault(normalized, set()).add(entity_id)
+        for gram in trigrams(normalized):
+            self._grams.setdefault(gram, set()).add(entity_id)
+
+    def _remove(self, entity_id):
+        entry = self._names.pop(entity_id, None)
+        if entry is None:
+            return
+        normalized = entry[1]
+        self._exact[normalized].discard(entity_id)
+        if not self._exact[normalized]:
+            del self._exact[normalized]
+        for gram in trigrams(normalized):
+            ids = self._grams[gram]
+            ids.discard(entity_id)
+            if not ids:
+                del self._grams[gram]
+
+    def add(self, entity_id, name):
+        """Index (or re-index) an entity under its current name"""
+        with self._lock:
+            self._add(entity_id, name)
+
+    def remove(self, entity_id):
+        with self._lock:
+            self._remove(entity_id)
+
+    def resolve(self, name, min_score=RESOLVER_MIN_SCORE, margin=RESOLVER_MARGIN):
+        """The entity `name` refers to, or None when nothing is close enough or
+        two entities match about equally well"""
+        query = normalize_name(name)
+        if not query:
+            return None
+        with self._lock:
+            exact = self._exact.get(query)
+            if exact:
+                if len(exact) > 1:
+                    return None
+                entity_id = next(iter(exact))
+                return Match(entity_id, self._names[entity_id][0], 1.0)
+
+            shared = Counter()
+            for gram in trigrams(query):
+                for entity_id in self._grams.get(gram, ()):
+                    shared[entity_id] += 1
+            candidates = [(entity_id, self._names[entity_id]) for entity_id, _ in shared.most_common(MAX_CANDIDATES)]
+
+        scored = sorted(
+            ((name_similarity(query, normalized), entity_id, display) for entity_id, (display, normalized) in candidates),
+            reverse=True
+        )
+        if not scored or scored[0][0] < min_score:
+            return None
+        if len(scored) > 1 and scored[0][0] - scored[1][0] < margin:
+            return None
+        score, entity_id, display = scored[0]
+        return Match(entity_id, display, score)
+
+
+class EntityResolver:
+    """Per-seller EntityIndex objects, built lazily and rebuilt when the seller's version changes"""
+
+    def __init__(self, maxsize=RESOLVER_CACHE_SIZE, ttl=RESOLVER_TTL):
+        self._indexes = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._build_lock = threading.Lock()
+
+    def index(self, seller_id, kind):
+        key = (seller_id, kind)
+        version = get_stats_version(seller_id)
+        entry = self._indexes.get(key)
+        if entry is None or entry[0] != version:
+            with self._build_lock:
+                entry = self._indexes.get(key)
+                if entry is None or entry[0] != version:
+                    model, id_column, name_column = ENTITY_KINDS[kind]
+                    rows = model.query.with_entities(getattr(model, id_column), getattr(model, name_column)) \
+                        .filter_by(s_id=seller_id).all()
+                    entry = (version, EntityIndex(rows))
+                    self._indexes.set(key, entry)
+        return entry[1]
+
+    def resolve(self, seller_id, kind, name):
+        if not name or not isinstance(name, str):
+            return None
+        return self.index(seller_id, kind).resolve(name)
+
+    def clear(self):
+        self._indexes.clear()
+
+    def stats(self):
+        return self._indexes.stats()
+
+
+resolver = EntityResolver()
+
+
+def resolve_invoice_entities(seller_id, data):
+    """Point a create_invoice payload's customer and items at existing records.
+
+    Matched names are replaced by the stored spelling and get customer_id /
+    product_id; unmatched ones are marked new. Returns data.
+    """
+    if not isinstance(data, dict):
+        return data
+    customer = resolver.resolve(seller_id, 'customer', data.get('customer_name'))
+    if customer:
+        data['customer_id'] = customer.entity_id
+        data['customer_name'] = customer.name
+        data['is_new_customer'] = False
+    elif data.get('customer_name'):
+        data['is_new_customer'] = True
+    for item in data.get('items') or []:
+        if not isinstance(item, dict):
+            continue
+        product = resolver.resolve(seller_id, 'product', item.get('product_name'))
+        if product:
+            item['product_id'] = product.entity_id
+            item['product_name'] = product.name
+            item['is_new_product'] = False
+        elif item.get('product_name'):
+            item['is_new_product'] = True
+    return data
+
@@ -0,0 +1,96 @@
+"""Atomic ID allocation backed by the id_sequence counter table.
+
+Each ID series (P###, C###, S###, INV-###) has one counter row. Taking an ID is
+a single UPDATE of that row, so concurrent workers serialize on its row lock
+instead of scanning the entity table. With ID_BLOCK_SIZE > 1 each worker
+reserves a block of numbers in its own short transaction and hands them out
+from memory.
+"""
+import re
+import threading
+from flask import current_app
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import IdSequence, Seller, Customer, Product, Invoice
+
+# entity -> (ID prefix, primary key column)
+ID_SERIES = {
+    'seller': ('S', Seller.s_id),
+    'customer': ('C', Customer.c_id),
+    'product': ('P', Product.p_id),
+    'invoice': ('INV-', Invoice.invoice_no),
+}
+
+_blocks = {}
+_blocks_lock = threading.Lock()
+
+
+def format_id(prefix, number):
+    return f"{prefix}{number:03d}"
+
+
+def _series(entity, scope=None):
+    """Sequence name and ID prefix for an entity, optionally scoped (e.g. per seller)"""
+    prefix, _ = ID_SERIES[entity]
+    if scope:
+        return f"{entity}:{scope}", f"{prefix}{scope}-"
+    return entity, prefix
+
+
+def _current_max(conn, column, prefix):
+    """Highest numeric suffix already used with this prefix (only scanned when a sequence is created)"""
+    pattern = re.compile(rf'^{re.escape(prefix)}(\d+)$')
+    max_num = 0
+    for (value,) in conn.execute(select(column).where(column.like(f"{prefix}%"))):
+        match = pattern.match(value or '')
+        if match:
+            max_num = max(max_num, int(match.group(1)))
+    return max_num
+
+
+def _reserve(conn, name, count, column, prefix):
+    """Advance a counter by `count` under its row lock and return the first reserved number"""
+    table = IdSequence.__table__
+    result = conn.execute(
+        update(table).where(table.c.name == name).values(next_value=table.c.next_value + count)
+    )
+    if result.rowcount == 0:
+        start = _current_max(conn, column, prefix) + 1
+        try:
+            with conn.begin_nested():
+                conn.execute(table.insert().values(name=name, next_value=start + count))
+            return start
+        except IntegrityError:
+            # Another worker created the counter first; take the locked path
+            return _reserve(conn, name, count, column, prefix)
+    next_value = conn.execute(select(table.c.next_value).where(table.c.name == name)).scalar()
+    return next_value - count
+
+
+def _next_number(name, column, prefix):
+    block_size = current_app.config.get('ID_BLOCK_SIZE', 1)
+    if block_size <= 1 or db.engine.dialect.name == 'sqlite':
+        # Part of the caller's transaction: a rollback gives the number back
+        return _reserve(db.session, name, 1, column, prefix)
+
+    with _blocks_lock:
+        block = _blocks.get(name)
+        if not block or block[0] >= block[1]:
+            with db.engine.begin() as conn:
+                start = _reserve(conn, name, block_size, column, prefix)
+            block = _blocks[name] = [start, start + block_size]
+        number = block[0]
+        block[0] += 1
+        return number
+
+
+def allocate_id(entity, scope=None):
+    """Return the next free ID for entity ('seller', 'customer', 'product' or 'invoice')"""
+    _, column = ID_SERIES[entity]
+    name, prefix = _series(entity, scope)
+    while True:
+        candidate = format_id(prefix, _next_number(name, column, prefix))
+        # Skip IDs written outside the allocator (seed scripts, manual inserts)
+        if not db.session.execute(select(column).where(column == candidate)).first():
+            return candidate
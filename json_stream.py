@@ -0,0 +1,111 @@
+"""Incremental parsing of a JSON object that arrives in chunks (streamed LLM output)."""
+import json
+
+
+def _decode(raw):
+    """Decode the longest prefix of raw JSON string content that is complete"""
+    for cut in range(0, 7):
+        end = len(raw) - cut
+        if end < 0:
+            break
+        try:
+            return json.loads('"' + raw[:end] + '"')
+        except ValueError:
+            continue
+    return ''
+
+
+class JSONEnvelopeParser:
+    """Watches the top-level string fields of a streamed JSON object.
+
+    feed() returns events as they become available: (key, value) once a
+    field in `complete_keys` has been read in full, and (key, new_text) for
+    every piece of a field in `stream_keys`. Text before the opening brace
+    (a code fence, say) and after the closing one is ignored; result()
+    parses the whole object once the stream ends.
+    """
+
+    def __init__(self, complete_keys=('intent',), stream_keys=('response_text',)):
+        self.complete_keys = complete_keys
+        self.stream_keys = stream_keys
+        self._chars = []
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        self._string_role = None
+        self._key = None
+        self._raw = []
+        self._emitted = 0
+
+    def feed(self, chunk):
+        events = []
+        for ch in chunk:
+            if self._finished:
+                break
+            if not self._started:
+                if ch != '{':
+                    continue
+                self._started = True
+            self._chars.append(ch)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._end_string(events)
+                    continue
+                if self._string_role:
+                    self._raw.append(ch)
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._raw = []
+                if self._depth == 1:
+                    self._string_role = 'key' if self._expect_key else 'value'
+                else:
+                    self._string_role = None
+            elif ch in '{[':
+                self._depth += 1
+                self._expect_key = self._depth == 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._finished = True
+            elif self._depth == 1 and ch == ':':
+                self._expect_key = False
+            elif self._depth == 1 and ch == ',':
+                self._expect_key = True
+
+        if self._in_string and self._string_role == 'value' and self._key in self.stream_keys:
+            self._emit_new_text(_decode(''.join(self._raw)), events)
+        return events
+
+    def _emit_new_text(self, decoded, events):
+        if len(decoded) > self._emitted:
+            events.append((self._key, decoded[self._emitted:]))
+            self._emitted = len(decoded)
+
+    def _end_string(self, events):
+        if self._string_role == 'key':
+            self._key = _decode(''.join(self._raw))
+        elif self._string_role == 'value':
+            value = _decode(''.join(self._raw))
+            if self._key in self.stream_keys:
+                self._emit_new_text(value, events)
+            elif self._key in self.complete_keys:
+                events.append((self._key, value))
+            self._emitted = 0
+        self._string_role = None
+
+    def result(self):
+        """The complete parsed object; raises ValueError if the stream held none"""
+        if not self._started:
+            raise ValueError("No JSON object in model output")
+        return json.loads(''.join(self._chars))
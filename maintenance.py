@@ -0,0 +1,137 @@
+"""Scheduled maintenance jobs: daily run claims and the overdue-invoice sweep.
+
+Jobs run from the `flask` CLI (cron) or from an optional background thread.
+claim_daily_run() makes each job fire at most once per day no matter how many
+gunicorn workers try: the job_run row is updated conditionally and stays
+locked until the job's transaction commits.
+"""
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime
+from sqlalchemy import update, or_
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import Invoice, JobRun
+from stats import apply_stats_delta
+
+OVERDUE_SWEEP_JOB = 'overdue_sweep'
+
+# Invoice ids per UPDATE when flipping the locked rows
+SWEEP_BATCH_SIZE = 500
+
+# Per-process memo so the request-time fallback costs nothing once a day is covered
+_swept_sellers = {}
+_global_sweep_on = None
+_memo_lock = threading.Lock()
+
+
+def claim_daily_run(job, today=None):
+    """Mark `job` as run for today inside the current transaction.
+
+    Returns True for exactly one caller per day; the others get False (after
+    waiting for the winner's transaction on databases with row locks).
+    """
+    today = today or date.today()
+    table = JobRun.__table__
+    result = db.session.execute(
+        update(table)
+        .where(table.c.job == job, or_(table.c.last_run_on.is_(None), table.c.last_run_on < today))
+        .values(last_run_on=today, last_run_at=datetime.utcnow())
+    )
+    if result.rowcount:
+        return True
+    if db.session.get(JobRun, job) is not None:
+        return False
+    try:
+        with db.session.begin_nested():
+            db.session.add(JobRun(job=job, last_run_on=today, last_run_at=datetime.utcnow()))
+        return True
+    except IntegrityError:
+        return False
+
+
+def sweep_overdue_invoices(seller_id=None, today=None):
+    """Flip past-due pending invoices to overdue with one set-based UPDATE.
+
+    The candidate rows are locked (SELECT ... FOR UPDATE) and exactly those
+    ids are flipped, so a concurrent payment or edit cannot make the
+    seller_stats deltas differ from the rows changed. Adjusts the rollup in
+    the same transaction; the caller commits. Returns the number of invoices
+    changed.
+    """
+    today = today or date.today()
+    filters = [Invoice.status == 'pending', Invoice.due_date.isnot(None), Invoice.due_date < today]
+    if seller_id:
+        filters.append(Invoice.s_id == seller_id)
+
+    candidates = db.session.query(Invoice.invoice_no, Invoice.s_id).filter(*filters).with_for_update().all()
+    if not candidates:
+        return 0
+    for start in range(0, len(candidates), SWEEP_BATCH_SIZE):
+        batch = [invoice_no for invoice_no, _ in candidates[start:start + SWEEP_BATCH_SIZE]]
+        db.session.query(Invoice).filter(Invoice.invoice_no.in_(batch)) \
+            .update({Invoice.status: 'overdue'}, synchronize_session=False)
+    for s_id, count in Counter(s_id for _, s_id in candidates).items():
+        apply_stats_delta(s_id, unpaid_invoices=-count, overdue_invoices=count)
+    return len(candidates)
+
+
+def run_overdue_sweep(force=False):
+    """Run the system-wide sweep if no worker has run it today; returns the count or None if skipped"""
+    global _global_sweep_on
+    today = date.today()
+    try:
+        if not claim_daily_run(OVERDUE_SWEEP_JOB, today) and not force:
+            db.session.rollback()
+            return None
+        count = sweep_overdue_invoices(today=today)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    with _memo_lock:
+        _global_sweep_on = today
+    return count
+
+
+def ensure_seller_swept(seller_id):
+    """Request-time fallback: sweep only this seller's rows when today's global sweep has not run"""
+    global _global_sweep_on
+    today = date.today()
+    with _memo_lock:
+        if _global_sweep_on == today or _swept_sellers.get(seller_id) == today:
+            return
+    last_run = db.session.get(JobRun, OVERDUE_SWEEP_JOB)
+    if last_run and last_run.last_run_on == today:
+        with _memo_lock:
+            _global_sweep_on = today
+        return
+    try:
+        sweep_overdue_invoices(seller_id=seller_id, today=today)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    with _memo_lock:
+        if any(day != today for day in _swept_sellers.values()):
+            _swept_sellers.clear()
+        _swept_sellers[seller_id] = today
+
+
+def start_background_sweeper(app, interval):
+    """Run the daily overdue sweep from a daemon thread every `interval` seconds"""
+    def loop():
+        while True:
+            try:
+                with app.app_context():
+                    count = run_overdue_sweep()
+                    if count:
+                        print(f"Overdue sweep: {count} invoice(s) marked overdue.")
+            except Exception as e:
+                print(f"Overdue sweep error: {e}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name='overdue-sweeper', daemon=True)
+    thread.start()
+    return thread
@@ -1,10 +1,15 @@
 from extensions import db
+import json
 from datetime import datetime
 from sqlalchemy import Column, Integer, String, Text, DateTime, Numeric, Date, ForeignKey
+from sqlalchemy.orm import joinedload, selectinload
 
 class Activity(db.Model):
     """Activity log for tracking changes"""
     __tablename__ = 'activity'
+    __table_args__ = (
+        db.Index('ix_activity_user_timestamp', 'user_id', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String(50))
     user_role = db.Column(db.String(20))
@@ -91,6 +96,9 @@ class Seller(db.Model):
 class Customer(db.Model):
     """CUSTOMER entity"""
     __tablename__ = 'customer'
+    __table_args__ = (
+        db.Index('ix_customer_seller_name', 's_id', 'c_name'),
+    )
     c_id = db.Column(db.String(50), primary_key=True)
     c_name = db.Column(db.String(100))
     c_email = db.Column(db.String(100))
@@ -141,6 +149,9 @@ class Customer(db.Model):
 class Product(db.Model):
     """PRODUCT entity"""
     __tablename__ = 'product'
+    __table_args__ = (
+        db.Index('ix_product_seller_name', 's_id', 'p_name'),
+    )
     p_id = db.Column(db.String(50), primary_key=True)
     p_name = db.Column(db.String(100))
     p_price = db.Column(db.Numeric(10, 2))
@@ -181,6 +192,10 @@ class Product(db.Model):
 
 class Invoice(db.Model):
     __tablename__ = 'invoice'
+    __table_args__ = (
+        db.Index('ix_invoice_seller_status_datetime', 's_id', 'status', 'invoice_datetime'),
+        db.Index('ix_invoice_seller_customer', 's_id', 'c_id'),
+    )
     invoice_no = db.Column(db.String(50), primary_key=True)
     invoice_datetime = db.Column(db.DateTime, default=datetime.utcnow)
     due_date = db.Column(db.Date)
@@ -240,41 +255,177 @@ class Invoice(db.Model):
 class InvoiceItem(db.Model):
     """INVOICE_ITEM entity"""
     __tablename__ = 'invoice_item'
+    __table_args__ = (
+        db.Index('ix_invoice_item_invoice_no', 'invoice_no'),
+        db.Index('ix_invoice_item_p_id', 'p_id'),
+    )
     item_id = db.Column(db.Integer, primary_key=True)
     invoice_no = db.Column(db.String(50), db.ForeignKey('invoice.invoice_no'))
     p_id = db.Column(db.String(50), db.ForeignKey('product.p_id'))
     item_quantity = db.Column(db.Integer, default=0)
     discount = db.Column(db.Numeric(10, 2), default=0)
+    # Price and name snapshot taken when the line is written; later product edits don't change the invoice
+    unit_price = db.Column(db.Numeric(10, 2))
+    line_total = db.Column(db.Numeric(12, 2))
+    p_name = db.Column(db.String(100))
 
-    def __init__(self, item_id=None, invoice_no=None, p_id=None, item_quantity=0, discount=0, **kwargs):
+    def __init__(self, item_id=None, invoice_no=None, p_id=None, item_quantity=0, discount=0,
+                 unit_price=None, line_total=None, p_name=None, **kwargs):
         super().__init__(**kwargs)
         self.item_id = item_id
         self.invoice_no = invoice_no
         self.p_id = p_id
         self.item_quantity = item_quantity
         self.discount = discount
+        self.unit_price = unit_price
+        self.line_total = line_total
+        self.p_name = p_name
+        if unit_price is not None and line_total is None:
+            self.reprice()
     
     # Relationships
     product = db.relationship('Product', backref='invoice_items', lazy=True)
     
+    def reprice(self, unit_price=None):
+        """Set the snapshot price (default: the current one) and recompute line_total from it"""
+        self.unit_price = unit_price if unit_price is not None else self.price
+        self.line_total = self.unit_price * (self.item_quantity or 0) - (self.discount or 0)
+        return self.line_total
+    
     # Properties for template compatibility
     @property
     def quantity(self): return self.item_quantity
     @property
-    def product_name(self): return self.product.p_name if self.product else ''
+    def product_name(self):
+        if self.p_name is not None:
+            return self.p_name
+        # Rows written before the snapshot columns and not yet backfilled
+        return self.product.p_name if self.product else ''
     @property
-    def price(self): return self.product.p_price if self.product else 0
+    def price(self):
+        if self.unit_price is not None:
+            return self.unit_price
+        # Rows written before the snapshot columns and not yet backfilled
+        return self.product.p_price if self.product else 0
     @property
     def total(self):
-        price = self.product.p_price if self.product else 0
-        return (price * self.item_quantity) - self.discount
+        if self.line_total is not None:
+            return self.line_total
+        return (self.price * self.item_quantity) - self.discount
     
     def to_dict(self):
-        price = self.product.p_price if self.product else 0
         return {
             'product_name': self.product_name,
             'quantity': self.item_quantity,
-            'price': float(price),
+            'price': float(self.price),
             'discount': float(self.discount),
-            'total': float((price * self.item_quantity) - self.discount)
+            'total': float(self.total)
+        }
+
+class IdSequence(db.Model):
+    """Counter row per ID series (entity, optionally scoped per seller)"""
+    __tablename__ = 'id_sequence'
+    name = db.Column(db.String(80), primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False, default=1)
+
+class SellerStats(db.Model):
+    """Per-seller dashboard rollup, updated in the same transaction as each write"""
+    __tablename__ = 'seller_stats'
+    s_id = db.Column(db.String(50), primary_key=True)
+    total_products = db.Column(db.Integer, nullable=False, default=0)
+    total_customers = db.Column(db.Integer, nullable=False, default=0)
+    total_invoices = db.Column(db.Integer, nullable=False, default=0)
+    paid_invoices = db.Column(db.Integer, nullable=False, default=0)
+    unpaid_invoices = db.Column(db.Integer, nullable=False, default=0)
+    overdue_invoices = db.Column(db.Integer, nullable=False, default=0)
+    revenue_collected = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    revenue_due = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    revenue_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    # Bumped by every write to the seller's products, customers or invoices
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class JobRun(db.Model):
+    """Last run of a scheduled maintenance job; doubles as its cross-worker lock"""
+    __tablename__ = 'job_run'
+    job = db.Column(db.String(50), primary_key=True)
+    last_run_on = db.Column(db.Date)
+    last_run_at = db.Column(db.DateTime)
+
+class AIJob(db.Model):
+    """An async assistant command; shared so any worker can answer a poll for it"""
+    __tablename__ = 'ai_job'
+    __table_args__ = (
+        db.Index('ix_ai_job_owner_status', 'owner', 'status'),
+    )
+    id = db.Column(db.String(32), primary_key=True)
+    owner = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    result_json = db.Column(db.Text)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    @property
+    def result(self):
+        return json.loads(self.result_json) if self.result_json is not None else None
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+class ActivityDailySummary(db.Model):
+    """Daily per-user activity counts kept after a month's raw events are archived"""
+    __tablename__ = 'activity_daily_summary'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'day', 'action_type', name='uq_activity_summary_user_day_action'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.String(50), nullable=False)
+    user_role = db.Column(db.String(20))
+    day = db.Column(db.Date, nullable=False)
+    action_type = db.Column(db.String(50), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class StockMovement(db.Model):
+    """Append-only stock ledger; product.p_stock is the running sum of a product's deltas"""
+    __tablename__ = 'stock_movement'
+    __table_args__ = (
+        db.Index('ix_stock_movement_product_timestamp', 'p_id', 'timestamp'),
+        db.Index('ix_stock_movement_invoice_no', 'invoice_no'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    # Not a foreign key: the history outlives deleted products
+    p_id = db.Column(db.String(50), nullable=False)
+    delta = db.Column(db.Integer, nullable=False)
+    reason = db.Column(db.String(30), nullable=False)
+    invoice_no = db.Column(db.String(50))
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'product_id': self.p_id,
+            'delta': self.delta,
+            'reason': self.reason,
+            'invoice_no': self.invoice_no,
+            'timestamp': self.timestamp.strftime('%Y-%m-%d %H:%M:%S') if self.timestamp else None,
         }
+
+# Relationship loading profiles, applied per route with query.options(*LOAD_PROFILES[...])
+LOAD_PROFILES = {
+    # Invoice tables: customer name/email per row
+    'invoice_list': (
+        joinedload(Invoice.customer),
+    ),
+    # Single invoice pages: customer plus every line item and its product
+    'invoice_detail': (
+        joinedload(Invoice.customer),
+        selectinload(Invoice.items).joinedload(InvoiceItem.product),
+    ),
+    # Read-only invoice page: line names and prices come from the item snapshot, no product rows
+    'invoice_view': (
+        joinedload(Invoice.customer),
+        selectinload(Invoice.items),
+    ),
+}
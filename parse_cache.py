@@ -0,0 +1,130 @@
+"""Cache of LLM command-parse results.
+
+Keys combine the normalized utterance, the language, a fingerprint of the
+product and customer names the model is shown, and a digest of the recent
+conversation, so a changed catalog or conversation never reuses a stale
+parse. Entries live in an in-memory LRU/TTL cache and, when
+AI_PARSE_CACHE_DB is set, in a SQLite file that survives restarts.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from caching import LRUCache
+
+PARSE_CACHE_SIZE = int(os.environ.get('AI_PARSE_CACHE_SIZE', 2048))
+PARSE_CACHE_TTL = int(os.environ.get('AI_PARSE_CACHE_TTL', 86400))
+PARSE_CACHE_DB = os.environ.get('AI_PARSE_CACHE_DB', '')
+
+# Only this many trailing history messages shape the key
+HISTORY_DIGEST_MESSAGES = 4
+
+# Intents whose answer depends on live figures or asks for clarification
+UNCACHEABLE_INTENTS = {'business_insights', 'unknown'}
+
+_TRAILING_PUNCTUATION = ' .!?,।。！？'
+
+
+def normalize_text(user_text):
+    return ' '.join((user_text or '').lower().split()).rstrip(_TRAILING_PUNCTUATION)
+
+
+def _digest(value):
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()[:16]
+
+
+def context_fingerprint(context):
+    """Hash of the product and customer names the model matches against"""
+    product_names = sorted(p['name'] for p in context.get('products', []))
+    customer_names = sorted(c['name'] for c in context.get('customers', []))
+    return _digest(json.dumps([product_names, customer_names], ensure_ascii=False))
+
+
+def history_digest(history):
+    recent = [
+        ((msg.get('role') or msg.get('sender') or ''), normalize_text(msg.get('content') or msg.get('text', '')))
+        for msg in (history or [])[-HISTORY_DIGEST_MESSAGES:]
+    ]
+    return _digest(json.dumps(recent, ensure_ascii=False))
+
+
+def make_key(user_text, language, context, history):
+    return '|'.join((normalize_text(user_text), language or '', context_fingerprint(context), history_digest(history)))
+
+
+class ParseCache:
+    """LRU/TTL cache of parse results (stored as JSON) with an optional SQLite backing file"""
+
+    def __init__(self, maxsize=PARSE_CACHE_SIZE, ttl=PARSE_CACHE_TTL, path=PARSE_CACHE_DB):
+        self.ttl = ttl
+        self._memory = LRUCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        if path:
+            try:
+                self._db = sqlite3.connect(path, check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS parse_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+                )
+                self._db.execute("DELETE FROM parse_cache WHERE expires_at < ?", (time.time(),))
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"Parse cache store unavailable ({path}), using memory only: {e}")
+                self._db = None
+
+    def get(self, key):
+        """Cached parse result for key (a fresh copy), or None"""
+        value = self._memory.get(key)
+        if value is None and self._db is not None:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM parse_cache WHERE key = ?", (key,)
+                ).fetchone()
+            if row and row[1] > time.time():
+                value = row[0]
+                self._memory.set(key, value, ttl=row[1] - time.time())
+                self.disk_hits += 1
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def put(self, key, result):
+        """Remember a parse result unless its intent must not be reused"""
+        if not isinstance(result, dict) or result.get('intent') in UNCACHEABLE_INTENTS:
+            return
+        value = json.dumps(result, ensure_ascii=False)
+        self._memory.set(key, value)
+        if self._db is not None:
+            with self._lock:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO parse_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, value, time.time() + self.ttl)
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    print(f"Parse cache store write failed: {e}")
+
+    def clear(self):
+        self._memory.clear()
+        if self._db is not None:
+            with self._lock:
+                self._db.execute("DELETE FROM parse_cache")
+                self._db.commit()
+
+    def stats(self):
+        stats = self._memory.stats()
+        stats.update({'hits': self.hits, 'misses': self.misses, 'disk_hits': self.disk_hits,
+                      'persistent': self._db is not None})
+        return stats
+
+
+parse_cache = ParseCache()
@@ -0,0 +1,107 @@
+"""Token budget for the prompt sent to the AI parser.
+
+The model is shown only the products and customers that look most like the
+utterance, and the most recent conversation turns that fit in the history
+allowance; older turns collapse into a one-line summary. Token counts are
+estimates (no tokenizer is bundled), good enough to keep prompts well
+inside the model limits.
+"""
+import os
+import re
+from difflib import SequenceMatcher
+
+PROMPT_TOKEN_BUDGET = int(os.environ.get('AI_PROMPT_TOKEN_BUDGET', 3000))
+PROMPT_TOP_PRODUCTS = int(os.environ.get('AI_PROMPT_TOP_PRODUCTS', 40))
+PROMPT_TOP_CUSTOMERS = int(os.environ.get('AI_PROMPT_TOP_CUSTOMERS', 20))
+PROMPT_HISTORY_TOKENS = int(os.environ.get('AI_PROMPT_HISTORY_TOKENS', 600))
+
+# A single history turn is cut to this many characters
+HISTORY_TURN_CHARS = 300
+# Characters of each dropped user turn kept in the summary
+SUMMARY_TURN_CHARS = 60
+
+_WORD = re.compile(r'\w+')
+
+
+def estimate_tokens(text):
+    """Roughly 4 ASCII characters per token; other scripts about 1 character per token"""
+    if not text:
+        return 0
+    ascii_chars = len(text.encode('ascii', 'ignore'))
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+
+def _close(a, b, threshold):
+    matcher = SequenceMatcher(None, a, b)
+    return matcher.real_quick_ratio() >= threshold and matcher.quick_ratio() >= threshold and matcher.ratio() >= threshold
+
+
+def similarity(name, words):
+    """How closely `name` matches some run of the utterance `words` (0..1)"""
+    name_words = _WORD.findall(name.lower())
+    if not name_words or not words:
+        return 0.0
+    # Share of the name's words that appear (nearly) verbatim in the utterance;
+    # bare numbers match quantities too easily to count on their own
+    word_set = set(words)
+    best = sum(
+        1 for nw in name_words
+        if not nw.isdigit() and (nw in word_set or (len(nw) > 2 and any(_close(nw, w, 0.8) for w in word_set)))
+    ) / len(name_words)
+
+    matcher = SequenceMatcher(None)
+    matcher.set_seq2(' '.join(name_words))
+    for size in {max(1, len(name_words) - 1), len(name_words), len(name_words) + 1}:
+        for start in range(max(1, len(words) - size + 1)):
+            matcher.set_seq1(' '.join(words[start:start + size]))
+            if matcher.real_quick_ratio() > best and matcher.quick_ratio() > best:
+                best = max(best, matcher.ratio())
+    return best
+
+
+def top_matches(entities, user_text, k):
+    """The k entities (dicts with 'name') most similar to user_text, in catalog order"""
+    if len(entities) <= k:
+        return list(entities)
+    if k <= 0:
+        return []
+    words = _WORD.findall((user_text or '').lower())
+    scored = sorted(enumerate(entities), key=lambda item: -similarity(item[1]['name'], words))
+    return [entity for _, entity in sorted(scored[:k], key=lambda item: item[0])]
+
+
+def _turn(msg):
+    is_user = msg.get('role') == 'user' or msg.get('sender') == 'user'
+    content = msg.get('content') or msg.get('text', '') or ''
+    return is_user, content
+
+
+def trim_history(history, max_tokens):
+    """The most recent turns that fit in max_tokens, preceded by a summary turn of
+    what was dropped. Returns (turns, tokens used)."""
+    history = history or []
+    kept = []
+    used = 0
+    for msg in reversed(history):
+        is_user, content = _turn(msg)
+        if len(content) > HISTORY_TURN_CHARS:
+            content = content[:HISTORY_TURN_CHARS] + '…'
+        cost = estimate_tokens(content)
+        if used + cost > max_tokens:
+            break
+        kept.append({'role': 'user' if is_user else 'model', 'content': content})
+        used += cost
+    kept.reverse()
+
+    dropped = history[:len(history) - len(kept)]
+    asked = [content[:SUMMARY_TURN_CHARS] for is_user, content in map(_turn, dropped) if is_user and content]
+    if asked:
+        summary = f"(Earlier in this conversation the user asked: {'; '.join(asked[-5:])})"
+        cost = estimate_tokens(summary)
+        # The summary replaces the oldest kept turns if it does not fit beside them
+        while kept and used + cost > max_tokens:
+            used -= estimate_tokens(kept.pop(0)['content'])
+        if used + cost <= max_tokens:
+            kept.insert(0, {'role': 'user', 'content': summary})
+            used += cost
+    return kept, used
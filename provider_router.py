@@ -0,0 +1,257 @@
+"""Routing of AI parse requests across providers (Groq, Gemini).
+
+Each provider has a circuit breaker and a latency histogram. A request goes
+to the provider with the better median latency first; if it has not
+answered after AI_HEDGE_DELAY seconds (or fails sooner) the next provider is
+asked too, and the first valid answer wins. A provider that keeps failing is
+skipped until its breaker lets a single probe request through again.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+HEDGE_DELAY = float(os.environ.get('AI_HEDGE_DELAY', 1.5))
+BREAKER_FAILURES = int(os.environ.get('AI_BREAKER_FAILURES', 3))
+BREAKER_RESET = float(os.environ.get('AI_BREAKER_RESET', 30))
+
+# A provider needs this many timed successes before its latency decides the order
+MIN_LATENCY_SAMPLES = 5
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, float('inf'))
+
+_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('AI_PROVIDER_WORKERS', 8)),
+                               thread_name_prefix='ai-provider')
+
+
+class ProvidersFailed(Exception):
+    """Every provider failed or was unavailable; `errors` maps provider name to its error"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(', '.join(f"{name}: {error}" for name, error in errors.items()))
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures; after `reset_timeout`
+    seconds one probe call is let through (half-open) to decide whether to close"""
+
+    def __init__(self, failure_threshold=BREAKER_FAILURES, reset_timeout=BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def available(self):
+        """Whether a call could be made now (does not claim the half-open probe)"""
+        with self._lock:
+            return self.state == 'closed' or (
+                self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout
+            )
+
+    def allow(self):
+        """Claim permission for one call"""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def release(self):
+        """Give back an unresolved half-open probe (the caller went away) so another can be made"""
+        with self._lock:
+            if self.state == 'half_open':
+                self.state = 'open'
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+
+class LatencyHistogram:
+    """Bucketed latency counts with approximate percentiles"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, seconds)] += 1
+            self.count += 1
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile (None without samples)"""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = p / 100 * self.count
+            seen = 0
+            for bound, count in zip(self.buckets, self.counts):
+                seen += count
+                if seen >= rank:
+                    return bound
+        return self.buckets[-1]
+
+
+class ProviderHealth:
+    def __init__(self):
+        self.breaker = CircuitBreaker()
+        self.latency = LatencyHistogram()
+        # Time to first chunk of streamed calls; kept apart because full
+        # generation time is not comparable with a parse call's latency
+        self.stream_latency = LatencyHistogram()
+        self.failures = 0
+
+
+_health = {}
+_health_lock = threading.Lock()
+
+
+def get_health(name):
+    with _health_lock:
+        if name not in _health:
+            _health[name] = ProviderHealth()
+        return _health[name]
+
+
+def rank_providers(names):
+    """Available providers first, then faster median latency; configured order breaks ties"""
+    def sort_key(indexed_name):
+        index, name = indexed_name
+        health = get_health(name)
+        median = health.latency.percentile(50) if health.latency.count >= MIN_LATENCY_SAMPLES else None
+        return (not health.breaker.available(), median is None, median or 0, index)
+    return [name for _, name in sorted(enumerate(names), key=sort_key)]
+
+
+def _timed_call(health, call):
+    started = time.monotonic()
+    try:
+        result = call()
+        if not isinstance(result, dict):
+            raise ValueError(f"expected a JSON object, got {type(result).__name__}")
+    except Exception:
+        health.failures += 1
+        health.breaker.record_failure()
+        raise
+    health.latency.observe(time.monotonic() - started)
+    health.breaker.record_success()
+    return result
+
+
+def call_with_hedging(calls, hedge_delay=HEDGE_DELAY):
+    """Run the provider callables in `calls` (name -> zero-argument callable returning
+    a dict) with hedging, returning the first successful result.
+
+    Raises ProvidersFailed when none succeeds.
+    """
+    remaining = rank_providers(list(calls))
+    running = {}
+    errors = {}
+
+    def launch_next():
+        while remaining:
+            name = remaining.pop(0)
+            health = get_health(name)
+            if not health.breaker.allow():
+                errors[name] = 'circuit open'
+                continue
+            running[_executor.submit(_timed_call, health, calls[name])] = name
+            return
+
+    launch_next()
+    while running:
+        done, _ = wait(running, timeout=hedge_delay if remaining else None, return_when=FIRST_COMPLETED)
+        if not done:
+            # Primary is slow: hedge with the next provider
+            launch_next()
+            continue
+        for future in done:
+            name = running.pop(future)
+            try:
+                return future.result()
+            except Exception as e:
+                print(f"{name} parse failed: {e}")
+                errors[name] = e
+        if not running:
+            launch_next()
+    raise ProvidersFailed(errors)
+
+
+def stream_with_failover(streams):
+    """Yield text chunks from the best available provider in `streams` (name ->
+    zero-argument callable returning an iterator of chunks).
+
+    Streams cannot be hedged without showing the user two answers, so the next
+    provider is tried only when one fails before producing any output.
+    Raises ProvidersFailed when none succeeds. If the consumer stops early
+    (client disconnect), the breaker counts a success when output was
+    produced and otherwise releases its probe.
+    """
+    errors = {}
+    for name in rank_providers(list(streams)):
+        health = get_health(name)
+        if not health.breaker.allow():
+            errors[name] = 'circuit open'
+            continue
+        started = time.monotonic()
+        produced = False
+        resolved = False
+        try:
+            for chunk in streams[name]():
+                if not produced:
+                    produced = True
+                    health.stream_latency.observe(time.monotonic() - started)
+                yield chunk
+            resolved = True
+            health.breaker.record_success()
+        except Exception as e:
+            resolved = True
+            print(f"{name} stream failed: {e}")
+            health.failures += 1
+            health.breaker.record_failure()
+            errors[name] = e
+            if produced:
+                raise ProvidersFailed(errors)
+            continue
+        finally:
+            if not resolved:
+                if produced:
+                    health.breaker.record_success()
+                else:
+                    health.breaker.release()
+        return
+    raise ProvidersFailed(errors)
+
+
+def get_provider_stats():
+    """Breaker state and latency percentiles per provider, for monitoring"""
+    with _health_lock:
+        items = list(_health.items())
+    return {
+        name: {
+            'state': health.breaker.state,
+            'failures': health.failures,
+            'calls_timed': health.latency.count,
+            'p50': health.latency.percentile(50),
+            'p95': health.latency.percentile(95),
+            'stream_first_chunk_p50': health.stream_latency.percentile(50),
+        }
+        for name, health in items
+    }
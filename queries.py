@@ -1,5 +1,8 @@
 from models import Seller, Customer, Product, Invoice, InvoiceItem, Activity
-from database import get_db_connection
+from database import get_db_connection, connection_scope
+from stats import seller_stats_query, seller_stats_from_row
+from sqlalchemy import table, column
+from sqlalchemy.dialects import mysql
 from datetime import datetime, date
 from decimal import Decimal
 
@@ -19,19 +22,34 @@ def get_all_rows_as_dict(cursor):
     return [dict(zip(columns, row)) for row in cursor.fetchall()]
 
 def log_activity(user_id, user_role, action_type, description):
-    """Log an activity for the current user"""
-    conn = get_db_connection()
-    if not conn: return
-    try:
+    """Log an activity for the current user.
+
+    Inside connection_scope() the row is written on the scope's connection and
+    committed with the rest of its transaction.
+    """
+    log_activities([(user_id, user_role, action_type, description, datetime.utcnow())])
+
+def log_activities(rows):
+    """Insert (user_id, user_role, action_type, description, timestamp) rows in one statement"""
+    if not rows: return
+    with connection_scope() as conn:
         cursor = conn.cursor()
         query = """
             INSERT INTO activities (user_id, user_role, action_type, description, timestamp)
             VALUES (%s, %s, %s, %s, %s)
         """
-        cursor.execute(query, (user_id, user_role, action_type, description, datetime.utcnow()))
-        conn.commit()
-    finally:
-        conn.close()
+        cursor.executemany(query, rows)
+
+def record_stock_movements(cursor, rows):
+    """Append (p_id, delta, reason, invoice_no) rows to the stock ledger on the caller's transaction"""
+    rows = [row for row in rows if row[1]]
+    if not rows: return
+    now = datetime.utcnow()
+    query = """
+        INSERT INTO stock_movements (p_id, delta, reason, invoice_no, timestamp)
+        VALUES (%s, %s, %s, %s, %s)
+    """
+    cursor.executemany(query, [(p_id, delta, reason, invoice_no, now) for p_id, delta, reason, invoice_no in rows])
 
 def get_recent_activities(user_id, limit=5):
     conn = get_db_connection()
@@ -45,49 +63,60 @@ def get_recent_activities(user_id, limit=5):
     finally:
         conn.close()
 
-def generate_next_product_id():
-    """Generate next product ID using dictionary-based approach"""
+def allocate_id(name, prefix, table, column):
+    """Take the next ID of a sequence atomically (MySQL LAST_INSERT_ID counter idiom)"""
     conn = get_db_connection()
-    if not conn: return "P001"
+    if not conn: return f"{prefix}001"
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT p_id FROM products")
-        existing_ids = {row[0] for row in cursor.fetchall()}
-        
-        max_num = 0
-        for pid in existing_ids:
-            if pid.startswith('P') and len(pid) == 4:
-                try:
-                    num = int(pid[1:])
-                    if num > max_num:
-                        max_num = num
-                except ValueError:
-                    continue
+        bump = "UPDATE id_sequences SET next_value = LAST_INSERT_ID(next_value + 1) WHERE name = %s"
+        cursor.execute(bump, (name,))
+        if cursor.rowcount == 0:
+            # First use of this sequence: start after the highest existing ID
+            cursor.execute(f"SELECT {column} FROM {table} WHERE {column} LIKE %s", (prefix + '%',))
+            max_num = 0
+            for (value,) in cursor.fetchall():
+                suffix = value[len(prefix):]
+                if suffix.isdigit():
+                    max_num = max(max_num, int(suffix))
+            cursor.execute("INSERT IGNORE INTO id_sequences (name, next_value) VALUES (%s, %s)", (name, max_num + 1))
+            cursor.execute(bump, (name,))
         
         while True:
-            max_num += 1
-            candidate = f"P{max_num:03d}"
-            if candidate not in existing_ids:
-                return candidate
+            cursor.execute("SELECT LAST_INSERT_ID()")
+            candidate = f"{prefix}{cursor.fetchone()[0] - 1:03d}"
+            # Skip IDs written outside the sequence
+            cursor.execute(f"SELECT 1 FROM {table} WHERE {column} = %s", (candidate,))
+            if not cursor.fetchone():
+                break
+            cursor.execute(bump, (name,))
+        conn.commit()
+        return candidate
     finally:
         conn.close()
 
-def update_overdue_invoices():
-    """Update invoice status to overdue if current date > due_date"""
+def generate_next_product_id():
+    """Generate next product ID (P###) from the product sequence"""
+    return allocate_id('product', 'P', 'products', 'p_id')
+
+def update_overdue_invoices(seller_id=None):
+    """Update invoice status to overdue if current date > due_date (optionally for one seller)"""
     conn = get_db_connection()
     if not conn: return
     try:
         cursor = conn.cursor()
-        today = date.today()
         query = """
             UPDATE invoices 
             SET status = 'overdue' 
-            WHERE status IN ('pending', 'overdue') 
+            WHERE status = 'pending'
             AND due_date IS NOT NULL 
             AND due_date < %s
-            AND status != 'overdue'
         """
-        cursor.execute(query, (today,))
+        params = [date.today()]
+        if seller_id:
+            query += " AND s_id = %s"
+            params.append(seller_id)
+        cursor.execute(query, tuple(params))
         conn.commit()
     finally:
         conn.close()
@@ -103,6 +132,8 @@ def restore_stock_on_cancellation(invoice):
             # Update stock directly in DB
             query = "UPDATE products SET p_stock = p_stock + %s WHERE p_id = %s"
             cursor.execute(query, (item.item_quantity, item.p_id))
+        record_stock_movements(cursor, [(item.p_id, item.item_quantity, 'invoice_cancelled', invoice.invoice_no)
+                                        for item in invoice.invoice_items])
         conn.commit()
     finally:
         conn.close()
@@ -152,41 +183,23 @@ def create_seller(s_id, name, email, address, phone, password):
 
 # --- Dashboard Queries ---
 
+# Raw schema.sql tables for the shared stats query
+_STATS_TABLES = (
+    table('invoices', column('invoice_no'), column('s_id'), column('status'), column('amount')),
+    table('products', column('s_id')),
+    table('customers', column('s_id')),
+)
+
 def get_seller_dashboard_stats(seller_id):
     conn = get_db_connection()
     if not conn: return {}
     try:
         cursor = conn.cursor()
-        
-        stats = {}
-        
-        cursor.execute("SELECT COUNT(*) FROM products WHERE s_id = %s", (seller_id,))
-        stats['total_products'] = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM customers WHERE s_id = %s", (seller_id,))
-        stats['total_customers'] = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM invoices WHERE s_id = %s", (seller_id,))
-        stats['total_invoices'] = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM invoices WHERE s_id = %s AND status = 'paid'", (seller_id,))
-        stats['paid_invoices'] = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM invoices WHERE s_id = %s AND status = 'pending'", (seller_id,))
-        stats['unpaid_invoices'] = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM invoices WHERE s_id = %s AND status = 'overdue'", (seller_id,))
-        stats['overdue_invoices'] = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT SUM(amount) FROM invoices WHERE s_id = %s AND status = 'paid'", (seller_id,))
-        res = cursor.fetchone()[0]
-        stats['revenue_collected'] = float(res) if res else 0.0
-        
-        cursor.execute("SELECT SUM(amount) FROM invoices WHERE s_id = %s AND status IN ('pending', 'overdue')", (seller_id,))
-        res = cursor.fetchone()[0]
-        stats['revenue_due'] = float(res) if res else 0.0
-        
-        return stats
+        query = seller_stats_query(*_STATS_TABLES, seller_id)
+        compiled = query.compile(dialect=mysql.dialect(paramstyle='pyformat'),
+                                 compile_kwargs={'render_postcompile': True})
+        cursor.execute(str(compiled), compiled.params)
+        return seller_stats_from_row(get_row_as_dict(cursor))
     finally:
         conn.close()
 
@@ -330,6 +343,7 @@ def add_product(name, price, description, stock, seller_id):
             VALUES (%s, %s, %s, %s, %s, %s)
         """
         cursor.execute(query, (product_id, name, price, description, stock, seller_id))
+        record_stock_movements(cursor, [(product_id, stock, 'opening', None)])
         conn.commit()
         return Product(product_id, name, price, description, stock, seller_id)
     finally:
@@ -346,6 +360,7 @@ def update_product(product, name, price, description, stock):
             WHERE p_id = %s
         """
         cursor.execute(query, (name, price, description, stock, product.p_id))
+        record_stock_movements(cursor, [(product.p_id, stock - (product.p_stock or 0), 'adjustment', None)])
         conn.commit()
         # Update object state
         product.p_name = name
@@ -360,7 +375,11 @@ def update_product_stock(product_id, new_stock):
     if not conn: return
     try:
         cursor = conn.cursor()
+        cursor.execute("SELECT p_stock FROM products WHERE p_id = %s FOR UPDATE", (product_id,))
+        row = cursor.fetchone()
+        if not row: return
         cursor.execute("UPDATE products SET p_stock = %s WHERE p_id = %s", (new_stock, product_id))
+        record_stock_movements(cursor, [(product_id, new_stock - (row[0] or 0), 'adjustment', None)])
         conn.commit()
     finally:
         conn.close()
@@ -589,27 +608,57 @@ def get_customer_analytics(seller_id, start_date_str=None, end_date_str=None):
 
 # --- Invoice Queries ---
 
+IN_CLAUSE_CHUNK_SIZE = 500
+
+def _chunked(values, size=IN_CLAUSE_CHUNK_SIZE):
+    """Split values into lists of at most `size` items"""
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def _fetch_rows_in(cursor, table, column, values, order_by=None):
+    """Fetch all rows whose `column` is in `values`, chunking the IN (...) list"""
+    rows = []
+    for chunk in _chunked(sorted(values)):
+        placeholders = ', '.join(['%s'] * len(chunk))
+        sql = f"SELECT * FROM {table} WHERE {column} IN ({placeholders})"
+        if order_by:
+            sql += f" ORDER BY {order_by}"
+        cursor.execute(sql, tuple(chunk))
+        rows.extend(get_all_rows_as_dict(cursor))
+    return rows
+
 def _attach_customer_and_items(cursor, invoices):
-    """Helper to attach customer and items to invoice objects"""
+    """Helper to attach customer and items to invoice objects.
+
+    Loads customers, invoice_items and products for the whole list in three
+    batched queries and stitches them together through dict indexes.
+    """
+    if not invoices:
+        return invoices
+
+    customer_rows = _fetch_rows_in(cursor, 'customers', 'c_id', {inv.c_id for inv in invoices})
+    customers = {row['c_id']: Customer(**row) for row in customer_rows}
+
+    item_rows = _fetch_rows_in(cursor, 'invoice_items', 'invoice_no',
+                               {inv.invoice_no for inv in invoices}, order_by='item_id')
+    items = [InvoiceItem(**row) for row in item_rows]
+
+    product_rows = _fetch_rows_in(cursor, 'products', 'p_id', {item.p_id for item in items})
+    products = {row['p_id']: Product(**row) for row in product_rows}
+
+    items_by_invoice = {}
+    for item in items:
+        product = products.get(item.p_id)
+        if product:
+            item.product = product
+        items_by_invoice.setdefault(item.invoice_no, []).append(item)
+
     for invoice in invoices:
-        # Attach Customer
-        cursor.execute("SELECT * FROM customers WHERE c_id = %s", (invoice.c_id,))
-        c_row = get_row_as_dict(cursor)
-        if c_row:
-            invoice.customer = Customer(**c_row)
-            
-        # Attach Items
-        cursor.execute("SELECT * FROM invoice_items WHERE invoice_no = %s", (invoice.invoice_no,))
-        i_rows = get_all_rows_as_dict(cursor)
-        invoice.invoice_items = []
-        for i_row in i_rows:
-            item = InvoiceItem(**i_row)
-            # Attach Product to Item
-            cursor.execute("SELECT * FROM products WHERE p_id = %s", (item.p_id,))
-            p_row = get_row_as_dict(cursor)
-            if p_row:
-                item.product = Product(**p_row)
-            invoice.invoice_items.append(item)
+        customer = customers.get(invoice.c_id)
+        if customer:
+            invoice.customer = customer
+        invoice.invoice_items = items_by_invoice.get(invoice.invoice_no, [])
     return invoices
 
 def get_invoices_by_seller(seller_id, query=None, customer_query=None, status=None, start_date=None, end_date=None, min_amount=None, max_amount=None):
@@ -659,7 +708,7 @@ def get_invoices_by_seller(seller_id, query=None, customer_query=None, status=No
         rows = get_all_rows_as_dict(cursor)
         invoices = [Invoice(**row) for row in rows]
         
-        # Attach related objects (N+1 problem here, but safe for small scale)
+        # Attach related objects with batched IN (...) lookups
         return _attach_customer_and_items(cursor, invoices)
         
     finally:
@@ -699,21 +748,8 @@ def get_invoices_by_customer(customer_id, seller_id):
         conn.close()
 
 def generate_invoice_id():
-    conn = get_db_connection()
-    if not conn: return "INV-001"
-    try:
-        cursor = conn.cursor()
-        cursor.execute("SELECT invoice_no FROM invoices")
-        existing_ids = {row[0] for row in cursor.fetchall()}
-        
-        invoice_num = 1
-        while True:
-            invoice_id = f"INV-{invoice_num:03d}"
-            if invoice_id not in existing_ids:
-                return invoice_id
-            invoice_num += 1
-    finally:
-        conn.close()
+    """Generate next invoice number (INV-###) from the invoice sequence"""
+    return allocate_id('invoice', 'INV-', 'invoices', 'invoice_no')
 
 def create_invoice(invoice_id, due_date, status, tax, amount, seller_id, customer_id, items):
     conn = get_db_connection()
@@ -732,15 +768,19 @@ def create_invoice(invoice_id, due_date, status, tax, amount, seller_id, custome
         for item in items:
             # Create Item
             item_query = """
-                INSERT INTO invoice_items (invoice_no, p_id, item_quantity, discount)
-                VALUES (%s, %s, %s, %s)
+                INSERT INTO invoice_items (invoice_no, p_id, item_quantity, discount, unit_price, line_total, p_name)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
             """
-            cursor.execute(item_query, (invoice_id, item['product'].p_id, item['quantity'], item['discount']))
+            unit_price = item['product'].p_price
+            cursor.execute(item_query, (invoice_id, item['product'].p_id, item['quantity'], item['discount'],
+                                        unit_price, unit_price * item['quantity'] - item['discount'],
+                                        item['product'].p_name))
             
             # Update Stock
             stock_query = "UPDATE products SET p_stock = p_stock - %s WHERE p_id = %s"
             cursor.execute(stock_query, (item['quantity'], item['product'].p_id))
-            
+        
+        record_stock_movements(cursor, [(item['product'].p_id, -item['quantity'], 'invoice', invoice_id) for item in items])
         conn.commit()
         
         # Return new invoice object (simplified, re-fetch if needed)
@@ -797,10 +837,12 @@ def update_invoice_item(item):
         cursor = conn.cursor()
         query = """
             UPDATE invoice_items 
-            SET item_quantity = %s, discount = %s, p_id = %s
+            SET item_quantity = %s, discount = %s, p_id = %s, unit_price = %s, line_total = %s, p_name = %s
             WHERE item_id = %s
         """
-        cursor.execute(query, (item.item_quantity, item.discount, item.p_id, item.item_id))
+        line_total = item.reprice()
+        cursor.execute(query, (item.item_quantity, item.discount, item.p_id, item.unit_price, line_total,
+                               item.product_name, item.item_id))
         conn.commit()
     finally:
         conn.close()
@@ -820,14 +862,18 @@ def add_invoice_item(invoice_no, product_id, quantity, discount):
     if not conn: return None
     try:
         cursor = conn.cursor()
+        # Snapshot the product's current price and name with the line
         query = """
-            INSERT INTO invoice_items (invoice_no, p_id, item_quantity, discount)
-            VALUES (%s, %s, %s, %s)
+            INSERT INTO invoice_items (invoice_no, p_id, item_quantity, discount, unit_price, line_total, p_name)
+            SELECT %s, p_id, %s, %s, p_price, p_price * %s - %s, p_name FROM products WHERE p_id = %s
         """
-        cursor.execute(query, (invoice_no, product_id, quantity, discount))
+        cursor.execute(query, (invoice_no, quantity, discount, quantity, discount, product_id))
+        cursor.execute("SELECT p_price, p_name FROM products WHERE p_id = %s", (product_id,))
+        row = cursor.fetchone()
         conn.commit()
         # Return object
-        return InvoiceItem(None, invoice_no, product_id, quantity, discount)
+        return InvoiceItem(None, invoice_no, product_id, quantity, discount,
+                           unit_price=row[0] if row else None, p_name=row[1] if row else None)
     finally:
         conn.close()
 
@@ -15,7 +15,8 @@ CREATE TABLE IF NOT EXISTS customers (
     c_address TEXT NOT NULL,
     password VARCHAR(255),
     s_id VARCHAR(10),
-    FOREIGN KEY (s_id) REFERENCES sellers(s_id)
+    FOREIGN KEY (s_id) REFERENCES sellers(s_id),
+    INDEX ix_customer_seller_name (s_id, c_name)
 );
 
 CREATE TABLE IF NOT EXISTS products (
@@ -25,7 +26,8 @@ CREATE TABLE IF NOT EXISTS products (
     p_description TEXT,
     p_stock INT NOT NULL DEFAULT 0,
     s_id VARCHAR(10) NOT NULL,
-    FOREIGN KEY (s_id) REFERENCES sellers(s_id)
+    FOREIGN KEY (s_id) REFERENCES sellers(s_id),
+    INDEX ix_product_seller_name (s_id, p_name)
 );
 
 CREATE TABLE IF NOT EXISTS invoices (
@@ -38,7 +40,9 @@ CREATE TABLE IF NOT EXISTS invoices (
     s_id VARCHAR(10) NOT NULL,
     c_id VARCHAR(10) NOT NULL,
     FOREIGN KEY (s_id) REFERENCES sellers(s_id),
-    FOREIGN KEY (c_id) REFERENCES customers(c_id)
+    FOREIGN KEY (c_id) REFERENCES customers(c_id),
+    INDEX ix_invoice_seller_status_datetime (s_id, status, invoice_datetime),
+    INDEX ix_invoice_seller_customer (s_id, c_id)
 );
 
 CREATE TABLE IF NOT EXISTS invoice_items (
@@ -47,8 +51,13 @@ CREATE TABLE IF NOT EXISTS invoice_items (
     p_id VARCHAR(10) NOT NULL,
     item_quantity INT NOT NULL,
     discount DECIMAL(10, 2) NOT NULL DEFAULT 0,
+    unit_price DECIMAL(10, 2) NULL,
+    line_total DECIMAL(12, 2) NULL,
+    p_name VARCHAR(100) NULL,
     FOREIGN KEY (invoice_no) REFERENCES invoices(invoice_no) ON DELETE CASCADE,
-    FOREIGN KEY (p_id) REFERENCES products(p_id)
+    FOREIGN KEY (p_id) REFERENCES products(p_id),
+    INDEX ix_invoice_item_invoice_no (invoice_no),
+    INDEX ix_invoice_item_p_id (p_id)
 );
 
 CREATE TABLE IF NOT EXISTS activities (
@@ -57,5 +66,22 @@ CREATE TABLE IF NOT EXISTS activities (
     user_role VARCHAR(20) NOT NULL,
     action_type VARCHAR(50) NOT NULL,
     description TEXT NOT NULL,
-    timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX ix_activity_user_timestamp (user_id, timestamp)
+);
+
+CREATE TABLE IF NOT EXISTS stock_movements (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    p_id VARCHAR(10) NOT NULL,
+    delta INT NOT NULL,
+    reason VARCHAR(30) NOT NULL,
+    invoice_no VARCHAR(20) NULL,
+    timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    INDEX ix_stock_movement_product_timestamp (p_id, timestamp),
+    INDEX ix_stock_movement_invoice_no (invoice_no)
+);
+
+CREATE TABLE IF NOT EXISTS id_sequences (
+    name VARCHAR(80) PRIMARY KEY,
+    next_value INT NOT NULL
 );
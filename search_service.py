@@ -0,0 +1,199 @@
+"""Ranked, prefix-matching search over products, customers and invoices.
+
+The index used depends on the configured database:
+- SQLite: an FTS5 table per entity, kept in sync by triggers. Each row
+  carries the entity's primary key in an UNINDEXED doc_key column; rowids
+  are not used because VACUUM may renumber them on tables with string keys.
+- MySQL: a FULLTEXT index per entity, queried in boolean mode
+- PostgreSQL: pg_trgm GIN indexes, which serve ILIKE and rank by similarity
+Any other backend, or one whose index could not be created, falls back to ILIKE.
+"""
+import re
+from sqlalchemy import text, literal_column, select, table, column, or_, and_, func
+from sqlalchemy.dialects import mysql
+from extensions import db
+from models import Product, Customer, Invoice
+
+# entity -> (model, indexed columns, column used for fallback ordering)
+SEARCH_ENTITIES = {
+    'product': (Product, ('p_name', 'p_description'), 'p_name'),
+    'customer': (Customer, ('c_name', 'c_email'), 'c_name'),
+    'invoice': (Invoice, ('invoice_no',), 'invoice_no'),
+}
+
+# InnoDB ignores shorter words (innodb_ft_min_token_size); such queries use ILIKE
+MYSQL_MIN_TOKEN_LEN = 3
+
+_backend = None
+
+
+def _tokens(q):
+    return re.findall(r'\w+', q or '')
+
+
+def _fts_table(model):
+    return f'{model.__tablename__}_fts'
+
+
+def _key_column(model):
+    return model.__table__.primary_key.columns.values()[0].name
+
+
+def _ensure_sqlite_fts(conn):
+    for model, fields, _ in SEARCH_ENTITIES.values():
+        base = model.__tablename__
+        fts = _fts_table(model)
+        key = _key_column(model)
+        exists = conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                              {'name': fts}).first()
+        cols = ', '.join(fields)
+        new_values = ', '.join(f'new.{field}' for field in fields)
+        conn.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+                          f"doc_key UNINDEXED, {cols}, tokenize='unicode61 remove_diacritics 2')"))
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {base} BEGIN "
+                          f"INSERT INTO {fts}(doc_key, {cols}) VALUES (new.{key}, {new_values}); END"))
+        # doc_key is not part of the full-text index, so these deletes scan the FTS rows
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {base} BEGIN "
+                          f"DELETE FROM {fts} WHERE doc_key = old.{key}; END"))
+        # Only fires when an indexed column or the key changes (not on stock/status updates)
+        watched = ', '.join(dict.fromkeys((key,) + tuple(fields)))
+        conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {watched} ON {base} BEGIN "
+                          f"DELETE FROM {fts} WHERE doc_key = old.{key}; "
+                          f"INSERT INTO {fts}(doc_key, {cols}) VALUES (new.{key}, {new_values}); END"))
+        if not exists:
+            # Backfill rows written before the index existed
+            _fill_sqlite_fts(conn, model, fields)
+
+
+def _fill_sqlite_fts(conn, model, fields):
+    fts = _fts_table(model)
+    cols = ', '.join(fields)
+    conn.execute(text(f"DELETE FROM {fts}"))
+    conn.execute(text(f"INSERT INTO {fts}(doc_key, {cols}) "
+                      f"SELECT {_key_column(model)}, {cols} FROM {model.__tablename__}"))
+
+
+def _ensure_mysql_fulltext(conn):
+    for model, fields, _ in SEARCH_ENTITIES.values():
+        base = model.__tablename__
+        index_name = f'ft_{base}_search'
+        exists = conn.execute(text(
+            "SELECT 1 FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = :table AND index_name = :index LIMIT 1"
+        ), {'table': base, 'index': index_name}).first()
+        if not exists:
+            conn.execute(text(f"ALTER TABLE {base} ADD FULLTEXT INDEX {index_name} ({', '.join(fields)})"))
+
+
+def _ensure_pg_trgm(conn):
+    conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    for model, fields, _ in SEARCH_ENTITIES.values():
+        base = model.__tablename__
+        for field in fields:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{base}_{field}_trgm "
+                              f"ON {base} USING gin ({field} gin_trgm_ops)"))
+
+
+def ensure_search_index():
+    """Create the search index for the configured backend if missing; returns the backend in use"""
+    global _backend
+    backend = db.engine.dialect.name
+    builders = {
+        'sqlite': _ensure_sqlite_fts,
+        'mysql': _ensure_mysql_fulltext,
+        'postgresql': _ensure_pg_trgm,
+    }
+    if backend not in builders:
+        backend = 'ilike'
+    else:
+        try:
+            with db.engine.begin() as conn:
+                builders[backend](conn)
+        except Exception as e:
+            print(f"Search index unavailable on {backend}, falling back to ILIKE: {e}")
+            backend = 'ilike'
+    _backend = backend
+    return backend
+
+
+def rebuild_search_index():
+    """Rebuild the search index from the base tables; returns the backend in use"""
+    backend = ensure_search_index()
+    if backend == 'sqlite':
+        with db.engine.begin() as conn:
+            for model, fields, _ in SEARCH_ENTITIES.values():
+                fts = _fts_table(model)
+                _fill_sqlite_fts(conn, model, fields)
+                conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('optimize')"))
+    # MySQL FULLTEXT and pg_trgm indexes are maintained by the database itself
+    return backend
+
+
+def _backend_for(tokens):
+    if not tokens or _backend is None:
+        return 'ilike'
+    if _backend == 'mysql' and min(len(token) for token in tokens) < MYSQL_MIN_TOKEN_LEN:
+        return 'ilike'
+    return _backend
+
+
+def _fts5_match(model, tokens, match_any):
+    query = (' OR ' if match_any else ' ').join(f'"{token}"*' for token in tokens)
+    return literal_column(_fts_table(model)).op('MATCH')(query)
+
+
+def _mysql_match(model, fields, tokens, match_any):
+    prefix = '' if match_any else '+'
+    against = ' '.join(f'{prefix}{token}*' for token in tokens)
+    return mysql.match(*[getattr(model, field) for field in fields], against=against).in_boolean_mode()
+
+
+def _ilike_clause(model, fields, q, tokens, match_any):
+    terms = tokens or [q.strip()]
+    per_term = [or_(*[getattr(model, field).ilike(f'%{term}%') for field in fields]) for term in terms]
+    return or_(*per_term) if match_any else and_(*per_term)
+
+
+def match_clause(entity, q, match_any=False):
+    """Filter criterion selecting `entity` rows that match `q` (composable with other filters)"""
+    model, fields, _ = SEARCH_ENTITIES[entity]
+    tokens = _tokens(q)
+    backend = _backend_for(tokens)
+    if backend == 'sqlite':
+        fts = table(_fts_table(model), column('doc_key'))
+        matching = select(fts.c.doc_key).where(_fts5_match(model, tokens, match_any))
+        return getattr(model, _key_column(model)).in_(matching)
+    if backend == 'mysql':
+        return _mysql_match(model, fields, tokens, match_any)
+    return _ilike_clause(model, fields, q, tokens, match_any)
+
+
+def search(seller_id, entity, q, limit=50, match_any=False):
+    """A seller's products, customers or invoices matching `q`, best match first.
+
+    Every word in `q` must match the start of a word in an indexed column
+    (any word when `match_any` is set). `limit=None` returns all matches.
+    """
+    model, fields, order_field = SEARCH_ENTITIES[entity]
+    tokens = _tokens(q)
+    backend = _backend_for(tokens)
+    query = model.query.filter(model.s_id == seller_id)
+
+    if backend == 'sqlite':
+        fts = table(_fts_table(model), column('doc_key'), column('rank'))
+        query = query.join(fts, fts.c.doc_key == getattr(model, _key_column(model))) \
+            .filter(_fts5_match(model, tokens, match_any)) \
+            .order_by(fts.c.rank)
+    elif backend == 'mysql':
+        relevance = _mysql_match(model, fields, tokens, match_any)
+        query = query.filter(relevance).order_by(relevance.desc())
+    else:
+        query = query.filter(_ilike_clause(model, fields, q, tokens, match_any))
+        if backend == 'postgresql':
+            similarity = func.greatest(*[func.similarity(getattr(model, field), q) for field in fields])
+            query = query.order_by(similarity.desc())
+        query = query.order_by(getattr(model, order_field))
+
+    if limit:
+        query = query.limit(limit)
+    return query.all()
@@ -492,6 +492,85 @@ class AIAssistant {
         container.scrollTop = container.scrollHeight;
     }
 
+    // Submit a command as a background job and wait for its result. The server
+    // answers 202 with a job to poll, or the result directly if async mode is off.
+    async sendCommand(payload) {
+        const response = await fetch('/api/ai/process', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ ...payload, async: true })
+        });
+        const data = await response.json();
+        if (response.status !== 202) {
+            return data;
+        }
+
+        let delay = 300;
+        while (true) {
+            await new Promise(resolve => setTimeout(resolve, delay));
+            const poll = await fetch(data.status_url);
+            const result = await poll.json();
+            if (poll.status !== 202) {
+                return result;
+            }
+            delay = Math.min(delay * 1.5, 2000);
+        }
+    }
+
+    // Stream a command from /api/ai/stream. handlers.onIntent fires as soon as the
+    // model has picked an intent and handlers.onText with each piece of the reply.
+    // Resolves to the final result, or null when the browser or server cannot
+    // stream (the caller then falls back to sendCommand).
+    async streamCommand(payload, handlers = {}) {
+        if (!window.ReadableStream || !window.TextDecoder) {
+            return null;
+        }
+        const response = await fetch('/api/ai/stream', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(payload)
+        });
+        const contentType = response.headers.get('Content-Type') || '';
+        if (!contentType.startsWith('text/event-stream')) {
+            return response.ok ? null : await response.json();
+        }
+        if (!response.body) {
+            return null;
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let result = null;
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const frame = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let event = 'message';
+                let dataLines = [];
+                for (const line of frame.split('\n')) {
+                    if (line.startsWith('event:')) event = line.slice(6).trim();
+                    else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+                }
+                if (!dataLines.length) continue;
+                const data = JSON.parse(dataLines.join('\n'));
+                if (event === 'intent' && handlers.onIntent) {
+                    handlers.onIntent(data);
+                } else if (event === 'text' && handlers.onText) {
+                    handlers.onText(data);
+                } else if (event === 'result' || event === 'error') {
+                    result = data;
+                }
+            }
+        }
+        return result;
+    }
+
     async handleUserInput(text) {
         this.addMessage(text, 'user');
         this.chatHistory.push({ role: 'user', content: text });
@@ -509,18 +588,42 @@ class AIAssistant {
         container.appendChild(loadingDiv);
         container.scrollTop = container.scrollHeight;
 
+        const payload = {
+            text: text,
+            history: this.chatHistory,
+            language: this.selectedLang
+        };
+        const loadingText = loadingDiv.querySelector('.ai-text');
+        let streamedText = '';
+        let pendingSpeech = '';
+        let spoken = false;
+
         try {
-            const response = await fetch('/api/ai/process', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    text: text,
-                    history: this.chatHistory,
-                    language: this.selectedLang
-                })
+            let data = await this.streamCommand(payload, {
+                onIntent: (intent) => {
+                    if (intent === 'navigation') {
+                        loadingText.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Opening...';
+                    }
+                },
+                onText: (chunk) => {
+                    streamedText += chunk;
+                    loadingText.textContent = streamedText;
+                    container.scrollTop = container.scrollHeight;
+
+                    // Start speaking as soon as the first sentence is complete
+                    pendingSpeech += chunk;
+                    const ends = [...pendingSpeech.matchAll(/[.!?](?=\s)|[।。！？]/g)];
+                    if (ends.length) {
+                        const cut = ends[ends.length - 1].index + 1;
+                        this.speak(pendingSpeech.slice(0, cut), spoken);
+                        pendingSpeech = pendingSpeech.slice(cut);
+                        spoken = true;
+                    }
+                }
             });
-
-            const data = await response.json();
+            if (!data) {
+                data = await this.sendCommand(payload);
+            }
             document.getElementById(loadingId).remove();
 
             if (data.error) {
@@ -531,7 +634,11 @@ class AIAssistant {
 
             this.addMessage(data.response_text, 'ai');
             this.chatHistory.push({ role: 'model', content: data.response_text });
-            this.speak(data.response_text);
+            if (!spoken) {
+                this.speak(data.response_text);
+            } else if (pendingSpeech.trim()) {
+                this.speak(pendingSpeech, true);
+            }
 
             // Handle different intents
             if (data.intent === 'navigation') {
@@ -571,10 +678,14 @@ class AIAssistant {
         }
     }
 
-    speak(text) {
+    // With queue set the text is spoken after the current utterance (streamed
+    // replies arrive a sentence at a time) instead of interrupting it.
+    speak(text, queue = false) {
         if (this.synth) {
             // Cancel any current speech in the queue to prevent freezes
-            this.synth.cancel();
+            if (!queue) {
+                this.synth.cancel();
+            }
 
             // Prepare text for speech synthesis by removing emojis and formatting
             let cleanText = text || '';
@@ -800,16 +911,10 @@ class AIAssistant {
         
         try {
             // Use the AI process endpoint which handles customer addition
-            const response = await fetch('/api/ai/process', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                    text: `add customer name ${data.name} email ${data.email}${data.phone ? ' phone ' + data.phone : ''}${data.address ? ' address ' + data.address : ''}`,
-                    history: []
-                })
+            const result = await this.sendCommand({
+                text: `add customer name ${data.name} email ${data.email}${data.phone ? ' phone ' + data.phone : ''}${data.address ? ' address ' + data.address : ''}`,
+                history: []
             });
-
-            const result = await response.json();
             
             if (result.success && result.customer_id) {
                 this.addMessage("✅ Customer added successfully! Redirecting to customers page...", 'ai');
@@ -0,0 +1,181 @@
+"""Seller dashboard statistics.
+
+seller_stats_query computes every figure in a single aggregate query. It is
+built from the table objects passed in, so the ORM tables and the raw-SQL
+tables from schema.sql share one definition; it is also what rebuilds the
+seller_stats rollup, which dashboards read in O(1) and write paths keep
+current through apply_stats_delta / record_invoice_change. Every such write
+also bumps seller_stats.version, which per-seller caches use to detect that
+the seller's data changed.
+"""
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import select, update, func, case
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import Seller, Invoice, Product, Customer, SellerStats
+
+CENT = Decimal('0.01')
+
+STATS_COUNT_FIELDS = ('total_products', 'total_customers', 'total_invoices',
+                      'paid_invoices', 'unpaid_invoices', 'overdue_invoices')
+STATS_AMOUNT_FIELDS = ('revenue_collected', 'revenue_due', 'revenue_total')
+
+
+def seller_stats_query(invoices, products, customers, seller_id):
+    """Select every dashboard figure for one seller in one round trip"""
+    inv = invoices.c
+
+    def count_status(*statuses):
+        return func.coalesce(func.sum(case((inv.status.in_(statuses), 1), else_=0)), 0)
+
+    def sum_status(*statuses):
+        return func.coalesce(func.sum(case((inv.status.in_(statuses), inv.amount), else_=0)), 0)
+
+    product_count = select(func.count()).select_from(products).where(products.c.s_id == seller_id).scalar_subquery()
+    customer_count = select(func.count()).select_from(customers).where(customers.c.s_id == seller_id).scalar_subquery()
+
+    return select(
+        product_count.label('total_products'),
+        customer_count.label('total_customers'),
+        func.count(inv.invoice_no).label('total_invoices'),
+        count_status('paid').label('paid_invoices'),
+        count_status('pending').label('unpaid_invoices'),
+        count_status('overdue').label('overdue_invoices'),
+        sum_status('paid').label('revenue_collected'),
+        sum_status('pending', 'overdue').label('revenue_due'),
+        func.coalesce(func.sum(inv.amount), 0).label('revenue_total'),
+    ).select_from(invoices).where(inv.s_id == seller_id)
+
+
+def to_decimal(value):
+    """Money value as a 2-place Decimal (SQLite hands sums back as floats)"""
+    if value is None:
+        return Decimal('0.00')
+    if not isinstance(value, Decimal):
+        value = Decimal(str(value))
+    return value.quantize(CENT)
+
+
+def seller_stats_from_row(row):
+    """Turn the aggregate row (mapping) into the dashboard stats dict"""
+    stats = {field: int(row[field] or 0) for field in STATS_COUNT_FIELDS}
+    stats.update({field: to_decimal(row[field]) for field in STATS_AMOUNT_FIELDS})
+    return stats
+
+
+def get_seller_stats(seller_id):
+    """Dashboard stats for a seller via the ORM session"""
+    query = seller_stats_query(Invoice.__table__, Product.__table__, Customer.__table__, seller_id)
+    row = db.session.execute(query).mappings().one()
+    return seller_stats_from_row(row)
+
+
+# --- Incrementally maintained rollup (seller_stats) ---
+
+def _invoice_contribution(status, amount):
+    """Rollup fields a single invoice with this status and amount adds to"""
+    amount = to_decimal(amount)
+    contribution = {'total_invoices': 1, 'revenue_total': amount}
+    if status == 'paid':
+        contribution.update(paid_invoices=1, revenue_collected=amount)
+    elif status == 'pending':
+        contribution.update(unpaid_invoices=1, revenue_due=amount)
+    elif status == 'overdue':
+        contribution.update(overdue_invoices=1, revenue_due=amount)
+    return contribution
+
+
+def apply_stats_delta(seller_id, **deltas):
+    """Add deltas to a seller's rollup row and bump its version, inside the caller's transaction"""
+    deltas = {field: value for field, value in deltas.items() if value}
+    # Make pending ORM changes visible in case the row has to be rebuilt
+    db.session.flush()
+    table = SellerStats.__table__
+    values = {field: table.c[field] + value for field, value in deltas.items()}
+    values['version'] = table.c.version + 1
+    values['updated_at'] = datetime.utcnow()
+    result = db.session.execute(update(table).where(table.c.s_id == seller_id).values(**values))
+    if result.rowcount == 0:
+        # No rollup yet: the rebuild already reflects the flushed change
+        rebuild_seller_stats(seller_id)
+
+
+def touch_seller_stats(seller_id):
+    """Bump a seller's version for writes that leave the rollup figures unchanged (edits)"""
+    apply_stats_delta(seller_id)
+
+
+def record_invoice_change(seller_id, old=None, new=None):
+    """Apply an invoice insert (old=None), update, or delete (new=None) to the rollup.
+
+    `old` and `new` are (status, amount) pairs.
+    """
+    deltas = {}
+    if old:
+        for field, value in _invoice_contribution(*old).items():
+            deltas[field] = deltas.get(field, 0) - value
+    if new:
+        for field, value in _invoice_contribution(*new).items():
+            deltas[field] = deltas.get(field, 0) + value
+    apply_stats_delta(seller_id, **deltas)
+
+
+def rebuild_seller_stats(seller_id):
+    """Recompute one seller's rollup from the base tables and upsert it"""
+    values = get_seller_stats(seller_id)
+    values['updated_at'] = datetime.utcnow()
+    table = SellerStats.__table__
+    result = db.session.execute(update(table).where(table.c.s_id == seller_id)
+                                .values(version=table.c.version + 1, **values))
+    if result.rowcount == 0:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert().values(s_id=seller_id, **values))
+        except IntegrityError:
+            # Created concurrently; overwrite with our recomputation
+            db.session.execute(update(table).where(table.c.s_id == seller_id).values(**values))
+    return values
+
+
+def rebuild_all_seller_stats(missing_only=False):
+    """Reconcile the rollup for every seller (or only sellers without a row); returns the count"""
+    seller_ids = [s_id for (s_id,) in db.session.query(Seller.s_id)]
+    if missing_only:
+        have = {s_id for (s_id,) in db.session.query(SellerStats.s_id)}
+        seller_ids = [s_id for s_id in seller_ids if s_id not in have]
+    for seller_id in seller_ids:
+        rebuild_seller_stats(seller_id)
+    db.session.commit()
+    return len(seller_ids)
+
+
+def get_dashboard_stats(seller_id):
+    """Dashboard stats from the rollup row (a primary key read), rebuilding it if missing"""
+    row = db.session.get(SellerStats, seller_id)
+    if row is None:
+        stats = rebuild_seller_stats(seller_id)
+        db.session.commit()
+        stats.pop('updated_at', None)
+        return stats
+    stats = {field: getattr(row, field) or 0 for field in STATS_COUNT_FIELDS}
+    stats.update({field: to_decimal(getattr(row, field)) for field in STATS_AMOUNT_FIELDS})
+    return stats
+
+
+def get_stats_version(seller_id):
+    """Current version of a seller's data (0 if no rollup row yet)"""
+    table = SellerStats.__table__
+    return db.session.execute(select(table.c.version).where(table.c.s_id == seller_id)).scalar() or 0
+
+
+def get_admin_totals():
+    """System-wide totals summed over the rollup rows"""
+    table = SellerStats.__table__
+    row = db.session.execute(select(
+        func.count().label('total_sellers'),
+        func.coalesce(func.sum(table.c.total_customers), 0).label('total_customers'),
+        func.coalesce(func.sum(table.c.total_products), 0).label('total_products'),
+        func.coalesce(func.sum(table.c.total_invoices), 0).label('total_invoices'),
+    )).mappings().one()
+    return {field: int(value) for field, value in row.items()}
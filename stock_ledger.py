@@ -0,0 +1,123 @@
+"""Stock ledger maintenance and history reads.
+
+product.p_stock is the materialized sum of the product's stock_movement
+deltas. verify_ledger() finds products where the two disagree (a write that
+bypassed stock_service) and can record the difference as a 'correction'
+movement. compact_ledger() folds each product's movements older than the
+retention window into one 'compacted' row, so point-in-time reads stay exact
+from that horizon onwards while the table stays small.
+"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, exists, func, insert, literal, select
+
+from extensions import db
+from models import Product, StockMovement
+from maintenance import claim_daily_run
+from stock_service import OPENING, CORRECTION, COMPACTED
+
+STOCK_LEDGER_JOB = 'stock_ledger'
+
+# Products folded per transaction while compacting
+COMPACT_BATCH_SIZE = 500
+
+
+def backfill_opening_balances():
+    """Give products without any movement an 'opening' row for their current stock; returns rows added"""
+    movement = StockMovement.__table__
+    product = Product.__table__
+    missing = select(product.c.p_id, product.c.p_stock, literal(OPENING), literal(datetime.utcnow())).where(
+        product.c.p_stock != 0,
+        ~exists().where(movement.c.p_id == product.c.p_id),
+    )
+    with db.engine.begin() as conn:
+        result = conn.execute(insert(movement).from_select(['p_id', 'delta', 'reason', 'timestamp'], missing))
+    return result.rowcount
+
+
+def stock_at(product_ids, when):
+    """{p_id: on-hand quantity at `when`}, rewound from p_stock by the later movements"""
+    later = select(StockMovement.p_id, func.sum(StockMovement.delta).label('delta')) \
+        .where(StockMovement.p_id.in_(product_ids), StockMovement.timestamp > when) \
+        .group_by(StockMovement.p_id).subquery()
+    rows = db.session.execute(
+        select(Product.p_id, Product.p_stock - func.coalesce(later.c.delta, 0))
+        .outerjoin(later, later.c.p_id == Product.p_id)
+        .where(Product.p_id.in_(product_ids))
+    ).all()
+    return {p_id: int(quantity) for p_id, quantity in rows}
+
+
+def stock_movements(p_id, limit=50):
+    """Latest ledger rows for a product, newest first"""
+    return StockMovement.query.filter_by(p_id=p_id) \
+        .order_by(StockMovement.timestamp.desc(), StockMovement.id.desc()).limit(limit).all()
+
+
+def verify_ledger(repair=False):
+    """[(p_id, p_stock, ledger sum)] for products whose balance disagrees with the ledger.
+
+    With repair=True each difference is written as a 'correction' movement,
+    keeping p_stock as the figure of record.
+    """
+    totals = select(StockMovement.p_id, func.sum(StockMovement.delta).label('total')) \
+        .group_by(StockMovement.p_id).subquery()
+    ledger = func.coalesce(totals.c.total, 0)
+    mismatches = [
+        (p_id, stock, int(total)) for p_id, stock, total in db.session.execute(
+            select(Product.p_id, Product.p_stock, ledger)
+            .outerjoin(totals, totals.c.p_id == Product.p_id)
+            .where(func.coalesce(Product.p_stock, 0) != ledger)
+        ).all()
+    ]
+    if repair and mismatches:
+        now = datetime.utcnow()
+        db.session.execute(insert(StockMovement), [
+            {'p_id': p_id, 'delta': (stock or 0) - total, 'reason': CORRECTION, 'timestamp': now}
+            for p_id, stock, total in mismatches
+        ])
+        db.session.commit()
+    else:
+        db.session.rollback()
+    return mismatches
+
+
+def compact_ledger(keep_days, now=None):
+    """Fold movements older than keep_days into one row per product; returns rows removed"""
+    cutoff = (now or datetime.utcnow()) - timedelta(days=keep_days)
+    movement = StockMovement.__table__
+    with db.engine.connect() as conn:
+        groups = conn.execute(
+            select(movement.c.p_id, func.sum(movement.c.delta), func.count(), func.max(movement.c.timestamp))
+            .where(movement.c.timestamp < cutoff)
+            .group_by(movement.c.p_id)
+            .having(func.count() > 1)
+        ).all()
+    removed = 0
+    for start in range(0, len(groups), COMPACT_BATCH_SIZE):
+        batch = groups[start:start + COMPACT_BATCH_SIZE]
+        with db.engine.begin() as conn:
+            conn.execute(delete(movement).where(
+                and_(movement.c.p_id.in_([p_id for p_id, _, _, _ in batch]), movement.c.timestamp < cutoff)))
+            # Stamped with the newest folded row so reads at or after it stay exact
+            conn.execute(insert(movement), [
+                {'p_id': p_id, 'delta': int(total), 'reason': COMPACTED, 'invoice_no': None, 'timestamp': last}
+                for p_id, total, _, last in batch
+            ])
+        removed += sum(count - 1 for _, _, count, _ in batch)
+    return removed
+
+
+def run_stock_ledger_job(keep_days, repair=False, force=False):
+    """Compact and verify once per day across workers; returns (rows removed, mismatches) or None if skipped"""
+    try:
+        if not claim_daily_run(STOCK_LEDGER_JOB) and not force:
+            db.session.rollback()
+            return None
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    removed = compact_ledger(keep_days)
+    mismatches = verify_ledger(repair=repair)
+    return removed, mismatches
@@ -0,0 +1,132 @@
+"""Atomic stock adjustments.
+
+All stock changes of one operation (an invoice's line items, an invoice edit)
+go to the database as a single conditional UPDATE:
+
+    UPDATE product SET p_stock = p_stock + CASE p_id WHEN ... END
+    WHERE p_id IN (...) AND p_stock + CASE p_id WHEN ... END >= 0
+
+The stock check and the write happen in the database, so two concurrent
+invoices cannot oversell and no row lock is held while Python runs. When a
+row fails its condition the statement is rolled back to a savepoint and the
+products that are short are reported.
+
+Every change is also appended to the stock_movement ledger in the same
+savepoint, so product.p_stock stays a materialized balance of the ledger
+(see stock_ledger for verification, compaction and point-in-time reads).
+New products get an 'opening' movement for their initial stock.
+"""
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import case, event, insert, select, update
+from sqlalchemy.orm.util import identity_key
+
+from extensions import db
+from models import Product, StockMovement
+
+# Movement reasons
+OPENING = 'opening'
+INVOICE = 'invoice'
+INVOICE_EDIT = 'invoice_edit'
+INVOICE_CANCELLED = 'invoice_cancelled'
+ADJUSTMENT = 'adjustment'
+CORRECTION = 'correction'
+COMPACTED = 'compacted'
+
+StockShortage = namedtuple('StockShortage', 'p_id p_name requested available')
+
+# Attempts when a concurrent write changes stock between the update and the shortage check
+MAX_ATTEMPTS = 3
+
+
+def _expire_cached(product_ids):
+    """Make loaded Product objects re-read p_stock after a bulk UPDATE"""
+    for p_id in product_ids:
+        product = db.session.identity_map.get(identity_key(Product, p_id))
+        if product is not None:
+            db.session.expire(product, ['p_stock'])
+
+
+def merge_quantities(pairs):
+    """{p_id: total} from (p_id, quantity) pairs (a product may appear on several lines)"""
+    totals = {}
+    for p_id, quantity in pairs:
+        totals[p_id] = totals.get(p_id, 0) + quantity
+    return totals
+
+
+def adjust_stock(deltas, reason, invoice_no=None):
+    """Apply {p_id: delta} (negative takes stock) in one conditional UPDATE.
+
+    The deltas are recorded in the ledger with `reason` and `invoice_no`.
+    Returns a list of StockShortage for the products that lack stock, in
+    which case nothing was changed; an empty list means every delta applied.
+    """
+    deltas = {p_id: delta for p_id, delta in deltas.items() if delta}
+    if not deltas:
+        return []
+    change = case(deltas, value=Product.p_id)
+    statement = (
+        update(Product)
+        .where(Product.p_id.in_(list(deltas)), Product.p_stock + change >= 0)
+        .values(p_stock=Product.p_stock + change)
+        .execution_options(synchronize_session=False)
+    )
+    for _ in range(MAX_ATTEMPTS):
+        savepoint = db.session.begin_nested()
+        updated = db.session.execute(statement).rowcount
+        if updated == len(deltas):
+            now = datetime.utcnow()
+            db.session.execute(insert(StockMovement), [
+                {'p_id': p_id, 'delta': delta, 'reason': reason, 'invoice_no': invoice_no, 'timestamp': now}
+                for p_id, delta in deltas.items()
+            ])
+            savepoint.commit()
+            _expire_cached(deltas)
+            return []
+        savepoint.rollback()
+
+        rows = db.session.execute(
+            select(Product.p_id, Product.p_name, Product.p_stock).where(Product.p_id.in_(list(deltas)))
+        ).all()
+        found = {p_id: (name, stock) for p_id, name, stock in rows}
+        shortages = [
+            StockShortage(p_id, found.get(p_id, (p_id, 0))[0], -delta, found.get(p_id, (None, 0))[1])
+            for p_id, delta in deltas.items()
+            if p_id not in found or found[p_id][1] + delta < 0
+        ]
+        if shortages:
+            return shortages
+        # Stock was replenished in between: try again
+    return [StockShortage(p_id, p_id, -delta, None) for p_id, delta in deltas.items() if delta < 0]
+
+
+def decrement_stock(quantities, reason=INVOICE, invoice_no=None):
+    """Take {p_id: quantity} from stock, all or nothing; returns shortages"""
+    return adjust_stock({p_id: -quantity for p_id, quantity in quantities.items()}, reason, invoice_no)
+
+
+def restore_stock(quantities, reason=INVOICE_CANCELLED, invoice_no=None):
+    """Put {p_id: quantity} back into stock"""
+    return adjust_stock(dict(quantities), reason, invoice_no)
+
+
+def set_stock(product, new_stock, reason=ADJUSTMENT):
+    """Bring a product's stock to new_stock through the ledger; returns shortages"""
+    return adjust_stock({product.p_id: new_stock - (product.p_stock or 0)}, reason)
+
+
+def describe_shortages(shortages):
+    """Flash-ready text naming each short product and what is available"""
+    return '; '.join(
+        f'"{s.p_name}" (requested {s.requested}, available {s.available if s.available is not None else "unknown"})'
+        for s in shortages
+    )
+
+
+@event.listens_for(Product, 'after_insert')
+def _record_opening_stock(mapper, connection, target):
+    if target.p_stock:
+        connection.execute(insert(StockMovement.__table__).values(
+            p_id=target.p_id, delta=target.p_stock, reason=OPENING, timestamp=datetime.utcnow()))
@@ -0,0 +1,58 @@
+import os
+import sys
+import uuid
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """The app on a throwaway SQLite database with the demo data, lazy-load guard on"""
+    os.environ['DATABASE_URL'] = f"sqlite:///{tmp_path_factory.mktemp('db') / 'test.db'}"
+    os.environ['LAZY_LOAD_GUARD'] = 'true'
+    for key in ('GROQ_API_KEY', 'GEMINI_API_KEY'):
+        os.environ.pop(key, None)
+    os.chdir(ROOT)
+    import app as app_module
+    app_module.app.config['PROPAGATE_EXCEPTIONS'] = True
+    return app_module.app
+
+
+@pytest.fixture
+def seller_client(app):
+    client = app.test_client()
+    response = client.post('/login', data={'email': 'demo@invoiceai.com', 'password': 'demo123'})
+    assert response.status_code == 302
+    return client
+
+
+@pytest.fixture
+def seller_id(app):
+    from models import Seller
+    with app.app_context():
+        return Seller.query.filter_by(s_email='demo@invoiceai.com').one().s_id
+
+
+@pytest.fixture
+def make_products(app, seller_id):
+    """Factory: make_products(5, 5) adds products with those stocks for the demo seller; returns their ids"""
+    from extensions import db
+    from models import Product
+    from stats import apply_stats_delta
+
+    def make(*stocks):
+        ids = []
+        with app.app_context():
+            for stock in stocks:
+                p_id = f'T-{uuid.uuid4().hex[:12]}'
+                db.session.add(Product(p_id=p_id, p_name=f'Test product {p_id}', p_price=10, p_stock=stock,
+                                       s_id=seller_id))
+                apply_stats_delta(seller_id, total_products=1)
+                db.session.commit()
+                ids.append(p_id)
+        return ids
+    return make
@@ -0,0 +1,42 @@
+import gzip
+import json
+from datetime import date, datetime
+
+from sqlalchemy import insert
+
+from activity_retention import compact_partitions, partition_table
+from extensions import db
+from models import ActivityDailySummary
+
+MONTH = date(2001, 1, 1)
+
+
+def _add_partition_rows(ids):
+    part = partition_table(MONTH)
+    part.create(db.engine, checkfirst=True)
+    with db.engine.begin() as conn:
+        conn.execute(insert(part), [
+            {'id': activity_id, 'user_id': 'RET-1', 'user_role': 'seller', 'action_type': 'login',
+             'description': f'event {activity_id}', 'timestamp': datetime(2001, 1, 15, 9)}
+            for activity_id in ids
+        ])
+
+
+def _archived_ids(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        return [json.loads(line)['id'] for line in archive]
+
+
+def test_late_rows_get_their_own_archive_and_add_to_the_summary(app, tmp_path):
+    with app.app_context():
+        _add_partition_rows([900001, 900002, 900003])
+        assert compact_partitions(12, str(tmp_path)) == {MONTH: 3}
+
+        # Late rows recreate the month's table after it was compacted
+        _add_partition_rows([900004])
+        assert compact_partitions(12, str(tmp_path)) == {MONTH: 1}
+
+        assert _archived_ids(tmp_path / 'activity_200101.jsonl.gz') == [900001, 900002, 900003]
+        assert _archived_ids(tmp_path / 'activity_200101.1.jsonl.gz') == [900004]
+        summary = ActivityDailySummary.query.filter_by(user_id='RET-1').one()
+        assert (summary.day, summary.action_type, summary.count) == (date(2001, 1, 15), 'login', 4)
@@ -0,0 +1,27 @@
+from models import Activity, Customer
+
+
+def test_rolled_back_request_writes_no_activity(app, seller_client):
+    # An inline customer plus an unknown product: the whole invoice, customer included, is rolled back
+    response = seller_client.post('/seller/invoices/create', data={
+        'customer_id': 'temp_1',
+        'temp_customer_name': 'Phantom Person',
+        'temp_customer_email': 'phantom@example.com',
+        'temp_customer_phone': '1',
+        'temp_customer_address': 'nowhere',
+        'product_1_id': 'NO-SUCH-PRODUCT',
+        'quantity_1': '1',
+    })
+    assert response.status_code == 302
+
+    with app.app_context():
+        assert Customer.query.filter_by(c_email='phantom@example.com').count() == 0
+        assert Activity.query.filter(Activity.description.contains('Phantom Person')).count() == 0
+
+
+def test_committed_request_writes_its_activity(app, seller_client):
+    seller_client.post('/seller/customers/add', data={
+        'name': 'Sink Customer', 'email': 'sink@example.com', 'phone': '1', 'address': 'a'})
+
+    with app.app_context():
+        assert Activity.query.filter(Activity.description.contains('Sink Customer')).count() == 1
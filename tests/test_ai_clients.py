@@ -0,0 +1,13 @@
+import ai_clients
+
+
+def test_reload_swaps_in_a_new_session_before_closing_the_old(monkeypatch):
+    monkeypatch.setattr(ai_clients, 'load_dotenv', lambda **kwargs: None)
+    old = ai_clients.http_session()
+    closed = []
+    monkeypatch.setattr(old, 'close', lambda: closed.append(ai_clients._http_session is not old))
+
+    ai_clients.reload_clients()
+
+    assert closed == [True]
+    assert ai_clients.http_session() is not old
@@ -0,0 +1,85 @@
+import threading
+
+import pytest
+
+from ai_jobs import JobQueue, JobRejected
+
+
+def _login_seller_id(app):
+    from models import Seller
+    with app.app_context():
+        return Seller.query.filter_by(s_email='demo@invoiceai.com').one().s_id
+
+
+def test_a_job_is_visible_to_every_worker(app):
+    owner = _login_seller_id(app)
+    accepting, polling = JobQueue(app, workers=1), JobQueue(app, workers=1)
+    with app.app_context():
+        job_id = accepting.submit(owner, lambda: {'answer': 42}).id
+    accepting._executor.shutdown(wait=True)
+
+    with app.app_context():
+        job = polling.get(job_id, owner)
+        assert job.status == 'done' and job.result == {'answer': 42}
+        assert polling.get(job_id, 'someone-else') is None
+
+
+def test_per_seller_cap_spans_workers(app, seller_client):
+    owner = _login_seller_id(app)
+    release = threading.Event()
+    first, second = JobQueue(app, per_owner=2), JobQueue(app, per_owner=2)
+    try:
+        with app.app_context():
+            waiting_id = first.submit(owner, release.wait).id
+            second.submit(owner, release.wait)
+            with pytest.raises(JobRejected) as rejected:
+                first.submit(owner, release.wait)
+        assert rejected.value.status_code == 429
+
+        # An unfinished job's event stream ends at once with a retry hint
+        events = seller_client.get(f'/api/ai/jobs/{waiting_id}/events').get_data(as_text=True)
+        assert events.startswith('retry: ') and 'event: status' in events
+    finally:
+        release.set()
+        first._executor.shutdown(wait=True)
+        second._executor.shutdown(wait=True)
+
+
+def test_job_endpoints_answer_from_the_shared_store(app, seller_client):
+    response = seller_client.post('/api/ai/process', json={'text': 'go to dashboard', 'async': True})
+    assert response.status_code == 202
+    status_url, events_url = response.json['status_url'], response.json['events_url']
+
+    for _ in range(100):
+        poll = seller_client.get(status_url)
+        if poll.status_code != 202:
+            break
+        threading.Event().wait(0.05)
+    assert poll.status_code == 200
+
+    events = seller_client.get(events_url)
+    assert events.mimetype == 'text/event-stream'
+    assert events.get_data(as_text=True).startswith('event: result')
+
+
+def test_streamed_commands_share_the_admission_checks(app, seller_client):
+    from models import AIJob
+    owner = _login_seller_id(app)
+    release = threading.Event()
+    busy = JobQueue(app, per_owner=app.config['AI_JOB_PER_SELLER'])
+    try:
+        with app.app_context():
+            for _ in range(app.config['AI_JOB_PER_SELLER']):
+                busy.submit(owner, release.wait)
+        rejected = seller_client.post('/api/ai/stream', json={'text': 'go to dashboard'})
+        assert rejected.status_code == 429
+    finally:
+        release.set()
+        busy._executor.shutdown(wait=True)
+
+    response = seller_client.post('/api/ai/stream', json={'text': 'go to dashboard'})
+    assert response.mimetype == 'text/event-stream'
+    assert 'event: result' in response.get_data(as_text=True)
+    response.close()
+    with app.app_context():
+        assert AIJob.query.filter(AIJob.owner == owner, AIJob.status.in_(('queued', 'running'))).count() == 0
@@ -0,0 +1,82 @@
+import pytest
+
+from command_grammar import GRAMMAR_FALLBACK_CONFIDENCE, GRAMMAR_MIN_CONFIDENCE, parse_structured_command
+
+# (utterance, language, expected price, expected stock)
+CONFIDENT_NUMBERS = [
+    ('add product TV price 12,000 stock 1,000', 'en-IN', 12000.0, 1000),
+    ('add product TV price 45,999', 'en-IN', 45999.0, 0),
+    ('add product TV price 1,00,000 stock 5', 'en-IN', 100000.0, 5),
+    ('add product TV price 12,34,567.50 stock 2', 'en-IN', 1234567.5, 2),
+    ('add product Milk price 50 stock 100', 'en-IN', 50.0, 100),
+    ('add product Milk price 49.99 stock 100.', 'en-US', 49.99, 100),
+    ('ajouter produit Lait prix 12,50 stock 10', 'fr-FR', 12.5, 10),
+    ('füge produkt Milch preis 1.299 bestand 10 hinzu', 'de-DE', 1299.0, 10),
+    ('agregar producto Leche precio 2,75 stock 3', 'es-ES', 2.75, 3),
+]
+
+# Numbers that must not be applied without the model
+DOUBTFUL_NUMBERS = [
+    ('add product TV price -5', 'en-IN'),
+    ('add product TV price −5 stock 3', 'en-IN'),
+    ('add product TV price 12,5', 'en-IN'),
+    ('add product TV price 50 stock 2.5', 'en-IN'),
+    ('add product TV price 50 stock -3', 'en-IN'),
+    ('agregar producto Leche precio 1,000', 'es-ES'),
+    ('add product TV price 1.2.3', 'en-IN'),
+]
+
+# Misreads where the name swallowed a price, unit, target invoice or document: left to the model
+MUST_DECLINE = [
+    ('add product Milk for 50 rupees', 'en-IN'),
+    ('add product Milk 50 rs', 'en-IN'),
+    ('add product Milk ₹ 50', 'en-IN'),
+    ('add new item to invoice 12', 'en-IN'),
+    ('add product Milk to invoice 4', 'en-IN'),
+    ('add a product to the bill', 'en-IN'),
+    ('ajouter produit Lait pour la facture 3', 'fr-FR'),
+]
+
+
+@pytest.mark.parametrize('text, language, price, stock', CONFIDENT_NUMBERS)
+def test_numbers_are_read_per_locale(text, language, price, stock):
+    result, confidence = parse_structured_command(text, language)
+    assert result['intent'] == 'add_product'
+    assert result['data']['price'] == price
+    assert result['data']['stock'] == stock
+    assert confidence >= GRAMMAR_MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize('text, language', DOUBTFUL_NUMBERS)
+def test_doubtful_numbers_are_not_applied(text, language):
+    result, confidence = parse_structured_command(text, language)
+    assert result['intent'] == 'add_product'
+    assert confidence < GRAMMAR_FALLBACK_CONFIDENCE
+
+
+@pytest.mark.parametrize('text, language, intent, name', [
+    ('add customer Rahul Gupta email rahul@example.com', 'en-IN', 'add_customer', 'rahul gupta'),
+    ('ग्राहक जोड़ो राहुल ईमेल rahul@example.com', 'hi-IN', 'add_customer', 'राहुल'),
+    ('add product Milk price 50 stock 100', 'en-IN', 'add_product', 'milk'),
+])
+def test_intent_and_name(text, language, intent, name):
+    result, _ = parse_structured_command(text, language)
+    assert result['intent'] == intent
+    assert result['data']['name'].lower() == name
+
+
+@pytest.mark.parametrize('text, language', MUST_DECLINE)
+def test_names_with_prices_or_targets_are_declined(text, language):
+    _, confidence = parse_structured_command(text, language)
+    assert confidence < GRAMMAR_FALLBACK_CONFIDENCE
+
+
+def test_digits_in_a_name_need_the_model_to_confirm():
+    result, confidence = parse_structured_command('add product iPhone 15', 'en-IN')
+    assert result['data']['name'] == 'iPhone 15'
+    assert GRAMMAR_FALLBACK_CONFIDENCE <= confidence < GRAMMAR_MIN_CONFIDENCE
+
+
+def test_questions_are_not_commands():
+    _, confidence = parse_structured_command('how do I add a product?', 'en-IN')
+    assert confidence < GRAMMAR_MIN_CONFIDENCE
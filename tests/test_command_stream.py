@@ -0,0 +1,52 @@
+import pytest
+
+import ai_service
+from provider_router import get_health
+
+
+@pytest.fixture
+def groq_only(monkeypatch):
+    monkeypatch.setattr(ai_service, 'route_heuristically', lambda *args: None)
+    monkeypatch.setattr(ai_service, 'get_api_keys', lambda: ('test-key', None))
+    monkeypatch.setattr(ai_service, 'build_prompt_context', lambda text, context, history, language: ('', history))
+    breaker = get_health('Groq').breaker
+    breaker.state, breaker.failures, breaker.opened_at = 'closed', 0, None
+
+    def use(*chunks, error=None):
+        def stream(*args):
+            yield from chunks
+            if error:
+                raise error
+        monkeypatch.setattr(ai_service, 'stream_command_groq', stream)
+    return use
+
+
+def _events(text):
+    return list(ai_service.parse_command_stream(text, {}, []))
+
+
+def test_provider_failure_after_output_ends_with_one_result(groq_only):
+    groq_only('{"intent": "add_product", "response_text": "Adding the ', error=ConnectionError('reset'))
+    events = _events('stream failure after output')
+
+    assert [kind for kind, _ in events] == ['intent', 'text', 'result']
+    assert events[0] == ('intent', 'add_product')
+    assert events[-1][1]['intent'] == 'unknown'
+
+
+def test_invalid_response_after_output_ends_with_one_result(groq_only):
+    groq_only('{"intent": "navigation", "response_text": "Opening"', ' and then nonsense')
+    events = _events('stream invalid json after output')
+
+    assert [kind for kind, _ in events].count('intent') == 1
+    assert events[-1][0] == 'result' and events[-1][1]['intent'] == 'unknown'
+    assert [kind for kind, _ in events[:-1]] == ['intent', 'text']
+
+
+def test_failure_before_output_is_answered_in_one_piece(groq_only):
+    groq_only(error=ConnectionError('refused'))
+    events = _events('stream failure before output')
+
+    assert [kind for kind, _ in events][0] == 'intent'
+    assert events[-1][0] == 'result'
+    assert [kind for kind, _ in events].count('intent') == 1
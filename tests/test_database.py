@@ -0,0 +1,78 @@
+import pytest
+
+import database
+from database import ConnectionPool, connection_scope, get_db_connection
+
+
+class FakeRaw:
+    def __init__(self):
+        self.calls = []
+        self.in_transaction = False
+
+    def cursor(self):
+        self.in_transaction = True
+        return self
+
+    def execute(self, query, params=None):
+        self.calls.append(query)
+
+    def commit(self):
+        self.calls.append('COMMIT')
+        self.in_transaction = False
+
+    def rollback(self):
+        self.calls.append('ROLLBACK')
+        self.in_transaction = False
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def raw(monkeypatch):
+    raw = FakeRaw()
+    monkeypatch.setattr(database, '_pool', ConnectionPool(lambda: raw, size=1, max_overflow=0))
+    return raw
+
+
+def _helper_that_swallows_its_error():
+    """Query-helper pattern: write, fail, roll back and report failure"""
+    conn = get_db_connection()
+    try:
+        conn.cursor().execute('INSERT half')
+        raise ValueError('second statement failed')
+    except ValueError:
+        conn.rollback()
+        return False
+    finally:
+        conn.close()
+
+
+def test_helper_rollback_inside_scope_rolls_the_scope_back(raw):
+    with connection_scope() as conn:
+        conn.cursor().execute('INSERT first')
+        assert _helper_that_swallows_its_error() is False
+
+    assert raw.calls == ['INSERT first', 'INSERT half', 'ROLLBACK']
+
+
+def test_error_caught_from_nested_scope_rolls_the_outer_scope_back(raw):
+    with connection_scope():
+        with pytest.raises(ValueError):
+            with connection_scope() as conn:
+                conn.cursor().execute('INSERT nested')
+                raise ValueError('boom')
+
+    assert raw.calls == ['INSERT nested', 'ROLLBACK']
+
+
+def test_clean_scope_commits_and_next_scope_starts_fresh(raw):
+    with connection_scope():
+        _helper_that_swallows_its_error()
+    with connection_scope() as conn:
+        conn.cursor().execute('INSERT next')
+
+    assert raw.calls[-2:] == ['INSERT next', 'COMMIT']
@@ -0,0 +1,69 @@
+import pytest
+from sqlalchemy import delete, insert, update
+
+from entity_resolver import EntityIndex, normalize_name, resolve_invoice_entities, resolver, transliterate
+from extensions import db
+from models import Product, SellerStats
+
+
+@pytest.mark.parametrize('text, latin', [
+    ('राहुल', 'rahul'),
+    ('दूध', 'dudh'),
+    ('पनीर', 'panir'),
+    ('शर्मा', 'sharma'),
+    ('ज़रा', 'zara'),
+    ('Milk', 'Milk'),
+])
+def test_transliterate(text, latin):
+    assert transliterate(text) == latin
+
+
+@pytest.mark.parametrize('spoken, stored', [
+    ('राहुल', 'Rahul'),
+    ('doodh', 'Dudh'),
+    ('Café', 'cafe'),
+    ('Rahul  Sharma!', 'rahul sharma'),
+    ('paneer', 'पनीर'),
+])
+def test_spellings_fold_together(spoken, stored):
+    assert normalize_name(spoken) == normalize_name(stored)
+
+
+def test_index_resolves_close_names_and_declines_ties():
+    index = EntityIndex([('P1', 'Amul Milk'), ('P2', 'Brown Bread'), ('C1', 'Rahul Sharma'), ('C2', 'Rahul Verma')])
+    assert index.resolve('amul milk').entity_id == 'P1'
+    assert index.resolve('brwn bread').entity_id == 'P2'
+    assert index.resolve('राहुल शर्मा').entity_id == 'C1'
+    # "milk" matches part of "Amul Milk": enough on its own
+    assert index.resolve('milk').entity_id == 'P1'
+    # Equally close to both customers
+    assert index.resolve('rahul') is None
+    assert index.resolve('chocolate') is None
+
+
+def _bump_version(seller_id):
+    table = SellerStats.__table__
+    with db.engine.begin() as conn:
+        conn.execute(update(table).where(table.c.s_id == seller_id).values(version=table.c.version + 1))
+
+
+def test_writes_from_another_worker_are_seen_on_the_next_lookup(app, seller_id):
+    product = Product.__table__
+    with app.app_context():
+        assert resolver.resolve(seller_id, 'product', 'Zebra Biscuits') is None
+
+        # Another worker adds the product: no ORM events in this process, only the version moves
+        with db.engine.begin() as conn:
+            conn.execute(insert(product).values(p_id='T-ZEBRA', p_name='Zebra Biscuits', p_price=5, p_stock=0,
+                                                s_id=seller_id))
+        _bump_version(seller_id)
+        data = resolve_invoice_entities(seller_id, {'items': [{'product_name': 'zebra biscuit'}]})
+        assert data['items'][0]['product_id'] == 'T-ZEBRA'
+        assert data['items'][0]['is_new_product'] is False
+
+        with db.engine.begin() as conn:
+            conn.execute(delete(product).where(product.c.p_id == 'T-ZEBRA'))
+        _bump_version(seller_id)
+        data = resolve_invoice_entities(seller_id, {'items': [{'product_name': 'zebra biscuit'}]})
+        assert 'product_id' not in data['items'][0]
+        assert data['items'][0]['is_new_product'] is True
@@ -0,0 +1,110 @@
+import re
+
+import pytest
+
+from ai_service import NAV_TARGETS, match_nav_target, route_heuristically
+
+STATS = {'revenue': 1250.0, 'invoices_count': 4, 'customers_count': 3, 'products_count': 5,
+         'low_stock': [{'name': 'Milk', 'stock': 2}], 'top_selling': [{'name': 'Bread', 'quantity': 9}],
+         'recent_invoices': []}
+
+NAVIGATION = [
+    ('en-IN', 'Go to dashboard', 'dashboard'),
+    ('en-IN', 'please show invoices', 'invoices'),
+    ('en-IN', 'create an invoice', 'create_invoice'),
+    ('en-IN', 'log out', 'logout'),
+    ('hi-IN', 'डैशबोर्ड पर जाओ', 'dashboard'),
+    ('hi-IN', 'उत्पाद सूची दिखाओ', 'products'),
+    ('hi-IN', 'नया इनवॉइस', 'create_invoice'),
+    ('fr-FR', 'aller aux clients', 'customers'),
+    ('fr-FR', 'afficher les analyses', 'analytics'),
+    ('fr-FR', 'créer une facture', 'create_invoice'),
+    ('es-ES', 'ir a facturas', 'invoices'),
+    ('es-ES', 'inventario de productos', 'products'),
+    ('es-ES', 'cerrar sesión', 'logout'),
+    ('de-DE', 'gehe zu kunden', 'customers'),
+    ('de-DE', 'neue rechnung', 'create_invoice'),
+    ('de-DE', 'analysen anzeigen', 'analytics'),
+    ('ja-JP', 'ダッシュボードへ移動', 'dashboard'),
+    ('ja-JP', '請求書一覧を開いて', 'invoices'),
+    ('ja-JP', 'ログアウト', 'logout'),
+]
+
+INSIGHTS = [
+    ('en-IN', 'how is the business doing', 'Your top-performing product is Bread'),
+    ('hi-IN', 'बिजनेस कैसा चल रहा है', 'Bread'),
+    ('fr-FR', 'comment vont les affaires', 'Votre produit le plus vendu est Bread'),
+    ('es-ES', '¿cómo va el negocio?', 'Su producto más vendido es Bread'),
+    ('de-DE', 'wie läuft das geschäft', 'Ihr meistverkauftes Produkt ist Bread'),
+    ('ja-JP', '業績はどう？', '最も売れている商品はBreadです'),
+]
+
+GREETINGS = [
+    ('en-IN', 'Hello', 'How can I help'),
+    ('hi-IN', 'नमस्ते', 'नमस्ते!'),
+    ('fr-FR', 'bonjour', 'Bonjour !'),
+    ('es-ES', 'hola', '¡Hola!'),
+    ('de-DE', 'hallo', 'Hallo!'),
+    ('ja-JP', 'konnichiwa', 'こんにちは'),
+]
+
+
+@pytest.mark.parametrize('language, text, target', NAVIGATION)
+def test_navigation(language, text, target):
+    result = route_heuristically(text, {'stats': STATS}, language)
+    assert result['intent'] == 'navigation'
+    assert result['data'] == {'target': target}
+    assert result['response_text']
+
+
+@pytest.mark.parametrize('language, text, expected', INSIGHTS)
+def test_insights(language, text, expected):
+    result = route_heuristically(text, {'stats': STATS}, language)
+    assert result['intent'] == 'business_insights'
+    assert expected in result['response_text']
+
+
+@pytest.mark.parametrize('language, text, expected', GREETINGS)
+def test_greetings(language, text, expected):
+    result = route_heuristically(text, {'stats': STATS}, language)
+    assert result['intent'] == 'unknown'
+    assert expected in result['response_text']
+
+
+def test_first_target_in_table_order_wins():
+    # Named earlier in NAV_TARGETS, mentioned later in the text
+    assert match_nav_target('show invoices or go to dashboard') == 'dashboard'
+    assert match_nav_target('show invoices then log out') == 'invoices'
+
+
+@pytest.mark.parametrize('text', ['new invoices page', 'create invoices page', 'show new invoices list please'])
+def test_longer_phrase_does_not_hide_an_earlier_target(text):
+    # "new invoice(s)" belongs to create_invoice, but "invoices" inside it names an earlier target
+    assert match_nav_target(text) == 'invoices'
+
+
+def _first_target_with_any_phrase(text_lower):
+    for target, phrases in NAV_TARGETS.items():
+        if any(phrase.lower() in text_lower for phrase in phrases):
+            return target
+    return None
+
+
+def test_matches_a_plain_substring_check_in_table_order():
+    phrases = [phrase.lower() for target_phrases in NAV_TARGETS.values() for phrase in target_phrases]
+    texts = [f'{first} {second}' for first in phrases for second in phrases[::7]]
+    texts += [re.sub(r'\s+', '', text) for text in texts[::5]]
+    for text in texts:
+        assert match_nav_target(text) == _first_target_with_any_phrase(text), text
+
+
+def test_every_phrase_routes_to_its_own_target():
+    for target, phrases in NAV_TARGETS.items():
+        for phrase in phrases:
+            found = match_nav_target(phrase.lower())
+            # Only an earlier target may claim a phrase (its phrase occurs inside this one)
+            assert list(NAV_TARGETS).index(found) <= list(NAV_TARGETS).index(target), (phrase, found)
+
+
+def test_unrelated_text_has_no_target():
+    assert match_nav_target('add 3 milk for rahul') is None
@@ -0,0 +1,60 @@
+import re
+
+from sqlalchemy import event
+
+from extensions import db
+from models import Customer, Invoice, InvoiceItem, Product
+
+
+def _create_invoice(client, customer_id, p_id, quantity):
+    return client.post('/seller/invoices/create', data={
+        'customer_id': customer_id, 'tax': '0', 'product_1_id': p_id, 'quantity_1': str(quantity)})
+
+
+def _statements_during(callable_):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        callable_()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return statements
+
+
+def test_view_shows_the_invoiced_name_and_price_without_reading_products(app, seller_client, seller_id,
+                                                                         make_products):
+    (p_id,) = make_products(10)
+    with app.app_context():
+        customer_id = Customer.query.filter_by(s_id=seller_id).first().c_id
+        _create_invoice(seller_client, customer_id, p_id, 2)
+        invoice_no = Invoice.query.join(InvoiceItem).filter(InvoiceItem.p_id == p_id).one().invoice_no
+        product = db.session.get(Product, p_id)
+        product.p_name, product.p_price = 'Renamed product', 99
+        db.session.commit()
+
+        responses = []
+        statements = _statements_during(lambda: responses.append(seller_client.get(f'/invoice/{invoice_no}')))
+
+    page = responses[0].get_data(as_text=True)
+    assert f'Test product {p_id}' in page and 'Renamed product' not in page
+    assert '₹10.00' in page and '₹99.00' not in page
+    assert not [s for s in statements if re.search(r'\b(FROM|JOIN) product\b', s)]
+
+
+def test_product_swap_takes_the_new_name(app, seller_client, seller_id, make_products):
+    first, second = make_products(5, 5)
+    with app.app_context():
+        customer_id = Customer.query.filter_by(s_id=seller_id).first().c_id
+        _create_invoice(seller_client, customer_id, first, 1)
+        item = InvoiceItem.query.filter_by(p_id=first).one()
+        invoice_no, item_id = item.invoice_no, item.item_id
+
+    seller_client.post(f'/seller/invoices/edit/{invoice_no}', data={
+        'status': 'pending', 'tax': '0', f'product_{item_id}': second})
+
+    with app.app_context():
+        assert db.session.get(InvoiceItem, item_id).p_name == f'Test product {second}'
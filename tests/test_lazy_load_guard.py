@@ -0,0 +1,50 @@
+import pytest
+from flask import g, render_template_string
+
+from extensions import db
+from models import Invoice
+
+SELLER_PAGES = [
+    '/seller',
+    '/seller/products',
+    '/seller/products?q=mouse',
+    '/seller/customers',
+    '/seller/customers?q=priya',
+    '/seller/invoices',
+    '/seller/invoices?status=paid&q=INV',
+    '/seller/invoices/export',
+    '/seller/customers/DC001/invoices',
+    '/seller/customer-analytics',
+    '/seller/invoices/create',
+    '/seller/invoices/edit/INV-2025-001',
+    '/seller/products/edit/DP001',
+    '/invoice/INV-2024-001',
+]
+
+
+def test_guard_is_on(app):
+    assert app.config['LAZY_LOAD_GUARD']
+
+
+@pytest.mark.parametrize('url', SELLER_PAGES)
+def test_seller_pages_render_without_lazy_loads(seller_client, url):
+    response = seller_client.get(url)
+    assert response.status_code == 200, url
+
+
+def test_guard_rejects_a_lazy_load_in_a_template(app):
+    from app import LazyLoadInTemplateError
+
+    with app.test_request_context():
+        invoice = db.session.get(Invoice, 'INV-2024-001')
+        with pytest.raises(LazyLoadInTemplateError):
+            render_template_string('{{ invoice.customer.c_name }}', invoice=invoice)
+
+
+def test_failed_render_does_not_leave_the_guard_armed(app):
+    with app.test_request_context():
+        with pytest.raises(ZeroDivisionError):
+            render_template_string('{{ 1 // 0 }}')
+        assert g._rendering_template == 0
+        invoice = db.session.get(Invoice, 'INV-2024-001')
+        assert invoice.customer is not None
@@ -0,0 +1,36 @@
+from datetime import date, timedelta
+
+from extensions import db
+from models import Invoice, Seller, SellerStats
+from stats import STATS_COUNT_FIELDS, get_seller_stats, record_invoice_change
+
+
+def _rollup_counts(seller_id):
+    row = db.session.get(SellerStats, seller_id)
+    db.session.refresh(row)
+    return {field: getattr(row, field) for field in STATS_COUNT_FIELDS}
+
+
+def test_sweep_overdue_force_keeps_rollup_in_step(app):
+    runner = app.test_cli_runner()
+    with app.app_context():
+        seller_id = Seller.query.filter_by(s_email='demo@invoiceai.com').one().s_id
+        past_due = date.today() - timedelta(days=3)
+        for number in range(3):
+            invoice = Invoice(invoice_no=f'SWEEP-{number}', due_date=past_due, status='pending',
+                              amount=10, s_id=seller_id)
+            db.session.add(invoice)
+            record_invoice_change(seller_id, new=('pending', 10))
+        db.session.commit()
+
+        first = runner.invoke(args=['sweep-overdue', '--force'])
+        assert first.exit_code == 0, first.output
+        assert 'invoice(s) marked overdue' in first.output
+        assert {invoice.status for invoice in Invoice.query.filter(Invoice.invoice_no.like('SWEEP-%'))} == {'overdue'}
+        expected = {field: get_seller_stats(seller_id)[field] for field in STATS_COUNT_FIELDS}
+        assert _rollup_counts(seller_id) == expected
+
+        # Without --force the daily claim is already taken; with it the sweep runs and finds nothing
+        assert 'already ran today' in runner.invoke(args=['sweep-overdue']).output
+        assert 'Overdue sweep: 0 invoice(s)' in runner.invoke(args=['sweep-overdue', '--force']).output
+        assert _rollup_counts(seller_id) == expected
@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+from provider_router import CircuitBreaker, ProvidersFailed, get_health, stream_with_failover
+
+
+def _half_open(name):
+    """Health for a fresh provider whose breaker is open and due for a probe"""
+    health = get_health(name)
+    health.breaker.state = 'open'
+    health.breaker.opened_at = time.monotonic() - health.breaker.reset_timeout
+    return health
+
+
+def test_disconnect_after_output_resolves_the_probe():
+    health = _half_open('stream-disconnect')
+    stream = stream_with_failover({'stream-disconnect': lambda: iter(['one', 'two', 'three'])})
+    assert next(stream) == 'one'
+    stream.close()  # client went away: GeneratorExit at the yield
+    assert health.breaker.state == 'closed'
+    assert health.breaker.allow()
+
+
+def test_interrupted_probe_without_output_is_released():
+    health = _half_open('stream-interrupted')
+
+    def interrupted():
+        raise KeyboardInterrupt
+        yield  # pragma: no cover
+
+    with pytest.raises(KeyboardInterrupt):
+        list(stream_with_failover({'stream-interrupted': interrupted}))
+    assert health.breaker.state == 'open'
+    assert health.breaker.allow()
+
+
+def test_failure_before_output_fails_over():
+    def broken():
+        raise RuntimeError('down')
+        yield  # pragma: no cover
+
+    chunks = list(stream_with_failover({'stream-broken': broken, 'stream-ok': lambda: iter(['hi'])}))
+    assert chunks == ['hi']
+    assert get_health('stream-broken').failures == 1
+
+
+def test_failure_after_output_raises():
+    def cut_off():
+        yield 'partial'
+        raise RuntimeError('connection reset')
+
+    with pytest.raises(ProvidersFailed):
+        list(stream_with_failover({'stream-cut': cut_off}))
+
+
+def test_stream_timing_stays_out_of_the_ranking_histogram():
+    health = get_health('stream-timed')
+    list(stream_with_failover({'stream-timed': lambda: iter(['a', 'b'])}))
+    assert health.latency.count == 0
+    assert health.stream_latency.count == 1
+
+
+def test_release_only_affects_a_half_open_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.release()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.allow() and breaker.state == 'half_open'
+    breaker.release()
+    assert breaker.state == 'open' and breaker.allow()
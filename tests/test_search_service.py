@@ -0,0 +1,33 @@
+from sqlalchemy import text
+
+from extensions import db
+from models import Product, Seller
+from search_service import search
+
+
+def _seller_id():
+    return Seller.query.filter_by(s_email='demo@invoiceai.com').one().s_id
+
+
+def _names(seller_id, q):
+    return sorted(product.p_name for product in search(seller_id, 'product', q))
+
+
+def test_results_survive_vacuum(app):
+    with app.app_context():
+        seller_id = _seller_id()
+        for number, name in enumerate(['Quokka Gap', 'Quokka Kept', 'Quokka Moved']):
+            db.session.add(Product(p_id=f'FTS-{number}', p_name=name, p_price=1, s_id=seller_id))
+        db.session.commit()
+        # A hole in the rowids; VACUUM is allowed to renumber rows of tables with string keys
+        db.session.delete(db.session.get(Product, 'FTS-0'))
+        db.session.commit()
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            conn.execute(text('VACUUM'))
+
+        assert _names(seller_id, 'quokka') == ['Quokka Kept', 'Quokka Moved']
+        db.session.get(Product, 'FTS-2').p_name = 'Wallaby Moved'
+        db.session.commit()
+        assert _names(seller_id, 'quokka') == ['Quokka Kept']
+        assert _names(seller_id, 'wallaby') == ['Wallaby Moved']
+
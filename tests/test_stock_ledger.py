@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, update
+
+from extensions import db
+from models import Customer, Invoice, InvoiceItem, Product, StockMovement
+from stock_ledger import compact_ledger, stock_at, verify_ledger
+from stock_service import COMPACTED, CORRECTION, OPENING
+
+
+def _balances(*p_ids):
+    """[(p_stock, ledger sum)] per product"""
+    return [(db.session.get(Product, p_id).p_stock,
+             db.session.query(func.coalesce(func.sum(StockMovement.delta), 0)).filter_by(p_id=p_id).scalar())
+            for p_id in p_ids]
+
+
+def test_every_write_path_keeps_stock_equal_to_the_ledger(app, seller_client, seller_id, make_products):
+    first, second = make_products(6, 4)
+    with app.app_context():
+        assert StockMovement.query.filter_by(p_id=first, reason=OPENING).one().delta == 6
+        customer_id = Customer.query.filter_by(s_id=seller_id).first().c_id
+
+    seller_client.post('/seller/invoices/create', data={
+        'customer_id': customer_id, 'tax': '0', 'product_1_id': first, 'quantity_1': '2'})
+    with app.app_context():
+        invoice = Invoice.query.join(InvoiceItem).filter(InvoiceItem.p_id == first).one()
+        invoice_no, item_id = invoice.invoice_no, invoice.items[0].item_id
+    seller_client.post(f'/seller/invoices/edit/{invoice_no}', data={
+        'status': 'pending', 'tax': '0', f'quantity_{item_id}': '3',
+        'new_product_1_id': second, 'new_quantity_1': '1'})
+    seller_client.post(f'/seller/invoices/edit/{invoice_no}', data={'status': 'cancelled', 'tax': '0'})
+    seller_client.post(f'/seller/products/edit/{first}', data={
+        'name': 'Ledger product', 'price': '10', 'description': '', 'stock': '9'})
+
+    with app.app_context():
+        assert _balances(first, second) == [(9, 9), (4, 4)]
+        assert StockMovement.query.filter_by(invoice_no=invoice_no).count() == 3
+
+
+def test_compaction_keeps_point_in_time_reads_exact_after_the_horizon(app, make_products):
+    (p_id,) = make_products(0)
+    now = datetime(2030, 6, 1, 12)
+    history = [(40, 10), (35, -3), (20, 5), (5, -2)]
+    with app.app_context():
+        db.session.execute(insert(StockMovement), [
+            {'p_id': p_id, 'delta': delta, 'reason': 'adjustment', 'timestamp': now - timedelta(days=days)}
+            for days, delta in history
+        ])
+        db.session.execute(update(Product).where(Product.p_id == p_id).values(p_stock=10))
+        db.session.commit()
+        moments = [now - timedelta(days=days) for days in (20, 12, 5, 1)]
+        before = [stock_at([p_id], moment)[p_id] for moment in moments]
+
+        assert compact_ledger(keep_days=10, now=now) >= 2
+        db.session.expire_all()
+        assert [stock_at([p_id], moment)[p_id] for moment in moments] == before == [12, 12, 10, 10]
+        rows = StockMovement.query.filter_by(p_id=p_id).order_by(StockMovement.timestamp).all()
+        assert [(row.reason, row.delta) for row in rows] == [(COMPACTED, 12), ('adjustment', -2)]
+        assert _balances(p_id) == [(10, 10)]
+
+
+def test_repair_records_the_difference_as_a_correction(app, make_products):
+    (p_id,) = make_products(5)
+    with app.app_context():
+        # A write that bypassed stock_service
+        db.session.execute(update(Product).where(Product.p_id == p_id).values(p_stock=8))
+        db.session.commit()
+
+        assert (p_id, 8, 5) in verify_ledger(repair=True)
+        assert StockMovement.query.filter_by(p_id=p_id, reason=CORRECTION).one().delta == 3
+        assert all(row[0] != p_id for row in verify_ledger())
+        assert _balances(p_id) == [(8, 8)]
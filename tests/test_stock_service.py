@@ -0,0 +1,76 @@
+from extensions import db
+from models import Customer, Invoice, InvoiceItem, Product
+from stock_service import adjust_stock
+
+
+def _stock(*p_ids):
+    return [db.session.get(Product, p_id).p_stock for p_id in p_ids]
+
+
+def _customer_id(seller_id):
+    return Customer.query.filter_by(s_id=seller_id).first().c_id
+
+
+def _create_invoice(client, customer_id, *lines):
+    form = {'customer_id': customer_id, 'tax': '0'}
+    for index, (p_id, quantity) in enumerate(lines, 1):
+        form[f'product_{index}_id'] = p_id
+        form[f'quantity_{index}'] = str(quantity)
+    return client.post('/seller/invoices/create', data=form)
+
+
+def _invoice_with(p_id):
+    return Invoice.query.join(InvoiceItem).filter(InvoiceItem.p_id == p_id).one()
+
+
+def test_oversell_across_two_lines_of_one_product_changes_nothing(app, seller_client, seller_id, make_products):
+    (milk,) = make_products(5)
+    with app.app_context():
+        customer_id = _customer_id(seller_id)
+        invoices = Invoice.query.count()
+
+    _create_invoice(seller_client, customer_id, (milk, 3), (milk, 3))
+
+    with app.app_context():
+        assert _stock(milk) == [5]
+        assert Invoice.query.count() == invoices
+        assert InvoiceItem.query.filter_by(p_id=milk).count() == 0
+
+
+def test_shortages_are_reported_per_product(app, make_products):
+    short, also_short, enough = make_products(1, 2, 10)
+    with app.app_context():
+        shortages = adjust_stock({short: -3, also_short: -5, enough: -4}, 'invoice')
+        db.session.commit()
+        assert {s.p_id: (s.requested, s.available) for s in shortages} == {short: (3, 1), also_short: (5, 2)}
+        assert _stock(short, also_short, enough) == [1, 2, 10]
+
+
+def test_edit_that_swaps_product_and_quantity_applies_the_net_change(app, seller_client, seller_id, make_products):
+    first, second = make_products(5, 5)
+    with app.app_context():
+        _create_invoice(seller_client, _customer_id(seller_id), (first, 2))
+        invoice = _invoice_with(first)
+        invoice_no, item_id = invoice.invoice_no, invoice.items[0].item_id
+        assert _stock(first, second) == [3, 5]
+
+    seller_client.post(f'/seller/invoices/edit/{invoice_no}', data={
+        'status': 'pending', 'tax': '0', f'quantity_{item_id}': '4', f'product_{item_id}': second})
+
+    with app.app_context():
+        assert _stock(first, second) == [5, 1]
+        assert [(item.p_id, item.item_quantity) for item in db.session.get(Invoice, invoice_no).items] == [(second, 4)]
+
+
+def test_cancelling_restores_stock(app, seller_client, seller_id, make_products):
+    first, second = make_products(5, 8)
+    with app.app_context():
+        _create_invoice(seller_client, _customer_id(seller_id), (first, 2), (second, 3))
+        invoice_no = _invoice_with(first).invoice_no
+        assert _stock(first, second) == [3, 5]
+
+    seller_client.post(f'/seller/invoices/edit/{invoice_no}', data={'status': 'cancelled', 'tax': '0'})
+
+    with app.app_context():
+        assert db.session.get(Invoice, invoice_no).status == 'cancelled'
+        assert _stock(first, second) == [5, 8]